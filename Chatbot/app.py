@@ -1,20 +1,31 @@
 import os
 import re
 import sys
+import json
 from io import StringIO
 from pathlib import Path
 from dotenv import load_dotenv
 import pandas as pd
 import numpy as np
 import google.generativeai as genai
-from flask import Flask, render_template, request, jsonify, session
+from flask import Flask, render_template, request, jsonify, session, url_for, Response, stream_with_context
 import openpyxl
 from openpyxl import Workbook
 import ast  # <<< para literal_eval seguro
 
+# módulos compartilhados com o app principal (raiz do projeto)
+_ROOT_DIR = str(Path(__file__).resolve().parent.parent)
+if _ROOT_DIR not in sys.path:
+    sys.path.insert(0, _ROOT_DIR)
+from dados_utils import ler_workbook, ler_workbooks, file_signature, arquivo_ignorado, DataWatcher
+from agente_utils import (ClienteGemini, ClienteStub, JobExecutor, FilaCheia, CodeCache, schema_fingerprint,
+                          cartao_esquema, janela_historico)
+
 # >>> Upload
 from werkzeug.datastructures import FileStorage
 import uuid
+import threading
+import atexit
 
 # =========================
 # Estado global / Paths
@@ -30,24 +41,68 @@ app.secret_key = os.urandom(24)
 app.config['MAX_CONTENT_LENGTH'] = 20 * 1024 * 1024
 
 dataframe_completo: pd.DataFrame | None = None
+# Quando montado no app principal, os dados vêm do repositório compartilhado (dados_utils.DataRepository)
+REPOSITORIO = None
+# DataFrames anotados por arquivo: {caminho: (assinatura, [DF por aba])}; só arquivos alterados são relidos
+_FRAMES_POR_ARQUIVO: dict = {}
+_FRAMES_LOCK = threading.Lock()
+# Modo isolado: observador da pasta de dados (iniciado com a primeira carga);
+# montado no app_final, quem observa a pasta é o app principal
+WATCHER: DataWatcher | None = None
+_WATCHER_LOCK = threading.Lock()
 MODELO_GEMINI: genai.GenerativeModel | None = None
+# Cliente do modelo usado pelo agente (agente_utils.ClienteLLM); trocável por configurar_cliente_llm
+CLIENTE_LLM = None
 STATUS_DADOS = "CARREGANDO..."
 
+# Perguntas ao agente rodam em segundo plano (limite de concorrência e de fila);
+# /chat devolve o ID do job e a resposta é consultada por polling ou SSE
+JOBS_AGENTE = JobExecutor()
+AGENT_SYNC_TIMEOUT_S = float(os.environ.get("AGENT_SYNC_TIMEOUT_S", "120"))
+
+# Código pandas já validado, por pergunta normalizada + esquema do DataFrame:
+# um acerto pula a primeira chamada ao modelo e vai direto ao exec
+CACHE_CODIGO = CodeCache(os.environ.get("AGENT_CODE_CACHE_PATH", str(DATA_PATH / "_cache" / "codigo_agente.db")))
+# Código que chama ferramentas com efeito colateral não é reaproveitado
+_FERRAMENTAS_COM_EFEITO = re.compile(r"\b(create_project|reload_data)\b")
+
+# Resumo do DataFrame para o prompt do agente (no lugar de df.head()/df.dtypes),
+# refeito só quando os dados mudam: (geração, DataFrame do modo isolado, texto)
+_CARTAO_ESQUEMA: tuple = (None, None, "")
+DOMINIOS_ESQUEMA = {
+    "condição": ["condicao", "Condição"],
+    "fase": ["fase", "Fase"],
+    "categoria": ["categoria", "Categoria"],
+    "classificação": ["classificacao", "Classificação"],
+    "status": ["status"],
+}
+
 # =========================
-# Config Gemini
+# Config LLM (Gemini; CHATBOT_LLM=stub usa um cliente local, sem rede)
 # =========================
+CHATBOT_LLM = os.environ.get("CHATBOT_LLM", "gemini").lower()
 try:
-    load_dotenv(dotenv_path=BASE_DIR / '.env')
-    api_key = os.getenv("GOOGLE_API_KEY")
-    if not api_key:
-        raise ValueError("Chave da API do Google não encontrada no .env")
-    genai.configure(api_key=api_key)
-    MODELO_GEMINI = genai.GenerativeModel('gemini-2.5-flash')
-    print("API e Modelo do Gemini configurados com sucesso.")
+    if CHATBOT_LLM == "stub":
+        CLIENTE_LLM = ClienteStub()
+        print("Chatbot usando o cliente LLM local (stub).")
+    else:
+        load_dotenv(dotenv_path=BASE_DIR / '.env')
+        api_key = os.getenv("GOOGLE_API_KEY")
+        if not api_key:
+            raise ValueError("Chave da API do Google não encontrada no .env")
+        genai.configure(api_key=api_key)
+        MODELO_GEMINI = genai.GenerativeModel('gemini-2.5-flash')
+        CLIENTE_LLM = ClienteGemini(MODELO_GEMINI)
+        print("API e Modelo do Gemini configurados com sucesso.")
 except Exception as e:
     print(f"Erro fatal ao configurar a API: {e}")
     sys.exit(1)
 
+def configurar_cliente_llm(cliente) -> None:
+    """Troca o cliente do modelo (ex.: agente_utils.ClienteStub nos testes)."""
+    global CLIENTE_LLM
+    CLIENTE_LLM = cliente
+
 # =========================
 # Filtro de linhas frágeis
 # =========================
@@ -85,6 +140,7 @@ def _sanitize_trace(raw: dict) -> dict:
         "codigo_gerado": codigo or "",
         "resultado_codigo": raw.get("resultado_codigo", "") or "",
         "resposta_final": raw.get("resposta_final", "") or "",
+        "cache_codigo": bool(raw.get("cache_codigo")),
     }
 
 # =========================
@@ -127,9 +183,12 @@ def list_projects() -> list:
 def reload_data() -> int:
     """
     Recarrega o DataFrame global a partir de root/data.
+    Com repositório compartilhado não há cópia local: só conta as linhas atuais.
     """
     global dataframe_completo
     try:
+        if REPOSITORIO is not None:
+            return len(REPOSITORIO.frame(view='chatbot'))
         df_new = carregar_dados_excel(DATA_PATH)
         dataframe_completo = df_new
         return 0 if (df_new is None or df_new.empty) else len(df_new)
@@ -137,10 +196,85 @@ def reload_data() -> int:
         print(f"Erro ao recarregar dados: {e}")
         return 0
 
+def atualizar_arquivo(evento: str, path: str) -> None:
+    """
+    Assinante do WATCHER (modo isolado): um .xlsx foi criado/alterado/removido.
+    Relê só esse arquivo (os demais vêm de _FRAMES_POR_ARQUIVO) e troca o
+    DataFrame global numa única atribuição, fora do caminho das requisições.
+    """
+    global dataframe_completo, STATUS_DADOS
+    df_new = carregar_dados_excel(DATA_PATH)
+    dataframe_completo = df_new
+    STATUS_DADOS = "ONLINE" if (df_new is not None and not df_new.empty) else "ERRO: SEM DADOS"
+    print(f"Dados atualizados ({evento}: {Path(path).name}).")
+
+# =========================
+# Repositório compartilhado (app principal)
+# =========================
+# Nome canônico (app principal) → cabeçalho original do Excel (COLS_PADRAO)
+_CABECALHOS_EXCEL = dict(zip(
+    ['numero', 'classificacao', 'categoria', 'fase', 'condicao',
+     'nome', 'duracao', 'como_fazer', 'documento_referencia', 'porcentagem'],
+    COLS_PADRAO))
+
+def visao_chatbot(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Adapta o DataFrame canônico do app principal às convenções do Chatbot:
+    'Projeto' → 'fonte_do_arquivo' (nome do .xlsx), 'Sheet' → 'aba_do_projeto',
+    'documento_auxiliar' (URL do hyperlink) → 'url_referencia'. Os cabeçalhos
+    originais do Excel ('Nome', 'Condição', '% Concluída', ...) são repetidos
+    como cópias das colunas canônicas, como no DataFrame do modo isolado: as
+    regras do prompt do agente citam as duas formas.
+    """
+    df = df.drop(columns=['fase_key'], errors='ignore').rename(
+        columns={'Sheet': 'aba_do_projeto', 'documento_auxiliar': 'url_referencia'})
+    df = df.assign(**{original: df[canonica] for canonica, original in _CABECALHOS_EXCEL.items()
+                      if canonica in df.columns and original not in df.columns})
+    if 'Projeto' in df.columns:
+        df['fonte_do_arquivo'] = df.pop('Projeto').astype(str) + '.xlsx'
+    if 'url_referencia' in df.columns:
+        df['url_referencia'] = df['url_referencia'].replace('', np.nan)
+    return df
+
+def configurar_repositorio(repo) -> None:
+    """
+    Liga o Chatbot ao repositório do app principal (injeção feita pelo app_final):
+    as perguntas passam a usar os mesmos DataFrames em cache e a mesma geração
+    de dados, e a cópia local (dataframe_completo) é descartada.
+    """
+    global REPOSITORIO, dataframe_completo, STATUS_DADOS, WATCHER
+    repo.register_view('chatbot', visao_chatbot)
+    REPOSITORIO = repo
+    with _WATCHER_LOCK:
+        if WATCHER is not None:
+            WATCHER.stop()
+            WATCHER = None
+    dataframe_completo = None
+    with _FRAMES_LOCK:
+        _FRAMES_POR_ARQUIVO.clear()
+    STATUS_DADOS = "ONLINE"
+
+def _dados_atuais():
+    """(DataFrame para o agente, geração dos dados ou None no modo isolado)."""
+    if REPOSITORIO is not None:
+        return REPOSITORIO.frame(view='chatbot'), REPOSITORIO.generation()
+    return dataframe_completo, None
+
 # >>> helper para validar extensão
 def _allowed_xlsx(filename: str) -> bool:
     return str(filename).lower().endswith(".xlsx")
 
+def _iniciar_watcher() -> None:
+    """Modo isolado: liga o observador da pasta de dados (idempotente)."""
+    global WATCHER
+    with _WATCHER_LOCK:
+        if WATCHER is not None or REPOSITORIO is not None:
+            return
+        WATCHER = DataWatcher(str(DATA_PATH))
+        WATCHER.subscribe(atualizar_arquivo)
+        WATCHER.start()
+        atexit.register(WATCHER.stop)
+
 # =========================
 # Carregamento de dados (Excel + hyperlinks)
 # =========================
@@ -148,7 +282,7 @@ def _allowed_xlsx(filename: str) -> bool:
 def load_data_once():
     global dataframe_completo, STATUS_DADOS
 
-    if dataframe_completo is None:
+    if dataframe_completo is None and REPOSITORIO is None:
         print("Iniciando carregamento de dados (primeira requisição)...")
         STATUS_DADOS = "ANALISANDO DADOS..."
         try:
@@ -162,6 +296,43 @@ def load_data_once():
         except Exception as e:
             STATUS_DADOS = "ERRO NO SERVIDOR"
             print(f"Erro crítico ao carregar dados: {e}")
+        # depois da carga inicial, alterações na pasta são relidas em segundo plano
+        _iniciar_watcher()
+
+def _ler_arquivo_excel(arquivo: Path, abas=None) -> list:
+    """
+    DataFrames (um por aba) de UM .xlsx, anotados com origem e 'url_referencia'.
+    `abas`: resultado de ler_workbook já obtido (ex.: leitura paralela).
+    """
+    frames = []
+    # Valores e hyperlinks numa única leitura do workbook
+    for nome_da_aba, df_aba, links in (abas if abas is not None else ler_workbook(str(arquivo))):
+        # Normalização para localizar "Documento Referência" em variações
+        possiveis = (
+            "documento referência",
+            "documento_referência",
+            "documento referencia",
+            "documento_referencia",
+        )
+        header_lower = {}
+        for pos, col in enumerate(df_aba.columns):
+            header_lower.setdefault(str(col).strip().lower(), pos)
+        col_key = None
+        for probe in possiveis:
+            if probe in header_lower:
+                col_key = header_lower[probe]
+                break
+
+        # i=0 corresponde à primeira linha de dados do DF (Excel linha 2)
+        links_map = links.get(col_key, {}) if col_key is not None else {}
+
+        # Anotações úteis
+        df_aba['fonte_do_arquivo'] = arquivo.name
+        df_aba['aba_do_projeto'] = nome_da_aba
+        df_aba['url_referencia'] = df_aba.index.map(links_map)
+
+        frames.append(df_aba)
+    return frames
 
 def carregar_dados_excel(pasta_dados: Path) -> pd.DataFrame | None:
     """
@@ -182,61 +353,30 @@ def carregar_dados_excel(pasta_dados: Path) -> pd.DataFrame | None:
     lista_de_dataframes = []
     print("Carregando arquivos Excel e extraindo links...")
 
-    for arquivo in arquivos_excel:
-        try:
-            # Pandas lê valores
-            dicionario_de_abas_pd = pd.read_excel(arquivo, sheet_name=None, engine='openpyxl')
-            # openpyxl lê metadados (hyperlinks)
-            wb = openpyxl.load_workbook(arquivo, data_only=True)
-
-            for nome_da_aba, df_aba in dicionario_de_abas_pd.items():
-                if nome_da_aba not in wb.sheetnames:
-                    continue
-
-                ws = wb[nome_da_aba]
-
-                # Mapeia cabeçalhos -> índice numérico da coluna
-                header_map = {}
-                for cell in ws[1]:
-                    key = str(cell.value).strip() if cell.value is not None else ""
-                    if key:
-                        header_map[key] = cell.col_idx  # inteiro correto
-
-                # Normalização para localizar "Documento Referência" em variações
-                header_lower = {str(k).lower(): v for k, v in header_map.items()}
-                possiveis = (
-                    "documento referência",
-                    "documento_referência",
-                    "documento referencia",
-                    "documento_referencia",
-                )
-                col_key = None
-                for probe in possiveis:
-                    if probe in header_lower:
-                        col_key = header_lower[probe]
-                        break
-
-                links_map = {}
-                if col_key is not None:
-                    # i=0 corresponde à primeira linha de dados do DF (Excel linha 2)
-                    for i, row in enumerate(ws.iter_rows(min_row=2, max_row=ws.max_row,
-                                                         min_col=col_key, max_col=col_key)):
-                        cell = row[0]
-                        if cell.hyperlink:
-                            links_map[i] = cell.hyperlink.target
-
-                # Anotações úteis
-                df_aba['fonte_do_arquivo'] = arquivo.name
-                df_aba['aba_do_projeto'] = nome_da_aba
-                df_aba['url_referencia'] = df_aba.index.map(links_map)
-
-                lista_de_dataframes.append(df_aba)
-
-            wb.close()
+    with _FRAMES_LOCK:
+        arquivos_excel = [a for a in arquivos_excel if not arquivo_ignorado(str(a))]
+        vistos = {str(a.resolve()) for a in arquivos_excel}
+        # arquivos novos/alterados são lidos juntos (em processos, se PARALLEL_LOAD_ENABLED)
+        a_ler = [k for k in vistos
+                 if k not in _FRAMES_POR_ARQUIVO or _FRAMES_POR_ARQUIVO[k][0] != file_signature(k)]
+        lidos = ler_workbooks(a_ler) if len(a_ler) > 1 else {}
+        for arquivo in arquivos_excel:
+            chave = str(arquivo.resolve())
+            cache = _FRAMES_POR_ARQUIVO.get(chave)
+            if chave not in a_ler and cache is not None:
+                lista_de_dataframes.extend(cache[1])
+                continue
+            sig, abas = lidos.get(chave, (file_signature(chave), None))
+            try:
+                frames = _ler_arquivo_excel(arquivo, abas)
+            except Exception as e:
+                print(f"  - ERRO ao ler o arquivo {arquivo.name}: {e}")
+                continue
+            _FRAMES_POR_ARQUIVO[chave] = (sig, frames)
+            lista_de_dataframes.extend(frames)
             print(f"  - Arquivo '{arquivo.name}' lido e links processados.")
-
-        except Exception as e:
-            print(f"  - ERRO ao ler o arquivo {arquivo.name}: {e}")
+        for chave in [k for k in _FRAMES_POR_ARQUIVO if k not in vistos]:
+            del _FRAMES_POR_ARQUIVO[chave]
 
     if not lista_de_dataframes:
         print("Nenhum dataframe foi carregado.")
@@ -250,26 +390,49 @@ def carregar_dados_excel(pasta_dados: Path) -> pd.DataFrame | None:
 # =========================
 # Agente
 # =========================
+def _cartao_esquema(df: pd.DataFrame, geracao=None) -> str:
+    """
+    Cartão do esquema de `df`, reaproveitado enquanto os dados não mudam: mesma
+    geração (repositório compartilhado, que monta um DataFrame novo a cada
+    consulta) ou o mesmo objeto DataFrame (modo isolado, trocado a cada recarga).
+    """
+    global _CARTAO_ESQUEMA
+    geracao_atual, df_atual, texto = _CARTAO_ESQUEMA
+    if (geracao is not None and geracao == geracao_atual) or (geracao is None and df is df_atual):
+        return texto
+    texto = cartao_esquema(df, DOMINIOS_ESQUEMA, agrupar_por='fonte_do_arquivo')
+    _CARTAO_ESQUEMA = (geracao, df if geracao is None else None, texto)
+    return texto
+
 def executar_agente(df: pd.DataFrame, pergunta: str, historico: list) -> str:
-    global MODELO_GEMINI, ULTIMO_TRACE
-    if MODELO_GEMINI is None:
-        return "Erro: O modelo de IA não foi inicializado."
+    global ULTIMO_TRACE
+    resposta, ULTIMO_TRACE = _executar_agente(df, pergunta, historico)
+    return resposta
+
+def _executar_agente(df: pd.DataFrame, pergunta: str, historico: list, usar_cache: bool = True,
+                     geracao=None) -> tuple:
+    """
+    (resposta, trace) da pergunta; não usa estado global, pode rodar em paralelo nos jobs.
+    Com o código da pergunta em CACHE_CODIGO, só a resposta final passa pelo modelo.
+    """
+    cliente = CLIENTE_LLM
+    if cliente is None:
+        return "Erro: O modelo de IA não foi inicializado.", {}
 
-    amostra_df = df.head().to_string()
-    tipos_de_dados = df.dtypes.to_string()
+    esquema = _cartao_esquema(df, geracao)
+    # a pergunta atual já é a última mensagem da sessão
+    anteriores = historico[:-1] if historico and historico[-1].get("content") == pergunta else historico
+    historico_txt = janela_historico(anteriores) or "(sem mensagens anteriores)"
 
     prompt_agente = f"""
         Você é um assistente de análise de dados Python Sênior.
         Você tem acesso a um DataFrame do Pandas chamado `df`.
 
-        A estrutura do DataFrame (as primeiras 5 linhas) é a seguinte:
-        {amostra_df}
+        Resumo do DataFrame (colunas, tipos, exemplos e valores possíveis):
+        {esquema}
 
-        Os tipos de dados (dtypes) das colunas são:
-        {tipos_de_dados}
-
-        Histórico da conversa anterior (para contexto):
-        {historico}
+        Histórico recente da conversa (para contexto):
+        {historico_txt}
 
         Tarefa: Responda à pergunta do usuário: "{pergunta}"
 
@@ -357,30 +520,47 @@ def executar_agente(df: pd.DataFrame, pergunta: str, historico: list) -> str:
         )
         return code
 
+    fingerprint = schema_fingerprint(df)
+    codigo_cache = CACHE_CODIGO.get(pergunta, fingerprint) if usar_cache else None
+    texto_inicial = None
+
     try:
-        resposta_inicial = MODELO_GEMINI.generate_content(prompt_agente)
-        bloco_codigo = re.search(r"```python\n(.*?)```", resposta_inicial.text, re.DOTALL)
+        if codigo_cache is not None:
+            codigo_gerado = codigo_cache
+            print(f"--- Código do cache ---\n{codigo_gerado}\n---------------------")
+        else:
+            texto_inicial = cliente.gerar(prompt_agente)
+            bloco_codigo = re.search(r"```python\n(.*?)```", texto_inicial, re.DOTALL)
 
-        if not bloco_codigo:
-            ULTIMO_TRACE = {
+        if codigo_cache is None and not bloco_codigo:
+            trace = {
                 "prompt_agente": prompt_agente,
                 "bloco_codigo": None,
                 "codigo_gerado": None,
                 "resultado_codigo": None,
                 "prompt_final": None,
                 "resposta_final": None,
-                "raw_primeira_resposta": resposta_inicial.text.strip(),
+                "raw_primeira_resposta": texto_inicial.strip(),
             }
-            return resposta_inicial.text.replace("<STOP>", "").strip()
+            return texto_inicial.replace("<STOP>", "").strip(), trace
 
-        codigo_gerado = bloco_codigo.group(1).strip()
-        codigo_gerado = _remove_redundant_imports(codigo_gerado)
+        if codigo_cache is None:
+            codigo_gerado = bloco_codigo.group(1).strip()
+            codigo_gerado = _remove_redundant_imports(codigo_gerado)
 
-        print(f"--- Código Gerado (sanitizado) ---\n{codigo_gerado}\n---------------------")
+            print(f"--- Código Gerado (sanitizado) ---\n{codigo_gerado}\n---------------------")
+
+        # Saída do código gerado: print próprio por execução (sys.stdout é global e
+        # vários jobs podem executar ao mesmo tempo)
+        redirected_output = StringIO()
+
+        def _print(*args, **kwargs):
+            kwargs["file"] = redirected_output
+            print(*args, **kwargs)
 
         # Ambiente seguro para exec
         safe_builtins = {
-            "print": print, "len": len, "range": range, "min": min, "max": max,
+            "print": _print, "len": len, "range": range, "min": min, "max": max,
             "sum": sum, "abs": abs, "round": round, "sorted": sorted,
             "str": str, "int": int, "float": float, "list": list, "dict": dict, "set": set,
             "any": any, "all": all, "enumerate": enumerate, "zip": zip,
@@ -413,12 +593,11 @@ def executar_agente(df: pd.DataFrame, pergunta: str, historico: list) -> str:
             else:
                 raise
 
-        old_stdout = sys.stdout
-        redirected_output = sys.stdout = StringIO()
         exec(code_obj, safe_globals, {})
-        sys.stdout = old_stdout
         resultado_codigo = redirected_output.getvalue().strip()
         print(f"--- Resultado do Código ---\n{resultado_codigo}\n-------------------------")
+        if codigo_cache is None and resultado_codigo and not _FERRAMENTAS_COM_EFEITO.search(codigo_gerado):
+            CACHE_CODIGO.put(pergunta, fingerprint, codigo_gerado)
 
         prompt_final = f"""
             Você é um assistente de dados amigável.
@@ -428,25 +607,30 @@ def executar_agente(df: pd.DataFrame, pergunta: str, historico: list) -> str:
 
             Com base *apenas* neste resultado, formule uma resposta clara e concisa em português.
             """
-        resposta_final = MODELO_GEMINI.generate_content(prompt_final)
-        resposta_txt = _filter_fragile_lines(resposta_final.text.strip())
+        resposta_txt = _filter_fragile_lines(cliente.gerar(prompt_final).strip())
         print(f"--- Resposta Final ---\n{resposta_txt}\n----------------------")
 
-        ULTIMO_TRACE = {
+        trace = {
             "prompt_agente": prompt_agente,
             "bloco_codigo": "```python\n" + codigo_gerado + "\n```",
             "codigo_gerado": codigo_gerado,
             "resultado_codigo": resultado_codigo,
             "prompt_final": prompt_final,
             "resposta_final": resposta_txt,
-            "raw_primeira_resposta": resposta_inicial.text.strip(),
+            "raw_primeira_resposta": texto_inicial.strip() if texto_inicial is not None else None,
+            "cache_codigo": codigo_cache is not None,
         }
 
-        return resposta_txt
+        return resposta_txt, trace
 
     except Exception as e:
+        if codigo_cache is not None:
+            # código guardado não serve mais (ex.: valores mudaram): descarta e pede de novo ao modelo
+            print(f"Código do cache falhou ({e}); gerando novamente...")
+            CACHE_CODIGO.discard(pergunta, fingerprint)
+            return _executar_agente(df, pergunta, historico, usar_cache=False, geracao=geracao)
         print(f"Erro no agente: {e}")
-        ULTIMO_TRACE = {
+        trace = {
             "prompt_agente": prompt_agente,
             "bloco_codigo": None,
             "codigo_gerado": None,
@@ -456,7 +640,17 @@ def executar_agente(df: pd.DataFrame, pergunta: str, historico: list) -> str:
             "raw_primeira_resposta": None,
             "erro": str(e),
         }
-        return f"Desculpe, ocorreu um erro ao processar sua pergunta. Detalhes técnicos: {e}"
+        return f"Desculpe, ocorreu um erro ao processar sua pergunta. Detalhes técnicos: {e}", trace
+
+def _processar_pergunta(df: pd.DataFrame, pergunta: str, historico: list, geracao) -> dict:
+    """Job do agente: resposta + trace sanitizado, no formato devolvido por /chat."""
+    global ULTIMO_TRACE
+    resposta, trace = _executar_agente(df, pergunta, historico, geracao=geracao)
+    ULTIMO_TRACE = trace
+    payload = {"reply": resposta, "trace": _sanitize_trace(trace or {})}
+    if geracao is not None:
+        payload["geracao"] = geracao
+    return payload
 
 # =========================
 # Rotas
@@ -483,10 +677,43 @@ def _quer_debug(req) -> bool:
             return True
     return False
 
+def _quer_sincrono(data: dict) -> bool:
+    """Clientes antigos: ?async=0 ou {"async": false} esperam a resposta na própria requisição."""
+    if str(request.args.get("async", "")).lower() in ("0", "false", "no", "off"):
+        return True
+    return data.get("async") is False
+
+def _registrar_resposta(job_id: str, estado: dict | None) -> None:
+    """
+    Grava no histórico da sessão a resposta de um job pendente, quando ele
+    termina; enquanto está na fila/rodando, o job continua em 'jobs_pendentes'.
+    Job expirado sem ter sido consultado só sai da lista.
+    """
+    pendentes = list(session.get('jobs_pendentes') or [])
+    if job_id not in pendentes or (estado is not None and estado['status'] not in ('done', 'error')):
+        return
+    if estado is not None:
+        conteudo = (estado.get('result') or {}).get('reply') if estado['status'] == 'done' else \
+            f"Desculpe, ocorreu um erro ao processar sua pergunta. Detalhes técnicos: {estado.get('error')}"
+        session.setdefault('messages', []).append({"role": "assistant", "content": conteudo})
+    pendentes.remove(job_id)
+    session['jobs_pendentes'] = pendentes
+    session.modified = True
+
+def _resposta_job(estado: dict):
+    """(corpo, status HTTP) do job: 200 com a resposta, 202 enquanto roda, 500 se falhou."""
+    if estado['status'] == 'done':
+        return {"job_id": estado['id'], "status": "done", **(estado.get('result') or {})}, 200
+    if estado['status'] == 'error':
+        return {"job_id": estado['id'], "status": "error", "error": estado.get('error')}, 500
+    return {"job_id": estado['id'], "status": estado['status']}, 202
+
 @app.route('/chat', methods=['POST'])
 def chat():
-    global dataframe_completo, MODELO_GEMINI, ULTIMO_TRACE
-
+    """
+    Enfileira a pergunta no agente e responde 202 com o ID do job; o resultado
+    vem de GET /chat/<job_id> (polling) ou GET /chat/<job_id>/stream (SSE).
+    """
     try:
         data = request.get_json(force=True, silent=False) or {}
         user_message = (data.get('message') or '').strip()
@@ -495,27 +722,84 @@ def chat():
 
         if 'messages' not in session:
             session['messages'] = []
+        # respostas anteriores ainda não consultadas por polling (ex.: entregues por SSE,
+        # que não grava cookie) entram agora no histórico; as que ainda rodam continuam pendentes
+        for pendente in list(session.get('jobs_pendentes') or []):
+            _registrar_resposta(pendente, JOBS_AGENTE.get(pendente))
         session['messages'].append({"role": "user", "content": user_message})
 
-        if dataframe_completo is None or (hasattr(dataframe_completo, 'empty') and dataframe_completo.empty):
+        df, geracao = _dados_atuais()
+        if df is None or (hasattr(df, 'empty') and df.empty):
             raise ValueError("Os dados ainda não foram carregados. Aguarde.")
 
         historico_sessao = list(session['messages'])
-        bot_response = executar_agente(dataframe_completo, user_message, historico_sessao)
-
-        session['messages'].append({"role": "assistant", "content": bot_response})
+        try:
+            job_id = JOBS_AGENTE.submit(_processar_pergunta, df, user_message, historico_sessao, geracao)
+        except FilaCheia:
+            session['messages'].pop()
+            session.modified = True
+            resp = jsonify({"error": "Muitas perguntas em andamento. Tente novamente em instantes."})
+            resp.headers["Retry-After"] = "5"
+            return resp, 503
+        session['jobs_pendentes'] = list(session.get('jobs_pendentes') or []) + [job_id]
         session.modified = True
 
-        payload = {"reply": bot_response}
-        # Enviando sempre o trace para o painel da esquerda:
-        payload["trace"] = _sanitize_trace(ULTIMO_TRACE or {})
+        if _quer_sincrono(data):
+            estado = JOBS_AGENTE.wait(job_id, AGENT_SYNC_TIMEOUT_S)
+            _registrar_resposta(job_id, estado)
+            corpo, status = _resposta_job(estado)
+            return jsonify(corpo), status
 
-        return jsonify(payload)
+        return jsonify({
+            "job_id": job_id, "status": "queued",
+            "status_url": url_for('chat_status', job_id=job_id),
+            "stream_url": url_for('chat_stream', job_id=job_id),
+        }), 202
 
     except Exception as e:
         print(f"Erro na rota /chat: {e}")
         return jsonify({"error": str(e)}), 500
 
+@app.route('/chat/<job_id>', methods=['GET'])
+def chat_status(job_id):
+    estado = JOBS_AGENTE.get(job_id)
+    if estado is None:
+        return jsonify({"error": "Job não encontrado ou expirado."}), 404
+    _registrar_resposta(job_id, estado)
+    corpo, status = _resposta_job(estado)
+    return jsonify(corpo), status
+
+@app.route('/chat/<job_id>/stream', methods=['GET'])
+def chat_stream(job_id):
+    """Server-Sent Events: 'status' a cada mudança e 'resultado' ao terminar."""
+    if JOBS_AGENTE.get(job_id) is None:
+        return jsonify({"error": "Job não encontrado ou expirado."}), 404
+
+    def _eventos():
+        ultimo = None
+        while True:
+            estado = JOBS_AGENTE.wait(job_id, timeout=1.0)
+            if estado is None:
+                yield f"event: erro\ndata: {json.dumps({'error': 'Job expirado.'})}\n\n"
+                return
+            if estado['status'] != ultimo:
+                ultimo = estado['status']
+                yield f"event: status\ndata: {json.dumps({'job_id': job_id, 'status': ultimo})}\n\n"
+            if estado['status'] in ('done', 'error'):
+                corpo, _ = _resposta_job(estado)
+                yield f"event: resultado\ndata: {json.dumps(corpo, ensure_ascii=False, default=str)}\n\n"
+                return
+            yield ": aguardando\n\n"
+
+    return Response(stream_with_context(_eventos()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/api/agente/metricas', methods=['GET'])
+def api_metricas_agente():
+    """Fila do agente (jobs rodando, profundidade, rejeitados, tempos médios) e cache de código."""
+    return jsonify({"cliente": getattr(CLIENTE_LLM, 'nome', None), "jobs": JOBS_AGENTE.stats(),
+                    "cache_codigo": CACHE_CODIGO.stats()})
+
 # >>> APIs para listagem e upload de projetos (.xlsx)
 @app.route('/api/projetos', methods=['GET'])
 def api_listar_projetos():
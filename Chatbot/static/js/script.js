@@ -349,6 +349,16 @@ document.addEventListener("DOMContentLoaded", () => {
   }
 
   // ====== ENVIO DE MENSAGEM ======
+  // O /chat responde 202 com o job do agente; consulta o status até a resposta ficar pronta
+  async function aguardarResposta(statusUrl) {
+    while (true) {
+      await new Promise(r => setTimeout(r, 800));
+      const r = await fetch(statusUrl, { headers: { 'Accept': 'application/json' } });
+      const d = await r.json().catch(() => ({ error: `Erro ${r.status}` }));
+      if (r.status !== 202) return d;
+    }
+  }
+
   async function sendMessage() {
     const message = userInput.value.trim();
     if (!message || sendBtn.disabled) return;
@@ -385,7 +395,10 @@ document.addEventListener("DOMContentLoaded", () => {
         addMessage('assistant', `⚠️ Erro ${res.status}: não foi possível processar a resposta do servidor.`);
         console.error('Resposta não-JSON/erro:', res.status, txt);
       } else {
-        const data = await res.json();
+        let data = await res.json();
+        if (res.status === 202 && data?.status_url) {
+          data = await aguardarResposta(data.status_url);
+        }
         hideTyping();
         if (data?.error) {
           addMessage('assistant', `⚠️ Erro: ${data.error}`);
@@ -0,0 +1,436 @@
+"""
+Módulo de execução do agente LLM do Chatbot para o Challenge2025.
+
+Funções principais:
+- ClienteLLM: interface mínima de um modelo de linguagem (`gerar(prompt) -> str`)
+  - ClienteGemini: adapta um `genai.GenerativeModel`
+  - ClienteStub: respostas locais e determinísticas (testes / desenvolvimento sem chave)
+- JobExecutor: executor em segundo plano com limite de concorrência e de fila,
+  IDs de job, espera com timeout e métricas (profundidade da fila, tempos)
+- FilaCheia: levantada quando o limite de jobs pendentes é atingido
+- CodeCache: cache persistente (SQLite) do código pandas gerado pelo modelo,
+  por pergunta normalizada + impressão digital do esquema do DataFrame
+  - schema_fingerprint / normalizar_pergunta: componentes da chave
+- cartao_esquema: resumo compacto do DataFrame para o prompt (colunas, tipos,
+  exemplos, domínios de valores e contagens), no lugar de df.head()/df.dtypes
+- janela_historico: últimas mensagens da conversa dentro de um orçamento de tokens
+
+Uso no Chatbot/app.py:
+
+    from agente_utils import ClienteGemini, JobExecutor, FilaCheia
+
+    CLIENTE_LLM = ClienteGemini(genai.GenerativeModel('gemini-2.5-flash'))
+    JOBS = JobExecutor()
+
+    job_id = JOBS.submit(executar, df, pergunta)    # não bloqueia a requisição
+    estado = JOBS.get(job_id)                       # {'status': 'queued'|'running'|'done'|'error', ...}
+
+    CACHE_CODIGO = CodeCache('data/_cache/codigo_agente.db')
+    codigo = CACHE_CODIGO.get(pergunta, schema_fingerprint(df))   # None → pede ao modelo
+
+Os workers do servidor (waitress) ficam livres enquanto o modelo responde;
+só `max_workers` chamadas ao modelo rodam ao mesmo tempo.
+"""
+from __future__ import annotations
+
+import os
+import re
+import time
+import uuid
+import sqlite3
+import hashlib
+import logging
+import threading
+import unicodedata
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# ------------------------ Config ------------------------
+AGENT_MAX_WORKERS = int(os.environ.get("AGENT_MAX_WORKERS", "2"))
+AGENT_MAX_QUEUE = int(os.environ.get("AGENT_MAX_QUEUE", "16"))
+AGENT_JOB_TTL_S = float(os.environ.get("AGENT_JOB_TTL_S", "600"))
+AGENT_CODE_CACHE_ENABLED = os.environ.get("AGENT_CODE_CACHE_ENABLED", "true").lower() == "true"
+AGENT_CODE_CACHE_TTL_S = float(os.environ.get("AGENT_CODE_CACHE_TTL_S", str(7 * 24 * 3600)))
+AGENT_CODE_CACHE_MAX_ENTRIES = int(os.environ.get("AGENT_CODE_CACHE_MAX_ENTRIES", "500"))
+AGENT_HISTORY_MAX_MESSAGES = int(os.environ.get("AGENT_HISTORY_MAX_MESSAGES", "6"))
+AGENT_HISTORY_MAX_TOKENS = int(os.environ.get("AGENT_HISTORY_MAX_TOKENS", "600"))
+
+# ------------------------ Clientes LLM ------------------------
+
+class ClienteLLM:
+    """Interface: `gerar(prompt)` devolve o texto da resposta do modelo."""
+    nome = "base"
+
+    def gerar(self, prompt: str) -> str:  # pragma: no cover - interface
+        raise NotImplementedError
+
+
+class ClienteGemini(ClienteLLM):
+    nome = "gemini"
+
+    def __init__(self, modelo):
+        self.modelo = modelo
+
+    def gerar(self, prompt: str) -> str:
+        return self.modelo.generate_content(prompt).text
+
+
+class ClienteStub(ClienteLLM):
+    """
+    Cliente local, sem rede. `responder(prompt) -> str` define as respostas; o
+    padrão devolve um bloco de código que imprime o total de linhas de `df` (no
+    prompt do agente, que pede "<STOP>") e repete o resultado no prompt final.
+    """
+    nome = "stub"
+
+    def __init__(self, responder: Optional[Callable[[str], str]] = None, atraso_s: float = 0.0):
+        self.responder = responder or self._padrao
+        self.atraso_s = atraso_s
+        self.chamadas = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _padrao(prompt: str) -> str:
+        if "<STOP>" in prompt:
+            return "```python\nprint(f'Total de tarefas: {len(df)}')\n```\n<STOP>"
+        return "Resposta de teste. " + prompt.strip().splitlines()[-1].strip()
+
+    def gerar(self, prompt: str) -> str:
+        with self._lock:
+            self.chamadas += 1
+        if self.atraso_s:
+            time.sleep(self.atraso_s)
+        return self.responder(prompt)
+
+# ------------------------ Jobs ------------------------
+
+class FilaCheia(Exception):
+    """Limite de jobs pendentes (em execução + na fila) atingido."""
+
+
+class _Job:
+    __slots__ = ("id", "status", "result", "error", "criado", "inicio", "fim", "evento", "meta")
+
+    def __init__(self, meta: Optional[Dict[str, Any]] = None):
+        self.id = uuid.uuid4().hex
+        self.status = "queued"
+        self.result: Any = None
+        self.error: Optional[str] = None
+        self.criado = time.time()
+        self.inicio: Optional[float] = None
+        self.fim: Optional[float] = None
+        self.evento = threading.Event()
+        self.meta = dict(meta or {})
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {"id": self.id, "status": self.status, "result": self.result, "error": self.error,
+                "criado": self.criado, "inicio": self.inicio, "fim": self.fim, **self.meta}
+
+
+class JobExecutor:
+    """
+    Executa funções em `max_workers` threads, com no máximo `max_queue` jobs
+    esperando; além disso `submit` levanta FilaCheia (o cliente tenta depois).
+    Jobs concluídos ficam consultáveis por `ttl_s` segundos.
+    """
+
+    def __init__(self, max_workers: int = AGENT_MAX_WORKERS, max_queue: int = AGENT_MAX_QUEUE,
+                 ttl_s: float = AGENT_JOB_TTL_S):
+        self.max_workers = max(1, int(max_workers))
+        self.max_queue = max(0, int(max_queue))
+        self.ttl_s = ttl_s
+        self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="agente")
+        self._jobs: "OrderedDict[str, _Job]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._pendentes = 0
+        self._rodando = 0
+        self._stats = {"submitted": 0, "completed": 0, "failed": 0, "rejected": 0,
+                       "wait_ms_total": 0.0, "run_ms_total": 0.0}
+
+    def submit(self, fn: Callable[..., Any], *args, meta: Optional[Dict[str, Any]] = None, **kwargs) -> str:
+        """Enfileira `fn(*args, **kwargs)` e devolve o ID do job."""
+        job = _Job(meta)
+        with self._lock:
+            self._expirar()
+            if self._pendentes >= self.max_workers + self.max_queue:
+                self._stats["rejected"] += 1
+                raise FilaCheia(f"{self._pendentes} job(s) pendente(s)")
+            self._pendentes += 1
+            self._stats["submitted"] += 1
+            self._jobs[job.id] = job
+        self._pool.submit(self._executar, job, fn, args, kwargs)
+        return job.id
+
+    def _executar(self, job: _Job, fn, args, kwargs) -> None:
+        with self._lock:
+            job.status, job.inicio = "running", time.time()
+            self._rodando += 1
+        try:
+            resultado, erro, status = fn(*args, **kwargs), None, "done"
+        except Exception as e:
+            logger.exception("Job %s falhou", job.id)
+            resultado, erro, status = None, str(e), "error"
+        with self._lock:
+            job.result, job.error, job.status, job.fim = resultado, erro, status, time.time()
+            self._rodando -= 1
+            self._pendentes -= 1
+            self._stats["completed" if status == "done" else "failed"] += 1
+            self._stats["wait_ms_total"] += (job.inicio - job.criado) * 1000
+            self._stats["run_ms_total"] += (job.fim - job.inicio) * 1000
+        job.evento.set()
+
+    def _expirar(self) -> None:
+        limite = time.time() - self.ttl_s
+        for job_id in [j.id for j in self._jobs.values() if j.fim is not None and j.fim < limite]:
+            del self._jobs[job_id]
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return job.snapshot() if job is not None else None
+
+    def wait(self, job_id: str, timeout: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """Espera o job terminar (ou o timeout) e devolve o estado atual; None se não existir."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None:
+            return None
+        job.evento.wait(timeout)
+        return self.get(job_id)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            s = dict(self._stats)
+            s.update(max_workers=self.max_workers, max_queue=self.max_queue, running=self._rodando,
+                     queue_depth=self._pendentes - self._rodando, tracked=len(self._jobs))
+        terminados = s["completed"] + s["failed"] or 1
+        s["avg_wait_ms"] = round(s.pop("wait_ms_total") / terminados, 1)
+        s["avg_run_ms"] = round(s.pop("run_ms_total") / terminados, 1)
+        return s
+
+    def shutdown(self, wait: bool = False) -> None:
+        self._pool.shutdown(wait=wait)
+
+# ------------------------ Cache de código gerado ------------------------
+
+_ESQUEMA_CACHE = """
+CREATE TABLE IF NOT EXISTS codigo (
+    chave       TEXT PRIMARY KEY,
+    fingerprint TEXT NOT NULL,
+    pergunta    TEXT NOT NULL,
+    codigo      TEXT NOT NULL,
+    criado_em   REAL NOT NULL,
+    usado_em    REAL NOT NULL,
+    hits        INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS ix_codigo_usado ON codigo(usado_em);
+CREATE INDEX IF NOT EXISTS ix_codigo_fingerprint ON codigo(fingerprint);
+"""
+
+
+def normalizar_pergunta(pergunta: str) -> str:
+    """Minúsculas, sem acentos, pontuação e espaços repetidos: "Quantas tarefas críticas?" → "quantas tarefas criticas"."""
+    texto = unicodedata.normalize("NFKD", str(pergunta or ""))
+    texto = "".join(c for c in texto if not unicodedata.combining(c)).lower()
+    return " ".join(re.findall(r"\w+", texto))
+
+
+def schema_fingerprint(df) -> str:
+    """Hash das colunas (na ordem) e dos dtypes do DataFrame."""
+    partes = [f"{c}\x1f{t}" for c, t in zip(df.columns.astype(str), df.dtypes.astype(str))]
+    return hashlib.sha1("\x1e".join(partes).encode("utf-8")).hexdigest()
+
+
+class CodeCache:
+    """
+    Código pandas já validado (compilou, executou e imprimiu algo), por pergunta
+    normalizada + esquema do DataFrame. Persistente em SQLite: sobrevive a
+    reinícios e é compartilhado entre processos.
+
+    - TTL: entradas não usadas há mais de `ttl_s` segundos expiram.
+    - LRU: acima de `max_entries`, as menos usadas recentemente saem.
+    - Esquema novo: ao ver outra impressão digital, as entradas do esquema
+      anterior são descartadas (o código pode citar colunas que não existem mais).
+    """
+
+    def __init__(self, path: str, ttl_s: float = AGENT_CODE_CACHE_TTL_S,
+                 max_entries: int = AGENT_CODE_CACHE_MAX_ENTRIES, enabled: bool = AGENT_CODE_CACHE_ENABLED):
+        self.path = path
+        self.ttl_s = ttl_s
+        self.max_entries = max(1, int(max_entries))
+        self.enabled = enabled
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._fingerprint: Optional[str] = None
+        self._stats = {"hits": 0, "misses": 0, "stores": 0, "invalidated": 0, "evicted": 0}
+        if self.enabled:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self._con().executescript(_ESQUEMA_CACHE)
+
+    def _con(self) -> sqlite3.Connection:
+        con = getattr(self._local, "con", None)
+        if con is None:
+            con = sqlite3.connect(self.path, timeout=5.0, isolation_level=None, check_same_thread=False)
+            con.execute("PRAGMA journal_mode=WAL")
+            con.execute("PRAGMA synchronous=NORMAL")
+            self._local.con = con
+        return con
+
+    @staticmethod
+    def _chave(pergunta_norm: str, fingerprint: str) -> str:
+        return hashlib.sha1(f"{fingerprint}\x1e{pergunta_norm}".encode("utf-8")).hexdigest()
+
+    def _contar(self, chave: str, n: int = 1) -> None:
+        with self._lock:
+            self._stats[chave] += n
+
+    def _verificar_esquema(self, fingerprint: str) -> None:
+        if fingerprint == self._fingerprint:
+            return
+        n = self._con().execute("DELETE FROM codigo WHERE fingerprint <> ?", (fingerprint,)).rowcount
+        self._fingerprint = fingerprint
+        if n:
+            self._contar("invalidated", n)
+            logger.info("Cache de código: %d entrada(s) de outro esquema descartada(s)", n)
+
+    def get(self, pergunta: str, fingerprint: str) -> Optional[str]:
+        """Código guardado para a pergunta neste esquema, ou None."""
+        if not self.enabled:
+            return None
+        self._verificar_esquema(fingerprint)
+        chave, agora = self._chave(normalizar_pergunta(pergunta), fingerprint), time.time()
+        con = self._con()
+        row = con.execute("SELECT codigo, usado_em FROM codigo WHERE chave = ?", (chave,)).fetchone()
+        if row is not None and agora - row[1] > self.ttl_s:
+            con.execute("DELETE FROM codigo WHERE chave = ?", (chave,))
+            self._contar("evicted")
+            row = None
+        if row is None:
+            self._contar("misses")
+            return None
+        con.execute("UPDATE codigo SET usado_em = ?, hits = hits + 1 WHERE chave = ?", (agora, chave))
+        self._contar("hits")
+        return row[0]
+
+    def put(self, pergunta: str, fingerprint: str, codigo: str) -> None:
+        if not self.enabled:
+            return
+        self._verificar_esquema(fingerprint)
+        pergunta_norm, agora = normalizar_pergunta(pergunta), time.time()
+        con = self._con()
+        con.execute("BEGIN IMMEDIATE")
+        try:
+            con.execute(
+                "INSERT INTO codigo (chave, fingerprint, pergunta, codigo, criado_em, usado_em) "
+                "VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT(chave) DO UPDATE SET "
+                "codigo = excluded.codigo, criado_em = excluded.criado_em, usado_em = excluded.usado_em",
+                (self._chave(pergunta_norm, fingerprint), fingerprint, pergunta_norm, codigo, agora, agora))
+            removidas = con.execute("DELETE FROM codigo WHERE usado_em < ?", (agora - self.ttl_s,)).rowcount
+            removidas += con.execute(
+                "DELETE FROM codigo WHERE chave IN (SELECT chave FROM codigo ORDER BY usado_em DESC "
+                "LIMIT -1 OFFSET ?)", (self.max_entries,)).rowcount
+        except BaseException:
+            con.execute("ROLLBACK")
+            raise
+        con.execute("COMMIT")
+        self._contar("stores")
+        if removidas:
+            self._contar("evicted", removidas)
+
+    def discard(self, pergunta: str, fingerprint: str) -> None:
+        """Remove a entrada (ex.: o código guardado falhou ao executar)."""
+        if self.enabled:
+            self._con().execute("DELETE FROM codigo WHERE chave = ?",
+                                (self._chave(normalizar_pergunta(pergunta), fingerprint),))
+
+    def clear(self) -> None:
+        if self.enabled:
+            self._con().execute("DELETE FROM codigo")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            s = dict(self._stats)
+        consultas = s["hits"] + s["misses"]
+        s.update(enabled=self.enabled, max_entries=self.max_entries, ttl_s=self.ttl_s,
+                 hit_rate=round(s["hits"] / consultas, 3) if consultas else 0.0,
+                 entries=self._con().execute("SELECT COUNT(*) FROM codigo").fetchone()[0] if self.enabled else 0)
+        return s
+
+# ------------------------ Contexto do prompt ------------------------
+
+def estimar_tokens(texto: str) -> int:
+    """Estimativa grosseira (~4 caracteres por token), suficiente para orçamento."""
+    return (len(texto) + 3) // 4
+
+
+def _curto(valor: Any, limite: int = 40) -> str:
+    texto = " ".join(str(valor).split())
+    return texto if len(texto) <= limite else texto[:limite - 1] + "…"
+
+
+def cartao_esquema(df, dominios: Optional[Dict[str, List[str]]] = None, agrupar_por: Optional[str] = None,
+                   max_valores: int = 15) -> str:
+    """
+    Texto compacto descrevendo `df` para o modelo:
+    - total de linhas e, com `agrupar_por`, linhas por valor dessa coluna;
+    - uma linha por coluna com dados: nome, dtype, nº de valores preenchidos e um exemplo;
+    - `dominios` {rótulo: [colunas]}: valores distintos (com contagem), linha a
+      linha o da primeira coluna preenchida (colunas equivalentes, ex. 'condicao'
+      e 'Condição', não contam a mesma linha duas vezes), até `max_valores` por domínio.
+    Colunas inteiramente vazias são omitidas.
+    """
+    linhas = [f"Total de linhas: {len(df)}"]
+    if agrupar_por and agrupar_por in df.columns:
+        contagem = df[agrupar_por].value_counts(dropna=True)
+        linhas.append(f"Linhas por {agrupar_por}: " + "; ".join(f"{_curto(v, 80)} ({n})" for v, n in contagem.items()))
+
+    linhas.append("Colunas (nome | tipo | preenchidas | exemplo):")
+    preenchidas = df.notna().sum()
+    for col, tipo in df.dtypes.items():
+        n = int(preenchidas[col])
+        if not n:
+            continue
+        exemplo = df[col].loc[df[col].first_valid_index()]
+        exemplo = repr(_curto(exemplo)) if isinstance(exemplo, str) else _curto(exemplo)
+        linhas.append(f"- {col} | {tipo} | {n} | {exemplo}")
+
+    for rotulo, colunas in (dominios or {}).items():
+        presentes = [c for c in colunas if c in df.columns]
+        if not presentes:
+            continue
+        valores = df[presentes[0]]
+        for c in presentes[1:]:
+            valores = valores.combine_first(df[c])
+        valores = valores.dropna().astype(str).str.strip()
+        contagem = valores[valores != ""].value_counts()
+        resto = len(contagem) - max_valores
+        texto = "; ".join(f"{_curto(v)} ({n})" for v, n in contagem.head(max_valores).items())
+        linhas.append(f"Valores de {rotulo} ({' / '.join(presentes)}): {texto}" + (f"; … +{resto}" if resto > 0 else ""))
+    return "\n".join(linhas)
+
+
+def janela_historico(mensagens: List[Dict[str, Any]], max_mensagens: int = AGENT_HISTORY_MAX_MESSAGES,
+                     max_tokens: int = AGENT_HISTORY_MAX_TOKENS) -> str:
+    """
+    As últimas `max_mensagens` mensagens ({'role', 'content'}), da mais recente
+    para trás enquanto couberem em `max_tokens`; a mais antiga que não couber
+    inteira é cortada no início. Devolve texto "Usuário: ... / Assistente: ...".
+    """
+    rotulos = {"user": "Usuário", "assistant": "Assistente"}
+    partes: List[str] = []
+    restante = max_tokens
+    for msg in reversed(mensagens[-max_mensagens:] if max_mensagens > 0 else []):
+        linha = f"{rotulos.get(msg.get('role'), msg.get('role'))}: {' '.join(str(msg.get('content', '')).split())}"
+        custo = estimar_tokens(linha)
+        if custo > restante:
+            if restante >= 16:
+                partes.append("…" + linha[-(restante * 4 - 1):])
+            break
+        partes.append(linha)
+        restante -= custo
+    return "\n".join(reversed(partes))
@@ -4,7 +4,7 @@
 # IMPORTS
 # -----------------------------------------------------------------------------
 from werkzeug.security import check_password_hash, generate_password_hash
-from functools import wraps
+from functools import wraps, lru_cache
 import os
 import re
 import csv
@@ -18,12 +18,25 @@ from flask_cors import CORS
 from openpyxl import load_workbook
 import re, logging, glob, datetime
 import json
+import atexit
+import threading
+import base64
+import hashlib
 import numpy as np
 import uuid
 from seguranca_utils import (
     audit_log, rotate_backups, ensure_columns, assign_uuids,
-    validate_row, find_row, set_runtime_refs, mutating, restore_task_from_audit, ValidationError
+    validate_row, find_row, set_runtime_refs, mutating, restore_task_from_audit, ValidationError,
+    stable_task_uuid, TaskIndex, ProjectLocator,
 )
+from dados_utils import (ProjectCache, DataGenerations, DataRepository, DataWatcher, SnapshotStore, ResponseMemo,
+                         ler_workbook, ler_workbooks, abas_workbook, abas_workbooks, file_signature,
+                         arquivo_ignorado)
+from escrita_utils import apply_task_ops, MutationJournal, ProjectLocks, save_workbook_atomic
+from resposta_utils import records_json, ndjson_blocos, json_response, limpar
+from compressao_utils import ResponseCompressor
+from armazenamento_utils import SqliteTaskStore
+from busca_utils import BM25Index
 # --- Helpers para respostas JSON-safe (NaN -> None) -----------------------
 import math
 
@@ -31,7 +44,7 @@ app = Flask(__name__, template_folder='templates', static_folder='static')
 CORS(app)
 
 from werkzeug.middleware.dispatcher import DispatcherMiddleware
-from Chatbot.app import app as chatbot_app  # requer Chatbot/__init__.py
+from Chatbot.app import app as chatbot_app, configurar_repositorio  # requer Chatbot/__init__.py
 
 app.wsgi_app = DispatcherMiddleware(app.wsgi_app, {
     '/chatbot': chatbot_app,
@@ -42,23 +55,7 @@ app.wsgi_app = DispatcherMiddleware(app.wsgi_app, {
 
 def _json_safe(value):
     """Converte NaN/NaT em None recursivamente em dict/list."""
-    if isinstance(value, dict):
-        return {k: _json_safe(v) for k, v in value.items()}
-    if isinstance(value, list):
-        return [_json_safe(v) for v in value]
-    try:
-        # pandas / float NaN
-        if value is None:
-            return None
-        if isinstance(value, float) and math.isnan(value):
-            return None
-        # pandas NA/NaT
-        import pandas as _pd
-        if _pd.isna(value):
-            return None
-    except Exception:
-        pass
-    return value
+    return limpar(value)
 
 
 
@@ -134,30 +131,324 @@ def _rename_cols(df):
     df = df.rename(columns=rename)
     return df
 
+_COLS_BASE = [
+    'numero','fase','nome','categoria','duracao','condicao',
+    'concluida','porcentagem','Sheet','Projeto',
+    'classificacao','como_fazer','documento_referencia',
+    # --- ETAPA 2 ---
+    'em_curso',              # 0/1
+    'em_curso_by',           # e-mail do dono atual
+    'inicio_em',             # timestamp início
+    'colaboradores',         # csv ou json
+    'relatorio_progresso',   # texto livre
+    'responsavel_conclusao', # já usado no concluir
+    'data_conclusao',        # idem
+    'status'                 # Ex.: Em curso / Concluída
+]
+_COLS_BASE_NUM = ('numero','duracao','concluida','porcentagem','em_curso')
+
 def _garantir_cols(df):
-    base = [
-        'numero','fase','nome','categoria','duracao','condicao',
-        'concluida','porcentagem','Sheet','Projeto',
-        'classificacao','como_fazer','documento_referencia',
-        # --- ETAPA 2 ---
-        'em_curso',              # 0/1
-        'em_curso_by',           # e-mail do dono atual
-        'inicio_em',             # timestamp início
-        'colaboradores',         # csv ou json
-        'relatorio_progresso',   # texto livre
-        'responsavel_conclusao', # já usado no concluir
-        'data_conclusao',        # idem
-        'status'                 # Ex.: Em curso / Concluída
-    ]
-    for c in base:
+    for c in _COLS_BASE:
         if c not in df.columns:
-            if c in ('numero','duracao','concluida','porcentagem','em_curso'):
+            if c in _COLS_BASE_NUM:
                 df[c] = 0
             else:
                 df[c] = ''
     return df
 
 # --------- Carregador principal ---------
+# Backend das tarefas: "xlsx" (padrão; as planilhas em data/ são o dado vivo) ou
+# "sqlite" (data/tarefas.db em WAL; os .xlsx servem só de importação e o
+# /exportar-projeto regenera a planilha a partir do banco)
+STORAGE_BACKEND = os.environ.get("STORAGE_BACKEND", "xlsx").lower()
+ARMAZENAMENTO = (SqliteTaskStore(os.environ.get("STORAGE_SQLITE_PATH", os.path.join(DATA_DIR, 'tarefas.db')))
+                 if STORAGE_BACKEND == 'sqlite' else None)
+
+# No backend SQLite o "caminho" de um projeto é 'sqlite:<nome>'
+_SQLITE_REF = 'sqlite:'
+
+def _assinatura(path):
+    """Assinatura do projeto: mtime/size/inode do .xlsx ou (geração, id, 0) no SQLite."""
+    if path.startswith(_SQLITE_REF):
+        return ARMAZENAMENTO.signature(path[len(_SQLITE_REF):])
+    return file_signature(path)
+
+# Cache por projeto (invalidado por mtime/size/inode do .xlsx ou pela geração no SQLite)
+CACHE_PROJETOS = ProjectCache(signature=_assinatura)
+
+# Espelho colunar do DF normalizado de cada projeto (cargas frias sem abrir o .xlsx).
+# Incrementar _SNAPSHOT_VERSAO quando a normalização de _carregar_projeto mudar.
+_SNAPSHOT_VERSAO = 1
+SNAPSHOTS = SnapshotStore(os.path.join(DATA_DIR, '_snapshots'), versao=_SNAPSHOT_VERSAO)
+
+# Mutações confirmadas mas ainda não gravadas no .xlsx (write-behind)
+JOURNAL = MutationJournal(os.path.join(DATA_DIR, '_journal', 'mutations.jsonl'))
+
+# (Sheet, número) → projetos, para requisições que não informam o projeto
+LOCALIZADOR = ProjectLocator()
+
+# Geração por projeto (muda a cada alteração do arquivo ou mutação no journal) → ETag
+GERACOES = DataGenerations()
+
+# Um lock por projeto para ler → alterar → gravar (FILE_LOCKS_ENABLED=true trava também entre processos)
+LOCKS = ProjectLocks(os.path.join(DATA_DIR, '_locks'))
+
+# Compressão gzip/brotli negociada por Accept-Encoding (xlsx já é zip e não é recomprimido);
+# o export é baixado uma vez e compensa o nível mais alto
+COMPRESSAO = ResponseCompressor(rotas={'exportar_projeto': {'level': 9, 'br_quality': 9}})
+
+# Observa data/*.xlsx e relê em segundo plano o projeto criado/alterado (cache compartilhado com o Chatbot)
+WATCHER = DataWatcher(DATA_DIR)
+
+_COLS_VAZIO = [
+    'numero','fase','nome','categoria','duracao','condicao',
+    'concluida','porcentagem','Sheet','Projeto',
+    'classificacao','como_fazer','documento_referencia',
+    'texto_auxiliar','documento_auxiliar'
+]
+
+def _norm_header(s: str) -> str:
+    s = str(s or '').strip()
+    s = ''.join(ch for ch in unicodedata.normalize('NFKD', s) if not unicodedata.combining(ch))
+    s = re.sub(r'\s+', ' ', s)
+    return s.lower()
+
+@lru_cache(maxsize=4096)
+def _fase_key(s: str) -> str:
+    """Chave de comparação da fase: sem acento/caixa; "1. Escopo & Briefing" → "1"."""
+    s = str(s or '').lower()
+    s = ''.join(ch for ch in unicodedata.normalize('NFKD', s) if not unicodedata.combining(ch))
+    s = re.sub(r'[^a-z0-9]+', ' ', s).strip()
+    m = re.match(r'^(\d+)', s)
+    return m.group(1) if m else s
+
+# nomes possíveis (sem acento) para localizar a coluna no cabeçalho do Excel
+_DOCREF_HEADERS_NORM = {
+    _norm_header('Documento Referência'),
+    _norm_header('Documento Referencia'),
+    _norm_header('Documento'),
+    _norm_header('Doc Referência'),
+    _norm_header('Doc Referencia'),
+}
+
+def _carregar_projeto(path, abas=None):
+    """
+    Lê e normaliza UM arquivo .xlsx (todas as abas) → DataFrame ou None.
+    É o que fica guardado no CACHE_PROJETOS.
+    `abas`: resultado de ler_workbook já obtido (ex.: leitura paralela).
+    """
+    nome_proj = os.path.splitext(os.path.basename(path))[0]
+    all_dfs = []
+    try:
+        # 1) Lê valores + hyperlinks numa única passada pelo workbook
+        for aba, df, links in (abas if abas is not None else ler_workbook(path)):
+            if df is None or df.empty:
+                continue
+
+            # Captura colunas de hyperlink desta ABA
+            texto_aux_list = []
+            link_aux_list  = []
+
+            try:
+                # encontra a(s) coluna(s) candidata(s) a "Documento Referência" (1ª linha = cabeçalho)
+                cand_cols = [i for i, c in enumerate(df.columns) if _norm_header(c) in _DOCREF_HEADERS_NORM]
+
+                # pega a primeira candidata, se houver
+                doc_col_idx = cand_cols[0] if cand_cols else None
+
+                if doc_col_idx is not None:
+                    col_links = links.get(doc_col_idx, {})
+                    for r, valor in enumerate(df.iloc[:, doc_col_idx].tolist()):
+                        valor_visivel = '' if pd.isna(valor) else valor
+                        link = col_links.get(r, '')
+                        if not link:
+                            # fallback: se o texto já for uma URL "crua", usa como link
+                            vs = str(valor_visivel).strip()
+                            if re.match(r'^(https?://|www\.)', vs, flags=re.I):
+                                link = vs
+
+                        texto_aux_list.append(str(valor_visivel))
+                        link_aux_list.append(str(link))
+            except Exception:
+                # se der algo errado ao ler hyperlinks, segue sem travar
+                texto_aux_list, link_aux_list = [], []
+
+            # 3) renomeia colunas e marca origem
+            df = _rename_cols(df)
+            df['Sheet']   = aba
+            df['Projeto'] = nome_proj
+
+            # 4) garante TODAS as colunas antes de normalizar
+            df = _garantir_cols(df)
+            # evita NaN nessas colunas usadas pela lógica de execução
+            df['em_curso']     = pd.to_numeric(df['em_curso'], errors='coerce').fillna(0).astype(int)
+            df['em_curso_by']  = df['em_curso_by'].fillna('').astype(str)
+            df['concluida']    = pd.to_numeric(df['concluida'], errors='coerce').fillna(0).astype(int)
+
+            df = ensure_columns(df, project_uuid=_project_uuid(nome_proj))
+            df = assign_uuids(df, project_uuid=_project_uuid(nome_proj))
+
+            # 5) anexa colunas novas (alinha pelo comprimento do DF)
+            n = len(df)
+            if len(texto_aux_list) < n: texto_aux_list += [''] * (n - len(texto_aux_list))
+            if len(link_aux_list)  < n: link_aux_list  += [''] * (n - len(link_aux_list))
+            df['texto_auxiliar']     = texto_aux_list[:n]
+            df['documento_auxiliar'] = link_aux_list[:n]
+
+            # 6) normalizações antigas
+            df['duracao']     = df['duracao'].apply(_slug_int)
+            df['concluida']   = df['concluida'].fillna(0)
+            df['concluida']   = df['concluida'].apply(lambda x: 1 if str(x).strip().lower() in
+                                    ['1','100','sim','true','concluído','concluido'] else 0)
+            df['porcentagem'] = df['porcentagem'].apply(_norm_percent)
+
+            all_dfs.append(df)
+
+    except Exception as e:
+        logger.exception(f"Falha lendo {path}: {e}")
+
+    if not all_dfs:
+        return None
+
+    df = pd.concat(all_dfs, ignore_index=True)
+
+    # coerção final: se 'duracao' tem "conclu", marca concluída/100%
+    mask_conc = df['duracao'].astype(str).str.contains('conclu', case=False, na=False)
+    df.loc[mask_conc, ['concluida','porcentagem']] = [1, 100]
+
+    # chave normalizada da fase (calculada uma vez por carga; usada pelo filtro de condições)
+    df['fase_key'] = df['fase'].map(_fase_key).astype('category')
+    return df
+
+def _carregar_projeto_sqlite(ref):
+    """Lê o projeto do ARMAZENAMENTO e recompõe as colunas derivadas (mesmo formato de _carregar_projeto)."""
+    nome_proj = ref[len(_SQLITE_REF):]
+    df = ARMAZENAMENTO.carregar(nome_proj)
+    if df is None:
+        return None
+    df['Projeto'] = nome_proj
+    df = _garantir_cols(df)  # projeto criado vazio: colunas só das linhas acrescentadas
+    # linhas acrescentadas pela API não têm hyperlink lido do Excel
+    novas = df['texto_auxiliar'].isna() if 'texto_auxiliar' in df.columns else pd.Series(True, index=df.index)
+    if novas.any():
+        doc = df.loc[novas, 'documento_referencia'].fillna('').astype(str)
+        df.loc[novas, 'texto_auxiliar'] = doc
+        df.loc[novas, 'documento_auxiliar'] = doc.where(
+            doc.str.strip().str.match(r'^(https?://|www\.)', case=False), '')
+    # como na leitura do .xlsx: células vazias de execução viram 0 / ''
+    df['em_curso']    = pd.to_numeric(df['em_curso'], errors='coerce').fillna(0).astype(int)
+    df['em_curso_by'] = df['em_curso_by'].fillna('').astype(str)
+    df['concluida']   = pd.to_numeric(df['concluida'], errors='coerce').fillna(0).astype(int)
+    df['fase_key'] = df['fase'].map(_fase_key).astype('category')
+    return df
+
+def _importar_sqlite(nome_proj, path):
+    """Importa (substituindo) o projeto no ARMAZENAMENTO a partir do .xlsx normalizado."""
+    df = _carregar_projeto(path)
+    if df is not None:
+        df = df.drop(columns=['fase_key'])
+    return ARMAZENAMENTO.importar(nome_proj, df, abas=abas_workbook(path),
+                                  project_uuid=_project_uuid(nome_proj), derivadas=['Projeto'])
+
+def _carregar_projeto_snapshot(path, abas=None, sig=None):
+    """
+    Loader do CACHE_PROJETOS: usa o snapshot se ele corresponder ao .xlsx atual;
+    senão lê e normaliza o .xlsx (ou as `abas` já lidas com assinatura `sig`) e
+    regrava o snapshot — desde que o arquivo não tenha mudado durante a leitura.
+    No backend SQLite lê direto do banco (sem snapshot).
+    """
+    if path.startswith(_SQLITE_REF):
+        return _carregar_projeto_sqlite(path)
+    nome_proj = os.path.splitext(os.path.basename(path))[0]
+    df = SNAPSHOTS.load(nome_proj, path)
+    if df is not None:
+        return df
+    if abas is None:
+        sig = file_signature(path)
+    df = _carregar_projeto(path, abas)
+    if df is not None and sig is not None and file_signature(path) == sig:
+        SNAPSHOTS.save(nome_proj, sig, df)
+    return df
+
+def _aplicar_pendentes(df, ops, indice):
+    """
+    Sobrepõe ao DF de um projeto as mutações do journal ainda não gravadas no .xlsx.
+    `indice` (camada overlay do TaskIndex do cache) recebe as linhas acrescentadas.
+    """
+    for op in ops:
+        if op.get('op') == 'append':
+            vals = op.get('values') or {}
+            if vals.get('task_uuid') and indice.locate_uuid(vals['task_uuid']) is not None:
+                continue  # já está no arquivo
+            nova = {c: (0 if c in _COLS_BASE_NUM else '') for c in _COLS_BASE}
+            nova.update(vals)
+            doc = str(nova.get('documento_referencia') or '')
+            nova.update({
+                'Sheet': op.get('sheet'), 'Projeto': op.get('projeto'),
+                'texto_auxiliar': doc,
+                'documento_auxiliar': doc if re.match(r'^(https?://|www\.)', doc.strip(), flags=re.I) else '',
+                'fase_key': _fase_key(nova.get('fase')),
+            })
+            indice.add(len(df), nova['Projeto'], nova['Sheet'], nova.get('numero'), nova.get('task_uuid'))
+            df = pd.concat([df, pd.DataFrame([nova])], ignore_index=True)
+        else:
+            pos = indice.locate_uuid(op.get('task_uuid'))
+            if pos is None:
+                continue
+            i = df.index[pos]
+            for col, val in (op.get('changes') or {}).items():
+                if col not in df.columns:
+                    df[col] = ''
+                numerico = isinstance(val, (int, float)) and pd.api.types.is_numeric_dtype(df[col])
+                if df[col].dtype != object and not numerico:
+                    df[col] = df[col].astype('object')
+                df.at[i, col] = val
+            if 'fase' in (op.get('changes') or {}) and 'fase_key' in df.columns:
+                df['fase_key'] = df['fase_key'].astype('object')
+                df.at[i, 'fase_key'] = _fase_key(df.at[i, 'fase'])
+    return df
+
+def _token_projeto(nome_proj, path):
+    """Identifica o estado atual do projeto: assinatura do .xlsx (ou geração no SQLite) + ops pendentes no journal."""
+    pend = JOURNAL.pending(nome_proj)
+    return (_assinatura(path), len(pend), pend[-1]['seq'] if pend else 0)
+
+def _projeto_atual(nome_proj, path, copiar=False):
+    """
+    (DF, TaskIndex) do projeto: DF e índice do cache (índice construído uma vez
+    por carga) com as mutações pendentes do JOURNAL sobrepostas numa cópia.
+    Sem pendências e com copiar=False, o DF é o próprio objeto do cache (não alterar).
+    """
+    dfp = CACHE_PROJETOS.get(nome_proj, path, _carregar_projeto_snapshot)
+    if dfp is None:
+        return None, TaskIndex()
+    indice = CACHE_PROJETOS.derived(nome_proj, 'indice', dfp, TaskIndex.from_frame)
+    pendentes = JOURNAL.pending(nome_proj)
+    if pendentes:
+        indice = indice.overlay()
+        dfp = _aplicar_pendentes(dfp.copy(), pendentes, indice)
+    elif copiar:
+        dfp = dfp.copy()
+    return dfp, indice
+
+def _aquecer_em_paralelo(alvos):
+    """
+    Projetos fora do cache são lidos juntos (PARALLEL_LOAD_ENABLED → processos) e
+    normalizados aqui; o resultado só é usado se o arquivo não mudou desde a leitura.
+    """
+    if ARMAZENAMENTO is not None:
+        return
+    frios = {n: p for n, p in alvos.items()
+             if not CACHE_PROJETOS.is_fresh(n, p) and not SNAPSHOTS.has(n, p)}
+    if len(frios) < 2:
+        return
+    lidos = ler_workbooks(list(frios.values()))
+    for nome_proj, path in frios.items():
+        sig, abas = lidos.get(path, (None, None))
+        if abas is not None and sig is not None and sig == file_signature(path):
+            CACHE_PROJETOS.get(nome_proj, path,
+                               lambda p, abas=abas, sig=sig: _carregar_projeto_snapshot(p, abas, sig))
+
 def carregar_base_dados(projeto=None):
     """
     Se projeto=None → concatena todos os projetos (todos .xlsx).
@@ -168,136 +459,51 @@ def carregar_base_dados(projeto=None):
       - texto_auxiliar: texto visível na célula "Documento Referência"
       - documento_auxiliar: URL do hyperlink embutido nessa célula (target)
         * Se não houver hyperlink, tenta usar o valor da célula se parecer uma URL
+      - cada projeto é lido uma única vez e reaproveitado do CACHE_PROJETOS
+        enquanto o arquivo não mudar; o retorno é sempre uma cópia (pode ser alterada)
+      - mutações ainda pendentes no JOURNAL são sobrepostas ao conteúdo do arquivo
     """
-    def _norm(s: str) -> str:
-        import unicodedata, re
-        s = str(s or '').strip()
-        s = ''.join(ch for ch in unicodedata.normalize('NFKD', s) if not unicodedata.combining(ch))
-        s = re.sub(r'\s+', ' ', s)
-        return s.lower()
-
-    # nomes possíveis (sem acento) para localizar a coluna no cabeçalho do Excel
-    docref_headers_norm = {
-        _norm('Documento Referência'),
-        _norm('Documento Referencia'),
-        _norm('Documento'),
-        _norm('Doc Referência'),
-        _norm('Doc Referencia'),
-    }
-
     projetos = _listar_projetos()
-    arquivos = [projetos[projeto]] if (projeto and projeto in projetos) else list(projetos.values())
+    alvos = {projeto: projetos[projeto]} if (projeto and projeto in projetos) else projetos
+    if len(alvos) > 1:
+        _aquecer_em_paralelo(alvos)
 
     all_dfs = []
-    for path in arquivos:
-        nome_proj = os.path.splitext(os.path.basename(path))[0]
-        try:
-            # 1) Lê os dados em DataFrames (pandas)
-            sheets = pd.read_excel(path, sheet_name=None, engine="openpyxl")
-
-            # 2) Abre o mesmo arquivo com openpyxl para capturar hyperlinks
-            from openpyxl import load_workbook
-            wb = load_workbook(path, data_only=True)
-
-            for aba, df in (sheets or {}).items():
-                if df is None or df.empty:
-                    continue
-
-                # Captura colunas de hyperlink desta ABA
-                texto_aux_list = []
-                link_aux_list  = []
-
-                try:
-                    ws = wb[aba]
-                    # Detecta linha de cabeçalho (assumindo a 1ª linha)
-                    header_cells = [c.value for c in next(ws.iter_rows(min_row=1, max_row=1))]
-                    # mapa: índice (0-based) → valor normalizado
-                    header_norm_map = {i: _norm(v) for i, v in enumerate(header_cells)}
-                    # encontra a(s) coluna(s) candidata(s) a "Documento Referência"
-                    cand_cols = [i for i, nm in header_norm_map.items() if nm in docref_headers_norm]
-
-                    # pega a primeira candidata, se houver
-                    doc_col_idx = cand_cols[0] if cand_cols else None
-
-                    # percorre as linhas de dados (a partir da 2ª linha)
-                    if doc_col_idx is not None:
-                        for r in ws.iter_rows(min_row=2, max_row=ws.max_row):
-                            cell = r[doc_col_idx]
-                            valor_visivel = cell.value if cell.value is not None else ''
-                            link = ''
-                            if cell.hyperlink and getattr(cell.hyperlink, 'target', ''):
-                                link = cell.hyperlink.target
-                            else:
-                                # fallback: se o texto já for uma URL "crua", usa como link
-                                vs = str(valor_visivel).strip()
-                                import re as _re
-                                if _re.match(r'^(https?://|www\.)', vs, flags=_re.I):
-                                    link = vs
-
-                            texto_aux_list.append(str(valor_visivel) if valor_visivel is not None else '')
-                            link_aux_list.append(str(link))
-                    else:
-                        # não achou a coluna; mantém listas vazias (depois alinhamos pelo tamanho do DF)
-                        pass
-                except Exception:
-                    # se der algo errado ao ler hyperlinks, segue sem travar
-                    texto_aux_list, link_aux_list = [], []
-
-                # 3) renomeia colunas e marca origem
-                df = _rename_cols(df)
-                df['Sheet']   = aba
-                df['Projeto'] = nome_proj
-
-                # 4) garante TODAS as colunas antes de normalizar
-                df = _garantir_cols(df)
-                # evita NaN nessas colunas usadas pela lógica de execução
-                df['em_curso']     = pd.to_numeric(df['em_curso'], errors='coerce').fillna(0).astype(int)
-                df['em_curso_by']  = df['em_curso_by'].fillna('').astype(str)
-                df['concluida']    = pd.to_numeric(df['concluida'], errors='coerce').fillna(0).astype(int)
-
-                df = ensure_columns(df, project_uuid=_project_uuid(nome_proj))
-                df = assign_uuids(df)
-
-                # 5) anexa colunas novas (alinha pelo comprimento do DF)
-                n = len(df)
-                if len(texto_aux_list) < n: texto_aux_list += [''] * (n - len(texto_aux_list))
-                if len(link_aux_list)  < n: link_aux_list  += [''] * (n - len(link_aux_list))
-                df['texto_auxiliar']     = texto_aux_list[:n]
-                df['documento_auxiliar'] = link_aux_list[:n]
-
-                # 6) normalizações antigas
-                df['duracao']     = df['duracao'].apply(_slug_int)
-                df['concluida']   = df['concluida'].fillna(0)
-                df['concluida']   = df['concluida'].apply(lambda x: 1 if str(x).strip().lower() in
-                                        ['1','100','sim','true','concluído','concluido'] else 0)
-                df['porcentagem'] = df['porcentagem'].apply(_norm_percent)
-
-                all_dfs.append(df)
-
-        except Exception as e:
-            logger.exception(f"Falha lendo {path}: {e}")
+    for nome_proj, path in alvos.items():
+        dfp, _ = _projeto_atual(nome_proj, path)
+        if dfp is not None and not dfp.empty:
+            all_dfs.append(dfp)
 
     if not all_dfs:
         # Retorna DF vazio com colunas padrão + novas
-        return pd.DataFrame(columns=[
-            'numero','fase','nome','categoria','duracao','condicao',
-            'concluida','porcentagem','Sheet','Projeto',
-            'classificacao','como_fazer','documento_referencia',
-            'texto_auxiliar','documento_auxiliar'
-        ])
+        return pd.DataFrame(columns=_COLS_VAZIO)
 
+    # concat copia os dados → o cache não é afetado por alterações do chamador
     df = pd.concat(all_dfs, ignore_index=True)
 
-    # coerção final: se 'duracao' tem "conclu", marca concluída/100%
-    mask_conc = df['duracao'].astype(str).str.contains('conclu', case=False, na=False)
-    df.loc[mask_conc, ['concluida','porcentagem']] = [1, 100]
-
     # garante as novas colunas caso alguma aba não tenha produzido
     for c in ['texto_auxiliar','documento_auxiliar']:
         if c not in df.columns: df[c] = ''
 
     return df
 
+def carregar_projeto_indexado(projeto):
+    """
+    Como carregar_base_dados(projeto), devolvendo também o TaskIndex do projeto
+    (posições do índice = rótulos do DF), para localizar tarefas sem varrer colunas:
+
+        df, indice = carregar_projeto_indexado(projeto)
+        i = indice.locate(sheet, numero, projeto)
+    """
+    path = _listar_projetos().get(projeto) if projeto else None
+    if not path:
+        df = carregar_base_dados(projeto)
+        return df, TaskIndex.from_frame(df)
+    dfp, indice = _projeto_atual(projeto, path, copiar=True)
+    if dfp is None or dfp.empty:
+        return pd.DataFrame(columns=_COLS_VAZIO), TaskIndex()
+    return dfp, indice
+
 # -----------------------------------------------------------------------------
 # PÁGINAS PRINCIPAIS
 # -----------------------------------------------------------------------------
@@ -323,48 +529,190 @@ def textos():
 def controle_page():
     return render_template('controle.html')
 
+# -----------------------------------------------------------------------------
+# RESPOSTAS CONDICIONAIS (ETag / Last-Modified)
+# -----------------------------------------------------------------------------
+def _geracao(projeto=None):
+    """[(projeto, geração)] e último instante de mudança dos projetos no escopo."""
+    projetos = _listar_projetos()
+    GERACOES.forget_missing(projetos)
+    alvos = {projeto: projetos[projeto]} if (projeto and projeto in projetos) else projetos
+    gens, ultimo = [], 0.0
+    for nome_proj, path in sorted(alvos.items()):
+        token = _token_projeto(nome_proj, path)
+        sig = token[0]
+        mtime = sig[0] / 1e9 if sig and ARMAZENAMENTO is None else None
+        g, quando = GERACOES.observe(nome_proj, token, mtime)
+        gens.append((nome_proj, g))
+        ultimo = max(ultimo, quando)
+    return gens, ultimo
+
+def _geracao_dados(projeto=None):
+    """Versão dos dados no escopo ("boot-geração"), a mesma para o app e para o Chatbot."""
+    gens, _ = _geracao(projeto)
+    return f"{GERACOES.boot}-{max((g for _, g in gens), default=0)}"
+
+def _resposta_condicional(variante, projeto, gerar):
+    """
+    Resposta com ETag (fraco) e Last-Modified derivados da geração dos projetos no
+    escopo. Se o cliente já tem esta versão (If-None-Match / If-Modified-Since),
+    devolve 304 sem chamar `gerar`. `variante` = endpoint + parâmetros canônicos.
+    Respostas de erro não recebem validadores.
+    """
+    gens, ultimo = _geracao(projeto)
+    chave = json.dumps([GERACOES.boot, variante, gens], ensure_ascii=False, default=str)
+    etag = hashlib.sha1(chave.encode('utf-8')).hexdigest()[:24]
+    last_mod = (datetime.datetime.fromtimestamp(int(ultimo), tz=datetime.timezone.utc)
+                if ultimo else None)
+
+    if request.if_none_match:
+        nao_mudou = request.if_none_match.contains_weak(etag)
+    else:
+        ims = request.if_modified_since
+        nao_mudou = bool(ims and last_mod and last_mod <= ims)
+
+    if nao_mudou:
+        resp = app.response_class(status=304)
+    else:
+        resp = make_response(gerar())
+        if resp.status_code != 200:
+            return resp
+    resp.set_etag(etag, weak=True)
+    if last_mod:
+        resp.last_modified = last_mod
+    resp.headers['Cache-Control'] = 'no-cache'
+    resp.vary.add('X-Projeto')
+    return resp
+
+def _params_filtro():
+    """
+    (projeto, categoria, condicoes) do corpo JSON (POST) ou da query string (GET):
+        GET /gerar-cronograma?projeto=X&categoria=Y&condicoes={"1. Escopo":["A"]}
+    """
+    if request.method == 'GET':
+        args = request.args
+        try:
+            condicoes = json.loads(args.get('condicoes') or '{}')
+        except ValueError:
+            condicoes = {}
+        return args.get('projeto') or request.headers.get('X-Projeto'), args.get('categoria') or '', condicoes
+    data = request.get_json(force=True, silent=True) or {}
+    return data.get('projeto'), data.get('categoria') or '', data.get('condicoes') or {}
+
+def _variante_filtro(endpoint, projeto, categoria, condicoes):
+    """Chave canônica dos parâmetros (ordem de fases/condições não importa)."""
+    cond = None
+    if isinstance(condicoes, dict):
+        cond = sorted((str(k), sorted({json.dumps(c, ensure_ascii=False, default=str) for c in (v or [])}))
+                      for k, v in condicoes.items())
+    return [endpoint, projeto or '', str(categoria or ''), cond]
+
 # -----------------------------------------------------------------------------
 # CRONOGRAMA
 # -----------------------------------------------------------------------------
 import re, unicodedata
 from flask import request, jsonify
 
-def _fase_key(s: str) -> str:
-    s = str(s or '').lower()
-    s = ''.join(ch for ch in unicodedata.normalize('NFKD', s) if not unicodedata.combining(ch))
-    s = re.sub(r'[^a-z0-9]+', ' ', s).strip()
-    m = re.match(r'^(\d+)', s)
-    return m.group(1) if m else s
+# colunas expostas no JSON (ordem estável) e ordenação padrão
+_CRONOGRAMA_COLS = [
+    'numero','fase','nome','categoria','condicao','duracao','concluida',
+    'porcentagem','Sheet','Projeto',
+    # campos legacy
+    'como_fazer','documento_referencia','classificacao',
+    # novos campos para textos/documentos auxiliares
+    'texto_auxiliar','documento_auxiliar', 'em_curso','em_curso_by','inicio_em','colaboradores','relatorio_progresso', 'responsavel_conclusao','data_conclusao','status'
+]
+_CRONOGRAMA_SORT = ['Projeto','fase','numero']
+_NDJSON_CHUNK = 500
+
+def _params_listagem():
+    """
+    Opções de listagem do corpo (POST) ou da query string (GET):
+      - limit / cursor : paginação (cursor opaco devolvido em 'next_cursor')
+      - fields         : projeção, ex. fields=numero,nome,fase
+      - sort           : chaves de ordenação, '-' = decrescente, ex. sort=-porcentagem,numero
+      - formato=ndjson : uma tarefa por linha, enviada em streaming
+    """
+    src = request.args if request.method == 'GET' else (request.get_json(force=True, silent=True) or {})
+
+    def _lista(v):
+        if v is None or v == '':
+            return []
+        if isinstance(v, str):
+            v = v.split(',')
+        return [str(x).strip() for x in v if str(x).strip()]
+
+    return {
+        'limit': src.get('limit'),
+        'cursor': src.get('cursor') or None,
+        'fields': _lista(src.get('fields')),
+        'sort': _lista(src.get('sort')),
+        'ndjson': str(src.get('formato') or '').lower() == 'ndjson',
+    }
 
-@app.route('/gerar-cronograma', methods=['POST'])
-def gerar_cronograma():
+def _cursor_encode(offset):
+    return base64.urlsafe_b64encode(json.dumps({'o': offset}).encode()).decode().rstrip('=')
+
+def _cursor_decode(cursor):
     try:
-        data = request.get_json(force=True, silent=True) or {}
-        projeto   = data.get('projeto')            # "" = todos os arquivos
-        categoria = data.get('categoria') or ''    # opcional
-        condicoes = data.get('condicoes') or {}    # dict { "1. Escopo...": ["Sempre","A"...], ... }
+        raw = base64.urlsafe_b64decode(str(cursor) + '=' * (-len(str(cursor)) % 4))
+        offset = int(json.loads(raw)['o'])
+    except Exception:
+        raise ValueError('cursor inválido')
+    if offset < 0:
+        raise ValueError('cursor inválido')
+    return offset
+
+def _mascara_condicoes(df, condicoes):
+    """
+    Máscara (vetorizada) das tarefas aceitas por `condicoes` = {fase: [condições]}.
+      - a fase é comparada pela chave normalizada (_fase_key / coluna 'fase_key')
+      - fase presente no dict: condição tem de estar na lista (lista vazia aceita tudo)
+      - fase fora do dict: aceita qualquer condição listada no dict
+    """
+    cond_map   = { _fase_key(k): set(v or []) for k, v in condicoes.items() }
+    cond_union = set().union(*cond_map.values()) if cond_map else set()
+
+    fk   = df['fase_key'] if 'fase_key' in df.columns else df['fase'].map(_fase_key)
+    fk   = fk.astype(object)
+    cond = df['condicao'].astype(str).str.strip()
 
+    pares  = [(k, c) for k, v in cond_map.items() for c in v]
+    livres = [k for k, v in cond_map.items() if not v]
+    ok_no_mapa = fk.isin(livres).to_numpy() | pd.MultiIndex.from_arrays([fk, cond]).isin(pares)
+    ok_fora    = cond.isin(cond_union).to_numpy() if cond_union else True
+    return np.where(fk.isin(list(cond_map)).to_numpy(), ok_no_mapa, ok_fora)
+
+def _filtrar_tarefas(df, categoria='', condicoes=None):
+    """Filtro único de /gerar-cronograma e /dashboard-metrics (categoria + condições por fase)."""
+    if categoria:
+        df = df[df['categoria'].astype(str) == str(categoria)]
+    if isinstance(condicoes, dict) and condicoes and not df.empty:
+        df = df[_mascara_condicoes(df, condicoes)]
+    return df
+
+@app.route('/gerar-cronograma', methods=['GET', 'POST'])
+def gerar_cronograma():
+    # projeto: "" = todos os arquivos; categoria: opcional
+    # condicoes: dict { "1. Escopo...": ["Sempre","A"...], ... }
+    # paginação/projeção/ordenação/NDJSON: ver _params_listagem
+    projeto, categoria, condicoes = _params_filtro()
+    opcoes = _params_listagem()
+    variante = _variante_filtro('gerar-cronograma', projeto, categoria, condicoes) + [
+        str(opcoes['limit'] or ''), opcoes['cursor'] or '', opcoes['fields'], opcoes['sort'], opcoes['ndjson']]
+    return _resposta_condicional(variante, projeto,
+                                 lambda: _gerar_cronograma(projeto, categoria, condicoes, opcoes))
+
+def _gerar_cronograma(projeto, categoria, condicoes, opcoes=None):
+    opcoes = opcoes or {}
+    try:
         # 1) carrega a base (um arquivo/projeto ou todos)
         df = carregar_base_dados(projeto)
         if df is None or df.empty:
             return jsonify({"cronograma": [], "duracao_total": 0})
 
-        # 2) filtra por categoria se vier
-        if categoria:
-            df = df[df['categoria'].astype(str) == str(categoria)]
-
-        # 3) filtra por condição por fase (case/acentos robustos)
-        if isinstance(condicoes, dict) and condicoes:
-            cond_map   = { _fase_key(k): set(v or []) for k, v in condicoes.items() }
-            cond_union = set().union(*cond_map.values()) if cond_map else set()
-
-            def tarefa_valida(row):
-                fk   = _fase_key(row.get('fase', ''))
-                cond = str(row.get('condicao', '')).strip()
-                allowed = cond_map.get(fk, cond_union)
-                return (cond in allowed) if allowed else True
-
-            df = df[df.apply(tarefa_valida, axis=1)]
+        # 2) e 3) filtra por categoria e por condição por fase (case/acentos robustos)
+        df = _filtrar_tarefas(df, categoria, condicoes)
 
         # 4) garantir colunas mínimas
         ensure_str = ['como_fazer','documento_referencia','classificacao','Sheet','Projeto',
@@ -380,27 +728,44 @@ def gerar_cronograma():
         df['duracao_num'] = pd.to_numeric(df['duracao'], errors='coerce').fillna(0).astype(int)
         duracao_total = int(df['duracao_num'].sum())
 
-        # 6) ordem das colunas expostas no JSON
-        ordem = [
-            'numero','fase','nome','categoria','condicao','duracao','concluida',
-            'porcentagem','Sheet','Projeto',
-            # campos legacy
-            'como_fazer','documento_referencia','classificacao',
-            # novos campos para textos/documentos auxiliares
-            'texto_auxiliar','documento_auxiliar', 'em_curso','em_curso_by','inicio_em','colaboradores','relatorio_progresso', 'responsavel_conclusao','data_conclusao','status'
-        ]
+        # 6) colunas expostas (projeção opcional via fields=) e ordenação
+        ordem = [c for c in opcoes.get('fields') or [] if c in _CRONOGRAMA_COLS] or _CRONOGRAMA_COLS
+        chaves = opcoes.get('sort') or _CRONOGRAMA_SORT
+        if any(k.lstrip('-') not in _CRONOGRAMA_COLS for k in chaves):
+            return jsonify({"error": "sort inválido", "cronograma": [], "duracao_total": 0}), 400
 
         # garanta tipos razoáveis para evitar NaN → JSON inválido
         for col in ['numero','concluida','porcentagem','duracao']:
             df[col] = pd.to_numeric(df[col], errors='coerce')
 
-        # 7) serialização estável
-        cronograma_json = df[ordem] \
-            .sort_values(by=['Projeto','fase','numero'], na_position='last') \
-            .to_json(orient='records', force_ascii=False)
-        cronograma = json.loads(cronograma_json)
-
-        return jsonify({"cronograma": cronograma, "duracao_total": duracao_total})
+        df = df.sort_values(by=[k.lstrip('-') for k in chaves],
+                            ascending=[not k.startswith('-') for k in chaves], na_position='last')[ordem]
+        total = int(len(df))
+
+        # 7a) streaming NDJSON: uma tarefa por linha, em blocos
+        if opcoes.get('ndjson'):
+            def _linhas():
+                yield from ndjson_blocos(df, _NDJSON_CHUNK)
+            resp = app.response_class(_linhas(), mimetype='application/x-ndjson')
+            resp.headers['X-Total-Count'] = str(total)
+            resp.headers['X-Duracao-Total'] = str(duracao_total)
+            return resp
+
+        # 7b) paginação por cursor (duracao_total continua sendo do conjunto inteiro)
+        extra = b''
+        if opcoes.get('limit') is not None or opcoes.get('cursor'):
+            try:
+                inicio = _cursor_decode(opcoes['cursor']) if opcoes.get('cursor') else 0
+                limite = max(1, int(opcoes.get('limit') or total or 1))
+            except ValueError as e:
+                return jsonify({"error": str(e), "cronograma": [], "duracao_total": 0}), 400
+            df = df.iloc[inicio:inicio + limite]
+            prox = _cursor_encode(inicio + limite) if inicio + limite < total else None
+            extra = b',"total":%d,"next_cursor":%s' % (total, json.dumps(prox).encode())
+
+        # 7c) serialização estável, codificada uma única vez (DataFrame → bytes)
+        corpo = b'{"cronograma":%s,"duracao_total":%d%s}' % (records_json(df), duracao_total, extra)
+        return app.response_class(corpo, mimetype='application/json')
 
     except Exception as e:
         logger.exception(f"/gerar-cronograma: {e}")
@@ -413,6 +778,10 @@ def tarefas_em_curso():
     GET /tarefas-em-curso?projeto=XYZ
     """
     projeto = request.args.get('projeto') or request.headers.get('X-Projeto')
+    return _resposta_condicional(['tarefas-em-curso', projeto or ''], projeto,
+                                 lambda: _tarefas_em_curso(projeto))
+
+def _tarefas_em_curso(projeto):
     df = carregar_base_dados(projeto)
     if df is None or df.empty:
         return jsonify([])
@@ -434,11 +803,124 @@ def tarefas_em_curso():
         df[df['em_curso'] == 1][cols]
         .sort_values(['Projeto','fase','numero'])
     )
-    return jsonify(json.loads(emc.to_json(orient='records', force_ascii=False)))
+    return app.response_class(records_json(emc), mimetype='application/json')
 
 # -----------------------------------------------------------------------------
 # CONCLUIR / REABRIR TAREFA / INICIAR
 # -----------------------------------------------------------------------------
+# Colunas derivadas na carga (não existem como dado próprio no Excel)
+_COLS_NAO_PERSISTIDAS = {'Sheet', 'Projeto', 'texto_auxiliar', 'documento_auxiliar', 'fase_key'}
+
+def _alteracoes(before, after):
+    """Colunas cujo valor mudou entre before/after (NaN == NaN)."""
+    def _na(v):
+        return pd.api.types.is_scalar(v) and pd.isna(v)
+
+    changes = {}
+    for k, v in after.items():
+        if k in _COLS_NAO_PERSISTIDAS:
+            continue
+        old = before.get(k)
+        if k in before and ((_na(old) and _na(v)) or (not _na(old) and not _na(v) and old == v)):
+            continue
+        changes[k] = v
+    return changes
+
+def _linha_excel(indice, i):
+    """Linha no Excel da tarefa df.loc[i]: ordem dentro da aba (registrada no TaskIndex na carga) + 1."""
+    ordem = indice.row_in_sheet(i)
+    return None if ordem is None else ordem + 1
+
+def _gravar_ops(projeto, target, ops, backup=False):
+    """
+    Persiste ops de tarefa (patch/append) do projeto.
+    Backend SQLite: uma transação, um UPDATE/INSERT por op (sem journal nem backup).
+    Com write-behind: registra no JOURNAL e retorna (o compactador grava depois).
+    Sem write-behind: backup opcional + gravação imediata no .xlsx.
+    """
+    if ARMAZENAMENTO is not None:
+        ARMAZENAMENTO.apply_ops(projeto, ops)
+        return
+    if JOURNAL.enabled:
+        for op in ops:
+            JOURNAL.append(projeto, op)
+        return
+    if backup:
+        try:
+            rotate_backups(target)
+        except Exception:
+            logger.exception("Falha ao criar backup rotativo antes de salvar")
+    apply_task_ops(target, ops, aliases=_COLMAP)
+
+def _persistir_tarefa(target, df, i, before, indice, backup=False):
+    """
+    Grava só as células alteradas da tarefa df.loc[i] (sem regravar o workbook).
+    `indice`: TaskIndex do projeto (de carregar_projeto_indexado), de onde vem o row_hint.
+    """
+    after = df.loc[i].to_dict()
+    changes = _alteracoes(before, after)
+    if changes:
+        op = {
+            'op': 'patch',
+            'sheet': df.at[i, 'Sheet'],
+            'numero': before.get('numero'),
+            'task_uuid': before.get('task_uuid'),
+            'row_hint': _linha_excel(indice, i),
+            'changes': changes,
+        }
+        agg = _delta_agregado(before, after)
+        if agg:
+            op['agg'] = agg
+        _gravar_ops(df.at[i, 'Projeto'], target, [op], backup=backup)
+    return changes
+
+def _compactar_projeto(projeto, ops):
+    """
+    Compactador do JOURNAL: aplica o lote no .xlsx com um único backup e aquece o cache.
+    Uma falha sobe para o JOURNAL, que retenta e, após JOURNAL_MAX_RETRIES, descarta o lote.
+    """
+    target = _listar_projetos().get(projeto)
+    if not target:
+        logger.warning(f"Journal: projeto '{projeto}' não existe mais; {len(ops)} op(s) descartada(s)")
+        return
+    with LOCKS.lock(projeto):
+        try:
+            rotate_backups(target)
+        except Exception:
+            logger.exception("Falha ao criar backup rotativo antes de compactar")
+        apply_task_ops(target, ops, aliases=_COLMAP, strict=False)
+        # ainda sob o lock: leitores não veem o arquivo novo + as mesmas ops pendentes
+        JOURNAL.ack(projeto, ops[-1]['seq'])
+    # fora do lock: a releitura não segura os escritores; o cache é por assinatura
+    # do arquivo, então uma gravação no meio só torna esta entrada obsoleta
+    try:
+        CACHE_PROJETOS.get(projeto, target, _carregar_projeto_snapshot)
+    except Exception:
+        logger.exception(f"Journal: falha ao aquecer o cache de '{projeto}' após a compactação")
+
+JOURNAL.start(_compactar_projeto)
+atexit.register(JOURNAL.flush)
+
+def _aquecer_projeto(evento, path):
+    """
+    Assinante do WATCHER: relê o projeto alterado (DF + índice) fora do caminho das requisições.
+    Backend SQLite: só importa planilhas de projetos que ainda não estão no banco.
+    """
+    nome_proj = os.path.splitext(os.path.basename(path))[0]
+    if ARMAZENAMENTO is not None:
+        if evento != 'deleted' and ARMAZENAMENTO.signature(nome_proj) is None:
+            _importar_sqlite(nome_proj, path)
+        return
+    if evento == 'deleted':
+        CACHE_PROJETOS.invalidate(nome_proj)
+        SNAPSHOTS.remove(nome_proj)
+        return
+    _projeto_atual(nome_proj, path)
+
+WATCHER.subscribe(_aquecer_projeto)
+WATCHER.start()
+atexit.register(WATCHER.stop)
+
 @app.route('/concluir-tarefa', methods=['POST'])
 def concluir_tarefa():
     """
@@ -487,29 +969,6 @@ def concluir_tarefa():
             return jsonify({'success': False, 'error': 'Parâmetros insuficientes: numero e sheet são obrigatórios'}), 400
 
         # --------- descobrir projeto se não veio ---------
-        def _descobrir_projeto_por_tarefa(num, aba):
-            try:
-                projetos = _listar_projetos()
-            except Exception:
-                return None
-            hits = []
-            for nome_proj, path in projetos.items():
-                try:
-                    dfp = carregar_base_dados(nome_proj)
-                    if dfp is None or dfp.empty:
-                        continue
-                    m_num   = dfp.get('numero', pd.Series([], dtype=str)).astype(str) == str(num)
-                    m_sheet = dfp.get('Sheet',  pd.Series([], dtype=str)).astype(str) == str(aba)
-                    if (m_num & m_sheet).any():
-                        hits.append(nome_proj)
-                except Exception:
-                    continue
-            if not hits:
-                return None
-            if len(hits) > 1:
-                return "__AMBIGUO__"
-            return hits[0]
-
         if not projeto:
             projeto = _descobrir_projeto_por_tarefa(numero, sheet)
             if projeto is None:
@@ -517,160 +976,145 @@ def concluir_tarefa():
             if projeto == "__AMBIGUO__":
                 return jsonify({'success': False, 'error': 'Tarefa encontrada em mais de um projeto; informe o campo "projeto".'}), 409
 
-        # --------- carregar base do projeto ---------
-        try:
-            df = carregar_base_dados(projeto)
-        except Exception as e:
-            app.logger.error(f"Falha ao carregar base do projeto '{projeto}': {e}", exc_info=True)
-            return jsonify({'success': False, 'error': f'Erro ao carregar dados do projeto {projeto}'}), 500
-
-        if df is None or df.empty:
-            return jsonify({'success': False, 'error': 'Base de tarefas vazia'}), 404
+        with LOCKS.lock(projeto):
+            # --------- carregar base do projeto ---------
+            try:
+                df, indice = carregar_projeto_indexado(projeto)
+            except Exception as e:
+                app.logger.error(f"Falha ao carregar base do projeto '{projeto}': {e}", exc_info=True)
+                return jsonify({'success': False, 'error': f'Erro ao carregar dados do projeto {projeto}'}), 500
 
-        # --------- localizar tarefa (robusto a tipos) ---------
-        try:
-            mask_num   = df['numero'].astype(str) == str(numero)
-            mask_sheet = df['Sheet'].astype(str)  == str(sheet)
-        except KeyError as e:
-            return jsonify({'success': False, 'error': f'Coluna ausente na base: {e}'}), 500
+            if df is None or df.empty:
+                return jsonify({'success': False, 'error': 'Base de tarefas vazia'}), 404
 
-        idxs = df.index[mask_num & mask_sheet].tolist()
-        if not idxs:
-            return jsonify({'success': False, 'error': 'Tarefa não encontrada'}), 404
+            # --------- localizar tarefa (índice; robusto a tipos: 5 == "5" == 5.0) ---------
+            i = indice.locate(sheet, numero, projeto)
+            if i is None:
+                return jsonify({'success': False, 'error': 'Tarefa não encontrada'}), 404
 
-        i = idxs[0]
-        before = df.loc[i].to_dict()
+            before = df.loc[i].to_dict()
 
-        # --------- lock otimista (se coluna existir e cliente enviar) ---------
-        if version_client is not None and 'version' in df.columns:
-            try:
-                if int(str(df.at[i, 'version'])) != int(str(version_client)):
-                    return jsonify({'success': False, 'error': 'version_conflict', 'current': before}), 409
-            except Exception:
-                pass
-
-        # --------- ajustes de dtype (duracao pode receber string "Concluído") ---------
-        if 'duracao' in df.columns and df['duracao'].dtype != object:
-            df['duracao'] = df['duracao'].astype('object')
-
-        # --------- aplicar ação ---------
-        agora = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-
-        if acao == 'concluir':
-            # marcador de conclusão
-            if 'duracao' in df.columns:
-                df.at[i, 'duracao'] = 'Concluído'
-            if 'concluida' in df.columns:
-                df.at[i, 'concluida'] = 1
-            if 'em_curso' in df.columns:
-                df.at[i, 'em_curso'] = 0
-            if 'porcentagem' in df.columns:
-                df.at[i, 'porcentagem'] = 100
-            for col, val in [
-                ('status', 'Concluída'),
-                ('Status', 'Concluída'),
-                ('data_conclusao', agora),
-                ('responsavel_conclusao', operator),
-            ]:
-                if col in df.columns:
-                    df.at[i, col] = val
-
-            # garantir 100%
-            if 'porcentagem' in df.columns:
+            # --------- lock otimista (se coluna existir e cliente enviar) ---------
+            if version_client is not None and 'version' in df.columns:
                 try:
-                    df.at[i, 'porcentagem'] = 100
+                    if int(str(df.at[i, 'version'])) != int(str(version_client)):
+                        return jsonify({'success': False, 'error': 'version_conflict', 'current': before}), 409
                 except Exception:
-                    df['porcentagem'] = df['porcentagem'].astype('object')
+                    pass
+
+            # --------- ajustes de dtype (duracao pode receber string "Concluído") ---------
+            if 'duracao' in df.columns and df['duracao'].dtype != object:
+                df['duracao'] = df['duracao'].astype('object')
+
+            # --------- aplicar ação ---------
+            agora = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+            if acao == 'concluir':
+                # marcador de conclusão
+                if 'duracao' in df.columns:
+                    df.at[i, 'duracao'] = 'Concluído'
+                if 'concluida' in df.columns:
+                    df.at[i, 'concluida'] = 1
+                if 'em_curso' in df.columns:
+                    df.at[i, 'em_curso'] = 0
+                if 'porcentagem' in df.columns:
                     df.at[i, 'porcentagem'] = 100
-            # info auxiliares (se existirem)
-            for col, val in [
-                ('status', 'Concluída'),
-                ('Status', 'Concluída'),
-                ('data_conclusao', agora),
-                ('responsavel_conclusao', operator),
-            ]:
-                if col in df.columns:
-                    df.at[i, col] = val
-
-        elif acao == 'reabrir':
-            # volta a ter prazo numérico e flags
-            if 'duracao' in df.columns:
-                df.at[i, 'duracao'] = novo_prz
-            if 'concluida' in df.columns:
-                df.at[i, 'concluida'] = 0
-            if 'em_curso' in df.columns:
-                df.at[i, 'em_curso'] = 1
+                for col, val in [
+                    ('status', 'Concluída'),
+                    ('Status', 'Concluída'),
+                    ('data_conclusao', agora),
+                    ('responsavel_conclusao', operator),
+                ]:
+                    if col in df.columns:
+                        df.at[i, col] = val
+
+                # garantir 100%
+                if 'porcentagem' in df.columns:
+                    try:
+                        df.at[i, 'porcentagem'] = 100
+                    except Exception:
+                        df['porcentagem'] = df['porcentagem'].astype('object')
+                        df.at[i, 'porcentagem'] = 100
+                # info auxiliares (se existirem)
+                for col, val in [
+                    ('status', 'Concluída'),
+                    ('Status', 'Concluída'),
+                    ('data_conclusao', agora),
+                    ('responsavel_conclusao', operator),
+                ]:
+                    if col in df.columns:
+                        df.at[i, col] = val
+
+            elif acao == 'reabrir':
+                # volta a ter prazo numérico e flags
+                if 'duracao' in df.columns:
+                    df.at[i, 'duracao'] = novo_prz
+                if 'concluida' in df.columns:
+                    df.at[i, 'concluida'] = 0
+                if 'em_curso' in df.columns:
+                    df.at[i, 'em_curso'] = 1
             
-            # >>> NOVO: limpar dono se solicitado
-            if clear_owner and 'em_curso_by' in df.columns:
-                df.at[i, 'em_curso_by'] = ''
+                # >>> NOVO: limpar dono se solicitado
+                if clear_owner and 'em_curso_by' in df.columns:
+                    df.at[i, 'em_curso_by'] = ''
             
-            # tirar de 100% para reaparecer no Gestor
-            if 'porcentagem' in df.columns:
-                try:
-                    cur = str(df.at[i, 'porcentagem']).strip().replace('%', '')
-                    cur = int(cur) if cur else 0
-                except Exception:
-                    cur = 0
-                df.at[i, 'porcentagem'] = 0 if cur >= 100 else cur
-            for col, val in [
-                ('status', 'Em curso'),
-                ('Status', 'Em curso'),
-                ('data_conclusao', ''),
-                ('responsavel_conclusao', ''),
-            ]:
-                if col in df.columns:
-                    df.at[i, col] = val
+                # tirar de 100% para reaparecer no Gestor
+                if 'porcentagem' in df.columns:
+                    try:
+                        cur = str(df.at[i, 'porcentagem']).strip().replace('%', '')
+                        cur = int(cur) if cur else 0
+                    except Exception:
+                        cur = 0
+                    df.at[i, 'porcentagem'] = 0 if cur >= 100 else cur
+                for col, val in [
+                    ('status', 'Em curso'),
+                    ('Status', 'Em curso'),
+                    ('data_conclusao', ''),
+                    ('responsavel_conclusao', ''),
+                ]:
+                    if col in df.columns:
+                        df.at[i, col] = val
 
-        else:
-            return jsonify({'success': False, 'error': f'Ação inválida: {acao}'}), 400
+            else:
+                return jsonify({'success': False, 'error': f'Ação inválida: {acao}'}), 400
 
-        # --------- normalização/validação ---------
-        after = df.loc[i].to_dict()
-        try:
+            # --------- normalização/validação ---------
+            after = df.loc[i].to_dict()
             try:
-                after = normalize_row(after)
-            except NameError:
-                pass
-            validate_row(after)
-        except Exception as ve:
-            details = getattr(ve, 'errors', None) or getattr(ve, 'args', [None])[0] or []
-            # desfaz alterações na linha
-            df.loc[i] = before
-            return jsonify({'success': False, 'error': 'validation', 'details': details}), 400
-
-        # --------- version++ ---------
-        if 'version' in df.columns:
-            try:
-                curv = int(df.at[i, 'version']) if pd.notna(df.at[i, 'version']) else 0
-            except Exception:
-                curv = 0
-            df.at[i, 'version'] = curv + 1
+                try:
+                    after = normalize_row(after)
+                except NameError:
+                    pass
+                validate_row(after)
+            except Exception as ve:
+                details = getattr(ve, 'errors', None) or getattr(ve, 'args', [None])[0] or []
+                # desfaz alterações na linha
+                df.loc[i] = before
+                return jsonify({'success': False, 'error': 'validation', 'details': details}), 400
+
+            # --------- version++ ---------
+            if 'version' in df.columns:
+                try:
+                    curv = int(df.at[i, 'version']) if pd.notna(df.at[i, 'version']) else 0
+                except Exception:
+                    curv = 0
+                df.at[i, 'version'] = curv + 1
 
-        after = df.loc[i].to_dict()
-        safe_after = _json_safe(after)
-
-        # --------- persistir no Excel do projeto ---------
-        try:
-            projetos = _listar_projetos()
-            if projeto not in projetos:
-                return jsonify({'success': False, 'error': 'Projeto inválido'}), 400
-            target = projetos[projeto]
+            after = df.loc[i].to_dict()
+            safe_after = _json_safe(after)
 
+            # --------- persistir no Excel do projeto ---------
             try:
-                rotate_backups(target)
-            except Exception:
-                pass
-
-            with pd.ExcelWriter(target, engine='openpyxl') as w:
-                # grava por aba (Sheet) apenas as linhas deste projeto
-                df_proj = df[df['Projeto'].astype(str) == str(projeto)]
-                for aba, gdf in df_proj.groupby('Sheet'):
-                    cols = [c for c in gdf.columns if c not in ['Sheet', 'Projeto']]
-                    gdf[cols].to_excel(w, sheet_name=str(aba), index=False)
-        except Exception as e:
-            app.logger.error(f"Erro ao salvar base: {e}", exc_info=True)
-            return jsonify({'success': False, 'error': 'Erro ao salvar alterações'}), 500
+                projetos = _listar_projetos()
+                if projeto not in projetos:
+                    return jsonify({'success': False, 'error': 'Projeto inválido'}), 400
+                target = projetos[projeto]
+
+                # grava só as células alteradas desta tarefa (com backup rotativo)
+                _persistir_tarefa(target, df, i, before, indice, backup=True)
+            except Exception as e:
+                app.logger.error(f"Erro ao salvar base: {e}", exc_info=True)
+                return jsonify({'success': False, 'error': 'Erro ao salvar alterações'}), 500
 
         # --------- auditoria (não bloqueante) ---------
         try:
@@ -686,7 +1130,7 @@ def concluir_tarefa():
         except Exception:
             pass
 
-        return jsonify({'success': True, 'projeto': projeto, 'task': after})
+        return json_response({'success': True, 'projeto': projeto, 'task': after})
 
     except Exception as e:
         app.logger.error(f"Erro em concluir_tarefa: {e}", exc_info=True)
@@ -719,83 +1163,79 @@ def iniciar_tarefa():
         if projeto in (None, "__AMBIGUO__"):
             return jsonify({'success': False, 'error': 'Projeto não encontrado ou ambíguo; envie "projeto".'}), 409
 
-    # carrega df do projeto
-    df = carregar_base_dados(projeto)
-    if df is None or df.empty:
-        return jsonify({'success': False, 'error': 'Projeto sem dados'}), 404
-
-    m = (df['numero'].astype(str) == str(numero)) & (df['Sheet'].astype(str) == str(sheet))
-    idxs = df.index[m].tolist()
-    if not idxs:
-        return jsonify({'success': False, 'error': 'Tarefa não encontrada'}), 404
-    i = idxs[0]
+    with LOCKS.lock(projeto):
+        # carrega df do projeto
+        df, indice = carregar_projeto_indexado(projeto)
+        if df is None or df.empty:
+            return jsonify({'success': False, 'error': 'Projeto sem dados'}), 404
 
-    # não permitir "Em curso" se já concluída
-    try:
-        is_conc = False
-        dur_s   = str(df.at[i, 'duracao'])
-        pct     = int(str(df.at[i, 'porcentagem']).replace('%', '') or 0)
-        c_raw = pd.to_numeric([df.at[i, 'concluida']], errors='coerce')[0]
-        conc  = int(c_raw) if pd.notna(c_raw) else 0
-        if 'conclu' in dur_s.lower() or pct >= 100 or conc >= 1:
-            is_conc = True
-        if is_conc:
-            return jsonify({'success': False, 'error': 'already_done', 'message': 'Tarefa já concluída'}), 409
-    except Exception:
-        pass
+        i = indice.locate(sheet, numero, projeto)
+        if i is None:
+            return jsonify({'success': False, 'error': 'Tarefa não encontrada'}), 404
+        before = df.loc[i].to_dict()
 
-    op = _current_operator()
-
-    dono_atual = str(df.at[i, 'em_curso_by'] or '').strip()
-    ec_raw     = pd.to_numeric([df.at[i, 'em_curso']], errors='coerce')[0]
-    em_curso   = int(ec_raw) if pd.notna(ec_raw) else 0
-    if not op or op in ('system', ''):
-        app.logger.warning(f"❌ Tentativa de iniciar tarefa sem operador válido. Header: {request.headers.get('X-Operator')}, Session: {session.get('user')}")
-        return jsonify({
-            'success': False,
-            'error': 'no_operator',
-            'message': 'Operador não identificado. Faça login e recarregue a página.'
-        }), 401
-    # exclusividade: se já estiver em curso por outra pessoa => 409
-    if em_curso == 1 and dono_atual and dono_atual.lower() != op.lower():
-        return jsonify({'success': False, 'error': 'locked_by_other',
-                        'em_curso_by': dono_atual}), 409
-
-    # marca como em curso pelo operador atual
-    df.at[i, 'em_curso']    = 1
-    df.at[i, 'em_curso_by'] = op
-    if not str(df.at[i, 'inicio_em']).strip():
-        df.at[i, 'inicio_em'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-    df.at[i, 'status'] = 'Em curso'
-
-    # colaboradores e relatório (optativos)
-    if isinstance(colabs, list):
-        colabs = ','.join([str(x).strip() for x in colabs if str(x).strip()])
-    if colabs is not None:
-        df.at[i, 'colaboradores'] = str(colabs).strip()
-    if relato is not None:
-        df.at[i, 'relatorio_progresso'] = str(relato).strip()
-
-    # porcentagem (tolerante)
-    if pct_raw is not None:
+        # não permitir "Em curso" se já concluída
         try:
-            p = int(str(pct_raw).replace('%','').strip() or 0)
+            is_conc = False
+            dur_s   = str(df.at[i, 'duracao'])
+            pct     = int(str(df.at[i, 'porcentagem']).replace('%', '') or 0)
+            c_raw = pd.to_numeric([df.at[i, 'concluida']], errors='coerce')[0]
+            conc  = int(c_raw) if pd.notna(c_raw) else 0
+            if 'conclu' in dur_s.lower() or pct >= 100 or conc >= 1:
+                is_conc = True
+            if is_conc:
+                return jsonify({'success': False, 'error': 'already_done', 'message': 'Tarefa já concluída'}), 409
         except Exception:
-            p = 0
-        df.at[i, 'porcentagem'] = max(0, min(99, p))  # evita "concluir" por 100
+            pass
 
-    # persistência por projeto/aba
-    try:
-        projetos = _listar_projetos()
-        target   = projetos[projeto]
-        with pd.ExcelWriter(target, engine='openpyxl') as w:
-            df_proj = df[df['Projeto'].astype(str) == str(projeto)]
-            for aba, gdf in df_proj.groupby('Sheet'):
-                cols = [c for c in gdf.columns if c not in ['Sheet','Projeto']]
-                gdf[cols].to_excel(w, sheet_name=str(aba), index=False)
-    except Exception as e:
-        app.logger.error(f"Erro ao salvar INICIAR: {e}", exc_info=True)
-        return jsonify({'success': False, 'error': 'Erro ao salvar'}), 500
+        op = _current_operator()
+
+        dono_atual = str(df.at[i, 'em_curso_by'] or '').strip()
+        ec_raw     = pd.to_numeric([df.at[i, 'em_curso']], errors='coerce')[0]
+        em_curso   = int(ec_raw) if pd.notna(ec_raw) else 0
+        if not op or op in ('system', ''):
+            app.logger.warning(f"❌ Tentativa de iniciar tarefa sem operador válido. Header: {request.headers.get('X-Operator')}, Session: {session.get('user')}")
+            return jsonify({
+                'success': False,
+                'error': 'no_operator',
+                'message': 'Operador não identificado. Faça login e recarregue a página.'
+            }), 401
+        # exclusividade: se já estiver em curso por outra pessoa => 409
+        if em_curso == 1 and dono_atual and dono_atual.lower() != op.lower():
+            return jsonify({'success': False, 'error': 'locked_by_other',
+                            'em_curso_by': dono_atual}), 409
+
+        # marca como em curso pelo operador atual
+        df.at[i, 'em_curso']    = 1
+        df.at[i, 'em_curso_by'] = op
+        if not str(df.at[i, 'inicio_em']).strip():
+            df.at[i, 'inicio_em'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        df.at[i, 'status'] = 'Em curso'
+
+        # colaboradores e relatório (optativos)
+        if isinstance(colabs, list):
+            colabs = ','.join([str(x).strip() for x in colabs if str(x).strip()])
+        if colabs is not None:
+            df.at[i, 'colaboradores'] = str(colabs).strip()
+        if relato is not None:
+            df.at[i, 'relatorio_progresso'] = str(relato).strip()
+
+        # porcentagem (tolerante)
+        if pct_raw is not None:
+            try:
+                p = int(str(pct_raw).replace('%','').strip() or 0)
+            except Exception:
+                p = 0
+            df.at[i, 'porcentagem'] = max(0, min(99, p))  # evita "concluir" por 100
+
+        # persistência por projeto/aba
+        try:
+            projetos = _listar_projetos()
+            target   = projetos[projeto]
+            _persistir_tarefa(target, df, i, before, indice)
+        except Exception as e:
+            app.logger.error(f"Erro ao salvar INICIAR: {e}", exc_info=True)
+            return jsonify({'success': False, 'error': 'Erro ao salvar'}), 500
 
     try:
         audit_log({
@@ -810,7 +1250,7 @@ def iniciar_tarefa():
     except Exception:
         pass
 
-    return jsonify({'success': True, 'task': _json_safe(df.loc[i].to_dict()), 'projeto': projeto})
+    return json_response({'success': True, 'task': df.loc[i].to_dict(), 'projeto': projeto})
 
 
 @app.post('/atualizar-progresso')
@@ -835,51 +1275,47 @@ def atualizar_progresso():
         if projeto in (None, "__AMBIGUO__"):
             return jsonify({'success': False, 'error': 'Projeto não encontrado/ambíguo'}), 409
 
-    df = carregar_base_dados(projeto)
-    if df is None or df.empty:
-        return jsonify({'success': False, 'error': 'Projeto sem dados'}), 404
-
-    m = (df['numero'].astype(str) == str(numero)) & (df['Sheet'].astype(str) == str(sheet))
-    idxs = df.index[m].tolist()
-    if not idxs:
-        return jsonify({'success': False, 'error': 'Tarefa não encontrada'}), 404
-    i = idxs[0]
-
-    # precisa estar em curso
-    if int(df.at[i, 'em_curso'] or 0) != 1:
-        return jsonify({'success': False, 'error': 'not_in_progress'}), 409
-
-    op = _current_operator()
-    dono = str(df.at[i, 'em_curso_by'] or '').strip()
-    if dono and dono.lower() != op.lower():
-        return jsonify({'success': False, 'error': 'locked_by_other', 'em_curso_by': dono}), 409
-
-    if isinstance(colabs, list):
-        colabs = ','.join([str(x).strip() for x in colabs if str(x).strip()])
-    if colabs is not None:
-        df.at[i, 'colaboradores'] = str(colabs).strip()
-    if relato is not None:
-        df.at[i, 'relatorio_progresso'] = str(relato).strip()
-
-    if pct_raw is not None:
-        try:
-            p = int(str(pct_raw).replace('%','').strip() or 0)
-        except Exception:
-            p = 0
-        df.at[i, 'porcentagem'] = max(0, min(99, p))  # 100% = concluir pelo fluxo correto
+    with LOCKS.lock(projeto):
+        df, indice = carregar_projeto_indexado(projeto)
+        if df is None or df.empty:
+            return jsonify({'success': False, 'error': 'Projeto sem dados'}), 404
 
-    # salva
-    try:
-        projetos = _listar_projetos()
-        target   = projetos[projeto]
-        with pd.ExcelWriter(target, engine='openpyxl') as w:
-            df_proj = df[df['Projeto'].astype(str) == str(projeto)]
-            for aba, gdf in df_proj.groupby('Sheet'):
-                cols = [c for c in gdf.columns if c not in ['Sheet','Projeto']]
-                gdf[cols].to_excel(w, sheet_name=str(aba), index=False)
-    except Exception as e:
-        app.logger.error(f"Erro ao salvar ATUALIZAR: {e}", exc_info=True)
-        return jsonify({'success': False, 'error': 'Erro ao salvar'}), 500
+        i = indice.locate(sheet, numero, projeto)
+        if i is None:
+            return jsonify({'success': False, 'error': 'Tarefa não encontrada'}), 404
+        before = df.loc[i].to_dict()
+
+        # precisa estar em curso
+        if int(df.at[i, 'em_curso'] or 0) != 1:
+            return jsonify({'success': False, 'error': 'not_in_progress'}), 409
+
+        op = _current_operator()
+        dono = str(df.at[i, 'em_curso_by'] or '').strip()
+        if dono and dono.lower() != op.lower():
+            return jsonify({'success': False, 'error': 'locked_by_other', 'em_curso_by': dono}), 409
+
+        if isinstance(colabs, list):
+            colabs = ','.join([str(x).strip() for x in colabs if str(x).strip()])
+        if colabs is not None:
+            df.at[i, 'colaboradores'] = str(colabs).strip()
+        if relato is not None:
+            df.at[i, 'relatorio_progresso'] = str(relato).strip()
+
+        if pct_raw is not None:
+            try:
+                p = int(str(pct_raw).replace('%','').strip() or 0)
+            except Exception:
+                p = 0
+            df.at[i, 'porcentagem'] = max(0, min(99, p))  # 100% = concluir pelo fluxo correto
+
+        # salva
+        try:
+            projetos = _listar_projetos()
+            target   = projetos[projeto]
+            _persistir_tarefa(target, df, i, before, indice)
+        except Exception as e:
+            app.logger.error(f"Erro ao salvar ATUALIZAR: {e}", exc_info=True)
+            return jsonify({'success': False, 'error': 'Erro ao salvar'}), 500
 
     try:
         audit_log({
@@ -892,64 +1328,120 @@ def atualizar_progresso():
     except Exception:
         pass
 
-    return jsonify({'success': True, 'task': _json_safe(df.loc[i].to_dict()), 'projeto': projeto})
+    return json_response({'success': True, 'task': df.loc[i].to_dict(), 'projeto': projeto})
 
 
 
 # -----------------------------------------------------------------------------
 # DASHBOARD
 # -----------------------------------------------------------------------------
-@app.route('/dashboard-metrics', methods=['POST'])
+# Agregados materializados: por projeto, contagem de tarefas por
+# (categoria, fase, condicao, concluída, prazo < 7). O cubo é montado uma vez
+# por carga (CACHE_PROJETOS.derived) e as mutações ainda no JOURNAL levam o seu
+# delta no campo 'agg' da op; o dashboard filtra/soma as células do cubo, sem
+# percorrer as tarefas.
+_AGG_COLS = ['categoria', 'fase', 'condicao', 'is_concluida', 'curta']
+
+def _chaves_agregado(df):
+    """Colunas-chave do cubo (mesmos critérios do cálculo linha a linha do dashboard)."""
+    duracao = df['duracao'] if 'duracao' in df.columns else pd.Series(0, index=df.index)
+    dur_num = pd.to_numeric(duracao, errors='coerce').fillna(0).astype(int)
+    pct_num = pd.to_numeric(df.get('porcentagem', 0), errors='coerce').fillna(0).astype(int)
+    conc_num = pd.to_numeric(df.get('concluida', 0), errors='coerce').fillna(0).astype(int)
+    is_conc = ((conc_num >= 1) | (pct_num >= 100) |
+               duracao.astype(str).str.contains('conclu', case=False, na=False)).astype(int)
+    out = pd.DataFrame({c: df[c].astype(object) if c in df.columns else '' for c in _AGG_COLS[:3]},
+                       index=df.index)
+    out['is_concluida'] = is_conc
+    out['curta'] = (dur_num < 7).astype(int)
+    return out
+
+def _norm_chave(chave):
+    """NaN/None → np.nan (um único objeto, para valer como chave de dict)."""
+    return tuple(np.nan if (v is None or (isinstance(v, float) and v != v)) else v for v in chave)
+
+def _cubo_agregado(df):
+    from collections import Counter
+    if df is None or df.empty:
+        return Counter()
+    k = _chaves_agregado(df)
+    return Counter(_norm_chave(t) for t in zip(*(k[c].tolist() for c in _AGG_COLS)))
+
+def _delta_agregado(before, after):
+    """Delta do cubo para uma mutação: [[chave, -1], [chave, +1]] (JSON-safe; vazio se igual)."""
+    linhas = [r for r in (before, after) if r is not None]
+    chaves = [_norm_chave(t) for t in
+              _chaves_agregado(pd.DataFrame(linhas))[_AGG_COLS].itertuples(index=False, name=None)]
+    antes = chaves[0] if before is not None else None
+    depois = chaves[-1] if after is not None else None
+    if antes == depois:
+        return []
+    json_key = lambda c: [_json_safe(v.item() if hasattr(v, 'item') else v) for v in c]
+    delta = []
+    if antes is not None:
+        delta.append([json_key(antes), -1])
+    if depois is not None:
+        delta.append([json_key(depois), 1])
+    return delta
+
+def _agregados_projeto(nome_proj, path):
+    """Cubo atual do projeto: cubo da carga em cache + deltas das ops pendentes."""
+    with LOCKS.lock(nome_proj):
+        dfp = CACHE_PROJETOS.get(nome_proj, path, _carregar_projeto_snapshot)
+        if dfp is None:
+            return {}
+        cubo = CACHE_PROJETOS.derived(nome_proj, 'agregados', dfp, _cubo_agregado)
+        pendentes = JOURNAL.pending(nome_proj)
+    if not any(op.get('agg') for op in pendentes):
+        return cubo
+    cubo = cubo.copy()
+    for op in pendentes:
+        for chave, inc in op.get('agg') or ():
+            cubo[_norm_chave(chave)] += inc
+    return cubo
+
+def _agregados(projeto=None):
+    """Soma dos cubos parciais dos projetos no escopo (mesmo escopo de carregar_base_dados)."""
+    from collections import Counter
+    projetos = _listar_projetos()
+    alvos = {projeto: projetos[projeto]} if (projeto and projeto in projetos) else projetos
+    total = Counter()
+    for nome_proj, path in alvos.items():
+        total.update(_agregados_projeto(nome_proj, path))
+    return total
+
+@app.route('/dashboard-metrics', methods=['GET', 'POST'])
 def dashboard_metrics():
-    data = request.get_json(force=True, silent=True) or {}
-    projeto   = data.get('projeto')
-    categoria = data.get('categoria', '')
-    condicoes = data.get('condicoes', {})
+    projeto, categoria, condicoes = _params_filtro()
+    return _resposta_condicional(_variante_filtro('dashboard-metrics', projeto, categoria, condicoes),
+                                 projeto, lambda: _dashboard_metrics(projeto, categoria, condicoes))
 
-    df = carregar_base_dados(projeto)
+def _dashboard_metrics(projeto, categoria, condicoes):
+    # cubo de contagens (uma linha por combinação; 'n' = nº de tarefas)
+    cubo = _agregados(projeto)
+    df = pd.DataFrame([k + (n,) for k, n in cubo.items() if n > 0], columns=_AGG_COLS + ['n'])
 
-    if df is None or df.empty:
+    if df.empty:
         return jsonify({'total': 0, 'percent_concluidas': 0, 'criticas_abertas': 0, 'atrasadas': 0,
                         'por_prioridade': {}, 'por_fase': {}, 'por_categoria': {}})
 
-    # Normalizações seguras
-    df['duracao_str'] = df.get('duracao', '').astype(str)
-    df['duracao_num'] = pd.to_numeric(df.get('duracao', 0), errors='coerce').fillna(0).astype(int)
-    df['pct_num']     = pd.to_numeric(df.get('porcentagem', 0), errors='coerce').fillna(0).astype(int)
-    df['conc_num']    = pd.to_numeric(df.get('concluida', 0), errors='coerce').fillna(0).astype(int)
-
-    # Sinal unificado de conclusão (qualquer um vale)
-    df['is_concluida'] = (
-        (df['conc_num'] >= 1) |
-        (df['pct_num'] >= 100) |
-        (df['duracao_str'].str.contains('conclu', case=False, na=False))
-    ).astype(int)
-
-    # Filtro por categoria (se vier)
-    if categoria:
-        df = df[df['categoria'] == categoria]
-
-    # Filtro por condições (fase/condição) – igual ao seu, só reaplicado antes do cômputo
-    if condicoes:
-        def tarefa_valida(row):
-            fase = str(row.get('fase',''))
-            cond = str(row.get('condicao','')).strip()
-            return fase in condicoes and cond in (condicoes.get(fase) or [])
-        df = df[df.apply(tarefa_valida, axis=1)]
+    # Filtros por categoria e condições (fase/condição) – mesmo critério do /gerar-cronograma
+    df = _filtrar_tarefas(df, categoria, condicoes)
 
-    total       = int(len(df))
-    concluidas  = int(df['is_concluida'].sum())
-    criticas_ab = int(len(df[(df['is_concluida'] != 1) & (df['condicao'] == 'Sempre')]))
-    atrasadas   = int(len(df[(df['is_concluida'] != 1) & (df['duracao_num'] < 7)]))
+    abertas     = df['is_concluida'] != 1
+    total       = int(df['n'].sum())
+    concluidas  = int(df.loc[df['is_concluida'] == 1, 'n'].sum())
+    criticas_ab = int(df.loc[abertas & (df['condicao'] == 'Sempre'), 'n'].sum())
+    atrasadas   = int(df.loc[abertas & (df['curta'] == 1), 'n'].sum())
 
     return jsonify({
         'total': total,
         'percent_concluidas': round((concluidas/total*100), 1) if total else 0,
         'criticas_abertas': criticas_ab,
         'atrasadas': atrasadas,
-        'por_prioridade': df.groupby('condicao').size().to_dict(),
-        'por_fase': df.groupby('fase').size().to_dict(),
-        'por_categoria': df.groupby('categoria').size().to_dict()
+        'por_prioridade': {k: int(v) for k, v in df.groupby('condicao')['n'].sum().items()},
+        'por_fase': {k: int(v) for k, v in df.groupby('fase')['n'].sum().items()},
+        'por_categoria': {k: int(v) for k, v in df.groupby('categoria')['n'].sum().items()}
     })
 
 # -----------------------------------------------------------------------------
@@ -962,9 +1454,9 @@ def adicionar_tarefa():
     Mantém o fluxo essencial:
       - normalização de payload
       - numeração por aba
-      - escrita via pandas por projeto/aba
+      - escrita pontual (append da linha) na aba do projeto
     Adições:
-      - task_uuid (v4) e version=1
+      - task_uuid (determinístico: projeto+aba+número) e version=1
       - project_uuid (determinístico por projeto)
       - prevenção de numero duplicado (409 com sugestão)
       - validação tolerante de esquema (400 com details)
@@ -1023,89 +1515,84 @@ def adicionar_tarefa():
         except Exception:
             pct = 0
 
-        # ---------- Verificações de projeto e carga do DF ----------
-        projetos = _listar_projetos()
-        if projeto not in projetos:
-            return jsonify({'success': False, 'error': 'Projeto inválido'}), 400
+        with LOCKS.lock(projeto):
+            # ---------- Verificações de projeto e carga do DF ----------
+            projetos = _listar_projetos()
+            if projeto not in projetos:
+                return jsonify({'success': False, 'error': 'Projeto inválido'}), 400
 
-        # carrega DF do projeto (já garante colunas extras e uuids na carga)
-        df = carregar_base_dados(projeto)
+            # carrega DF do projeto (já garante colunas extras e uuids na carga)
+            df = carregar_base_dados(projeto)
 
-        # ---------- Numeração (previne duplicata e sugere número livre) ----------
-        existentes = set(
-            pd.to_numeric(
-                df.loc[(df['Projeto'] == projeto) & (df['Sheet'] == aba), 'numero'],
-                errors='coerce'
-            ).dropna().astype(int).tolist()
-        )
+            # ---------- Numeração (previne duplicata e sugere número livre) ----------
+            existentes = set(
+                pd.to_numeric(
+                    df.loc[(df['Projeto'] == projeto) & (df['Sheet'] == aba), 'numero'],
+                    errors='coerce'
+                ).dropna().astype(int).tolist()
+            )
 
-        if data.get('numero') is not None:
+            if data.get('numero') is not None:
+                try:
+                    numero = int(str(data.get('numero')))
+                except Exception:
+                    return jsonify({'success': False, 'error': 'Número inválido'}), 400
+                if numero in existentes:
+                    return jsonify({
+                        'success': False,
+                        'error': 'numero_duplicado',
+                        'message': f'Número {numero} já existe em {projeto}/{aba}.',
+                        'suggested_numero': (max(existentes) + 1) if existentes else 1
+                    }), 409
+            else:
+                # escolhe o próximo LIVRE (não apenas max+1) — evita colisões em buracos
+                numero = 1
+                while numero in existentes:
+                    numero += 1
+
+            # ---------- Montagem da nova linha (mantendo seu esquema) ----------
+            nova = {
+                'numero': numero,
+                'classificacao': classificacao,         # opcional; NÃO é prioridade
+                'categoria': categoria,
+                'fase': fase,                           # pode ser livre
+                'condicao': condicao,                   # opcional; se vier, validada (Sempre/A/B/C)
+                'nome': nome,
+                'duracao': dur,
+                'como_fazer': como_fazer,
+                'documento_referencia': doc_ref,
+                'porcentagem': pct,
+                'concluida': 0,
+                'Sheet': aba,
+                'Projeto': projeto,
+
+                # >>> NOVO: segurança/consistência por tarefa <<<
+                'task_uuid': stable_task_uuid(_project_uuid(projeto), aba, numero),
+                'version': 1,
+                'project_uuid': _project_uuid(projeto),
+            }
+
+            # Log útil para debug (não polui produção)
+            app.logger.debug(f"ADD nova linha: {{'numero': {numero}, 'nome': '{nome}', 'fase': '{fase}', "
+                             f"'condicao': '{condicao}', 'classificacao': '{classificacao}', 'duracao': {dur}, "
+                             f"'Sheet': '{aba}', 'Projeto': '{projeto}'}}")
+
+            # ---------- Validação tolerante ----------
             try:
-                numero = int(str(data.get('numero')))
-            except Exception:
-                return jsonify({'success': False, 'error': 'Número inválido'}), 400
-            if numero in existentes:
-                return jsonify({
-                    'success': False,
-                    'error': 'numero_duplicado',
-                    'message': f'Número {numero} já existe em {projeto}/{aba}.',
-                    'suggested_numero': (max(existentes) + 1) if existentes else 1
-                }), 409
-        else:
-            # escolhe o próximo LIVRE (não apenas max+1) — evita colisões em buracos
-            numero = 1
-            while numero in existentes:
-                numero += 1
-
-        # ---------- Montagem da nova linha (mantendo seu esquema) ----------
-        nova = {
-            'numero': numero,
-            'classificacao': classificacao,         # opcional; NÃO é prioridade
-            'categoria': categoria,
-            'fase': fase,                           # pode ser livre
-            'condicao': condicao,                   # opcional; se vier, validada (Sempre/A/B/C)
-            'nome': nome,
-            'duracao': dur,
-            'como_fazer': como_fazer,
-            'documento_referencia': doc_ref,
-            'porcentagem': pct,
-            'concluida': 0,
-            'Sheet': aba,
-            'Projeto': projeto,
-
-            # >>> NOVO: segurança/consistência por tarefa <<<
-            'task_uuid': str(uuid.uuid4()),
-            'version': 1,
-            'project_uuid': _project_uuid(projeto),
-        }
+                validate_row(nova)
+            except ValidationError as ve:
+                app.logger.warning(f"Validação falhou ao adicionar: {ve.errors}")
+                return jsonify({'success': False, 'error': 'validation', 'details': ve.errors}), 400
 
-        # Log útil para debug (não polui produção)
-        app.logger.debug(f"ADD nova linha: {{'numero': {numero}, 'nome': '{nome}', 'fase': '{fase}', "
-                         f"'condicao': '{condicao}', 'classificacao': '{classificacao}', 'duracao': {dur}, "
-                         f"'Sheet': '{aba}', 'Projeto': '{projeto}'}}")
-
-        # ---------- Validação tolerante ----------
-        try:
-            validate_row(nova)
-        except ValidationError as ve:
-            app.logger.warning(f"Validação falhou ao adicionar: {ve.errors}")
-            return jsonify({'success': False, 'error': 'validation', 'details': ve.errors}), 400
-
-        # ---------- Append no DF do projeto (mantendo sua abordagem com pandas) ----------
-        df = pd.concat([df, pd.DataFrame([nova])], ignore_index=True)
-
-        # ---------- Persistência com backup rotativo (somente o XLSX do projeto) ----------
-        target = projetos[projeto]
-        try:
-            rotate_backups(target)
-        except Exception:
-            # backup falhou não deve impedir a escrita — apenas registra log
-            app.logger.exception("Falha ao criar backup rotativo antes de salvar")
-
-        with pd.ExcelWriter(target, engine='openpyxl') as w:
-            for sname, gdf in df[df['Projeto'] == projeto].groupby('Sheet'):
-                cols = [c for c in gdf.columns if c not in ['Sheet', 'Projeto']]
-                gdf[cols].to_excel(w, sheet_name=sname, index=False)
+            # ---------- Persistência com backup rotativo (somente o XLSX do projeto) ----------
+            target = projetos[projeto]
+            # acrescenta só a nova linha na aba (demais células/formatação intactas)
+            _gravar_ops(projeto, target, [{
+                'op': 'append',
+                'sheet': aba,
+                'values': {k: v for k, v in nova.items() if k not in _COLS_NAO_PERSISTIDAS},
+                'agg': _delta_agregado(None, nova),
+            }], backup=True)
 
         # ---------- Auditoria ----------
         audit_log({
@@ -1117,7 +1604,7 @@ def adicionar_tarefa():
             'after': nova
         })
 
-        return jsonify({'success': True, 'sheet': aba, 'projeto': projeto, 'task': nova}), 200
+        return json_response({'success': True, 'sheet': aba, 'projeto': projeto, 'task': nova}), 200
 
     except ValidationError as ve:
         # fallback (se por alguma razão levantar aqui)
@@ -1133,24 +1620,28 @@ def adicionar_tarefa():
 @app.route('/listar-abas')
 def listar_abas():
     projeto = request.args.get('projeto') or request.headers.get('X-Projeto')
+    return _resposta_condicional(['listar-abas', projeto or ''], projeto, lambda: _listar_abas(projeto))
+
+def _listar_abas(projeto):
     projetos = _listar_projetos()
+    if ARMAZENAMENTO is not None:
+        if projeto and projeto in projetos:
+            return jsonify(ARMAZENAMENTO.abas(projeto))
+        return jsonify({nome: ARMAZENAMENTO.abas(nome) for nome in projetos})
     if projeto and projeto in projetos:
-        planilha = pd.read_excel(projetos[projeto], sheet_name=None, engine="openpyxl")
-        return jsonify(list(planilha.keys()))
-    # sem projeto → retorna dict {projeto:[abas]}
-    resp = {}
-    for nome, path in projetos.items():
-        try:
-            sheets = pd.read_excel(path, sheet_name=None, engine="openpyxl").keys()
-            resp[nome] = list(sheets)
-        except:
-            resp[nome] = []
-    return jsonify(resp)
+        return jsonify(abas_workbook(projetos[projeto]))
+    # sem projeto → retorna dict {projeto:[abas]} (só os nomes; leitura paralela se ligada)
+    abas = abas_workbooks(list(projetos.values()))
+    return jsonify({nome: abas.get(path, []) for nome, path in projetos.items()})
 
 @app.route('/categorias-usadas')
 def categorias_usadas():
+    projeto = request.args.get('projeto') or request.headers.get('X-Projeto')
+    return _resposta_condicional(['categorias-usadas', projeto or ''], projeto,
+                                 lambda: _categorias_usadas(projeto))
+
+def _categorias_usadas(projeto):
     try:
-        projeto = request.args.get('projeto') or request.headers.get('X-Projeto')
         df = carregar_base_dados(projeto)
         cats = sorted([str(c).strip() for c in df['categoria'].dropna().unique().tolist() if str(c).strip()])
         return jsonify(cats)
@@ -1161,14 +1652,24 @@ def categorias_usadas():
 def _descobrir_projeto_por_tarefa(numero: int, sheet: str | None):
     """Procura em TODOS os .xlsx e retorna o nome do projeto em que (numero, sheet) existe.
        Se encontrar único match → retorna str. Se nenhum → None. Se mais de um → "__AMBIGUO__".
+       Usa o LOCALIZADOR; só reindexa projetos cujo arquivo (ou journal) mudou.
     """
-    df_all = carregar_base_dados(projeto=None)
-    if df_all is None or df_all.empty:
+    try:
+        projetos = _listar_projetos()
+    except Exception:
         return None
-    m = (df_all['numero'] == int(numero))
-    if sheet:
-        m = m & (df_all['Sheet'].astype(str) == str(sheet))
-    hits = df_all.loc[m, 'Projeto'].dropna().unique().tolist()
+    LOCALIZADOR.retain(projetos)
+    for nome_proj, path in projetos.items():
+        token = _token_projeto(nome_proj, path)
+        if LOCALIZADOR.is_current(nome_proj, token):
+            continue
+        try:
+            _, indice = _projeto_atual(nome_proj, path)
+        except Exception:
+            logger.exception(f"Localizador: falha ao indexar {nome_proj}")
+            indice = None
+        LOCALIZADOR.update(nome_proj, token, indice)
+    hits = LOCALIZADOR.locate(numero, sheet)
     if not hits:
         return None
     if len(hits) == 1:
@@ -1194,6 +1695,7 @@ def exportar_projeto():
     df = carregar_base_dados(projeto)
     if df is None or df.empty:
         return "Projeto não encontrado ou sem dados", 404
+    df = df.drop(columns=['fase_key'], errors='ignore')
 
     output = BytesIO()
 
@@ -1235,9 +1737,16 @@ def exportar_projeto():
 
 @app.route('/listar-projetos')
 def listar_projetos():
-    return jsonify(sorted(_listar_projetos().keys()))
+    return _resposta_condicional(['listar-projetos'], None,
+                                 lambda: jsonify(sorted(_listar_projetos().keys())))
 
 def _listar_projetos():
+    """Retorna {nome_projeto: caminho_arquivo} (no backend SQLite: {nome_projeto: 'sqlite:<nome>'})."""
+    if ARMAZENAMENTO is not None:
+        return {nome: _SQLITE_REF + nome for nome in ARMAZENAMENTO.projetos()}
+    return _listar_xlsx()
+
+def _listar_xlsx():
     """Retorna {nome_projeto: caminho_arquivo} para todos .xlsx.
     1ª preferência: /data; se vazio, cai para a raiz do projeto.
     """
@@ -1249,10 +1758,43 @@ def _listar_projetos():
         paths = glob.glob(os.path.join(BASE_DIR, "*.xlsx"))
 
     for path in paths:
+        if arquivo_ignorado(path):  # temporários de upload / lock do Excel
+            continue
         nome = os.path.splitext(os.path.basename(path))[0]
         projetos[nome] = path
     return projetos
 
+# Repositório único de leitura: o Chatbot montado consulta os mesmos DFs em cache
+# (visão 'chatbot', com as colunas no formato dele) em vez de manter uma cópia própria
+REPOSITORIO = DataRepository(listar=_listar_projetos, carregar=carregar_base_dados, geracao=_geracao_dados)
+configurar_repositorio(REPOSITORIO)
+
+# Backend SQLite: planilhas de data/ que ainda não estão no banco são importadas na subida
+if ARMAZENAMENTO is not None:
+    for _nome, _path in _listar_xlsx().items():
+        if ARMAZENAMENTO.signature(_nome) is None:
+            try:
+                _importar_sqlite(_nome, _path)
+            except Exception:
+                logger.exception(f"Falha importando {_path} para o SQLite")
+
+@app.post('/importar-xlsx')
+def importar_xlsx():
+    """Backend SQLite: reimporta do .xlsx (substituindo o banco) um projeto ou todos."""
+    if ARMAZENAMENTO is None:
+        return jsonify({'success': False, 'error': 'Disponível só com STORAGE_BACKEND=sqlite'}), 400
+    data = request.get_json(force=True, silent=True) or {}
+    projeto = data.get('projeto') or request.args.get('projeto')
+    planilhas = _listar_xlsx()
+    if projeto and projeto not in planilhas:
+        return jsonify({'success': False, 'error': 'Planilha não encontrada'}), 404
+    alvos = {projeto: planilhas[projeto]} if projeto else planilhas
+    importados = {}
+    for nome_proj, path in alvos.items():
+        with LOCKS.lock(nome_proj):
+            importados[nome_proj] = _importar_sqlite(nome_proj, path)
+    return jsonify({'success': True, 'importados': importados})
+
 from openpyxl import Workbook
 from werkzeug.utils import secure_filename
 
@@ -1272,15 +1814,19 @@ def criar_projeto():
     fname = secure_filename(nome)
     path = os.path.join(DATA_DIR, fname)
 
-    if os.path.exists(path):
-        return jsonify({'success': False, 'error': 'Já existe um projeto com esse nome'}), 400
+    with LOCKS.lock(os.path.splitext(fname)[0]):
+        if os.path.exists(path) or os.path.splitext(fname)[0] in _listar_projetos():
+            return jsonify({'success': False, 'error': 'Já existe um projeto com esse nome'}), 400
 
-    # cria workbook com uma aba padrão
-    wb = Workbook()
-    ws = wb.active
-    ws.title = 'Backlog'
-    ws.append(COLS_PADRAO)
-    wb.save(path)
+        # cria workbook com uma aba padrão
+        wb = Workbook()
+        ws = wb.active
+        ws.title = 'Backlog'
+        ws.append(COLS_PADRAO)
+        save_workbook_atomic(wb, path)
+        if ARMAZENAMENTO is not None:
+            _importar_sqlite(os.path.splitext(fname)[0], path)
+    WATCHER.notify(path)
 
     return jsonify({'success': True, 'projeto': os.path.splitext(fname)[0]})
 
@@ -1296,18 +1842,45 @@ def upload_projeto():
 
     fname = secure_filename(f.filename)
     dest = os.path.join(DATA_DIR, fname)
-    f.save(dest)
-
-    # valida leitura (opcional): tenta abrir para garantir que não corrompeu
+    # recebe num temporário (fora do glob *.xlsx) e só troca depois de validar
+    tmp = os.path.join(DATA_DIR, f".{fname}.{os.getpid()}.upload")
     try:
-        _ = pd.read_excel(dest, sheet_name=None, engine='openpyxl')
-    except Exception as e:
-        os.remove(dest)
-        return jsonify({'success': False, 'error': f'Planilha inválida: {e}'}), 400
+        f.save(tmp)
+        try:
+            _ = pd.read_excel(tmp, sheet_name=None, engine='openpyxl')
+        except Exception as e:
+            return jsonify({'success': False, 'error': f'Planilha inválida: {e}'}), 400
+
+        # mutações pendentes vão para o arquivo antigo antes de ele ser substituído
+        JOURNAL.flush()
+        with LOCKS.lock(os.path.splitext(fname)[0]):
+            os.replace(tmp, dest)
+            if ARMAZENAMENTO is not None:
+                _importar_sqlite(os.path.splitext(fname)[0], dest)
+        WATCHER.notify(dest)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
 
     return jsonify({'success': True, 'projeto': os.path.splitext(fname)[0]})
 
 
+# -----------------------------------------------------------------------------
+# DIAGNÓSTICO
+# -----------------------------------------------------------------------------
+@app.get('/diagnostico')
+def diagnostico():
+    """Contadores internos (cache, snapshots, journal, locks, localizador, gerações, compressão, watcher...)."""
+    resp = jsonify({'cache_projetos': CACHE_PROJETOS.stats(), 'snapshots': SNAPSHOTS.stats(),
+                    'journal': JOURNAL.stats(),
+                    'locks': LOCKS.stats(), 'localizador': LOCALIZADOR.stats(),
+                    'geracoes': GERACOES.stats(), 'compressao': COMPRESSAO.stats(),
+                    'watcher': WATCHER.stats(), 'repositorio': REPOSITORIO.stats(),
+                    'armazenamento': ARMAZENAMENTO.stats() if ARMAZENAMENTO is not None
+                                     else {'backend': STORAGE_BACKEND}})
+    resp.headers["Cache-Control"] = "no-store"
+    return resp
+
 
 # =============================================================================
 # ============================== LOGIN  =====================================
@@ -1441,6 +2014,11 @@ def _no_cache(resp):
     return resp
 
 
+@app.after_request
+def _comprimir(resp):
+    return COMPRESSAO.process(resp, request.accept_encodings, request.endpoint)
+
+
 
 
 
@@ -1469,28 +2047,14 @@ def deaccent(s):
     s = unicodedata.normalize("NFD", str(s))
     return "".join(ch for ch in s if unicodedata.category(ch) != "Mn")
 
-def tokenize(text):
-    if pd.isna(text): return set()
+def tokenize_list(text):
+    """Termos do texto em ordem, com repetição (tf do BM25), sem acentos nem stop words."""
+    if text is None or pd.isna(text): return []
     base = deaccent(str(text)).lower()
-    toks = set(re.findall(r"[a-z0-9]+", base))
-    return toks - STOP_WORDS
-
-def jaccard(a, b):
-    if not a and not b: return 0.0
-    inter = len(a & b)
-    union = len(a | b) if (a | b) else 1
-    return inter / union
-
-def score_row(query_tokens, row, fields):
-    score = 0.0
-    query_phrase = " ".join(sorted(query_tokens)) if query_tokens else ""
-    for f in fields:
-        val_norm = deaccent(str(row.get(f, ""))).lower()
-        toks = tokenize(val_norm)
-        score += jaccard(query_tokens, toks)
-        if val_norm and query_phrase and query_phrase in val_norm:
-            score += 0.1
-    return score
+    return [t for t in re.findall(r"[a-z0-9]+", base) if t not in STOP_WORDS]
+
+def tokenize(text):
+    return set(tokenize_list(text))
 
 def status_label(p01):
     if pd.isna(p01) or p01 <= 0: return "Não iniciada"
@@ -1561,10 +2125,64 @@ def repair_malformed_rows(df: pd.DataFrame, sep: str, expected_cols):
 
 DF = None
 SEARCH_FIELDS = ["Nome","ComoFazer","Categoria","Fase","Condicao"]
+# pesos por campo no BM25F: o nome da tarefa vale mais que o passo a passo
+SEARCH_WEIGHTS = {"Nome": 3.0, "ComoFazer": 1.0, "Categoria": 1.5, "Fase": 1.0, "Condicao": 0.5}
+# fração mínima dos termos da pergunta que a melhor tarefa precisa conter
+SEARCH_MIN_COVERAGE = 0.5
+
+# Índice invertido da busca; load_dataset() o reconstrói re-tokenizando só as linhas novas/alteradas
+INDICE_BUSCA = BM25Index(SEARCH_WEIGHTS, tokenizar=tokenize_list, normalizar=lambda s: deaccent(s).lower())
+
+# Resumos por Projeto / Fase e pendentes ordenados, calculados uma vez em load_dataset()
+RESUMO_PROJETO = None
+RESUMO_FASE = None
+PENDENTES = None
+
+# Geração do DF (muda a cada load_dataset) e respostas já montadas das intenções determinísticas
+DF_GERACAO = 0
+RESPOSTAS_CHAT = ResponseMemo()
+# load_dataset troca DF, resumos, índice e geração de uma vez sob este lock; a geração
+# sobe por último, então quem a lê já nova também enxerga o DF novo
+_DF_LOCK = threading.Lock()
+
+def _colunas_estado(df):
+    """Colunas de estado da tarefa (o % vazio conta como 0), usadas pelos resumos e filtros."""
+    p01 = df["_pct01"].fillna(0)
+    dur = df["_dur"].fillna(0)
+    df["_finalizada"]   = p01 >= 1.0
+    df["_em_andamento"] = (p01 > 0) & (p01 < 1.0)
+    df["_nao_iniciada"] = p01 == 0
+    df["_tempo_conc"]   = dur * p01
+    df["_faltante"]     = dur * (1 - p01)
+    df["_cond_lower"]   = df["Condicao"].astype(str).str.lower()
+    return df
+
+def _resumo_projeto(df):
+    g = df.groupby("Projeto", dropna=False)
+    total_qtde = g.size()
+    concl = g["_finalizada"].sum()
+    return pd.DataFrame({
+        "Tarefas": total_qtde, "Tempo total": g["_dur"].sum(min_count=1),
+        "Andamento médio (%)": g["_pct01"].mean() * 100.0,
+        "Não finalizado médio (%)": (1 - (concl / total_qtde.replace(0, pd.NA))) * 100.0,
+        "Finalizadas": concl, "Em andamento": g["_em_andamento"].sum(), "Não iniciadas": g["_nao_iniciada"].sum()
+    }).sort_values("Não finalizado médio (%)", ascending=False)
+
+def _resumo_fase(df):
+    g = df.groupby("Fase", dropna=False)
+    total = g.size()
+    concl = g["_finalizada"].sum()
+    return pd.DataFrame({
+        "Tarefas": total, "Finalizadas": concl, "Em andamento": g["_em_andamento"].sum(),
+        "Não iniciadas": g["_nao_iniciada"].sum(), "Andamento médio (%)": g["_pct100"].mean(),
+        "Não finalizado médio (%)": (1 - (concl / total.replace(0, pd.NA))) * 100.0,
+        "Tempo total": g["_dur"].sum(min_count=1),
+        "Tempo concluído": df["_tempo_conc"].groupby(df["Fase"]).sum(min_count=1),
+        "Tempo a concluir": df["_faltante"].groupby(df["Fase"]).sum(min_count=1)
+    }).sort_values(["Em andamento","Não iniciadas"], ascending=False)
 
 def load_dataset():
-    """Carrega 'Conjuntas_combinado.csv' da raiz do app."""
-    global DF
+    """Carrega 'Conjuntas_combinado.csv' da raiz do app (e recalcula índice de busca e resumos)."""
     candidates = [
         os.path.join(BASE_DIR, "Conjuntas_combinado.csv"),
         "Conjuntas_combinado.csv"
@@ -1572,7 +2190,7 @@ def load_dataset():
     csv_path = next((p for p in candidates if os.path.exists(p)), None)
     if not csv_path:
         print("ERRO: Coloque 'Conjuntas_combinado.csv' na pasta do app.")
-        DF = None
+        _publicar_dataset(None)
         return
 
     df, sep, enc = safe_read_csv(csv_path)
@@ -1603,9 +2221,21 @@ def load_dataset():
     df["_pct100"] = df["_pct01"] * 100.0
 
     df[SEARCH_FIELDS] = df[SEARCH_FIELDS].fillna("")
-    DF = df
+    df = _colunas_estado(df)
+    _publicar_dataset(df, INDICE_BUSCA.preparar(df), _resumo_projeto(df), _resumo_fase(df),
+                      df[df["_faltante"] > 0].sort_values("_faltante", ascending=False))
     print("Base 'Conjuntas_combinado.csv' carregada.")
 
+def _publicar_dataset(df, indice=None, resumo_projeto=None, resumo_fase=None, pendentes=None):
+    """Troca a base do chatbot já montada; a geração nova (e o memo vazio) vêm por último."""
+    global DF, RESUMO_PROJETO, RESUMO_FASE, PENDENTES, DF_GERACAO
+    with _DF_LOCK:
+        if indice is not None:
+            INDICE_BUSCA.publicar(indice)
+        DF, RESUMO_PROJETO, RESUMO_FASE, PENDENTES = df, resumo_projeto, resumo_fase, pendentes
+        DF_GERACAO += 1
+        RESPOSTAS_CHAT.clear()
+
 # carrega dataset na inicialização
 try:
     load_dataset()
@@ -1613,17 +2243,21 @@ except Exception as e:
     print("Falha ao carregar dataset:", e)
     DF = None
 
+def _base_chat():
+    """(DF, RESUMO_PROJETO, RESUMO_FASE, PENDENTES) da mesma carga de load_dataset."""
+    with _DF_LOCK:
+        return DF, RESUMO_PROJETO, RESUMO_FASE, PENDENTES
+
 def reply_search(query: str):
-    if DF is None:
+    with _DF_LOCK:  # posições do índice valem para o DF publicado junto com ele
+        df = DF
+        melhores = INDICE_BUSCA.search(query, k=1) if df is not None else []
+    if df is None:
         return (False, "Base de dados não disponível.")
-    qtokens = tokenize(query)
-    scores = [(i, score_row(qtokens, row, SEARCH_FIELDS)) for i, row in DF.iterrows()]
-    scores.sort(key=lambda x: x[1], reverse=True)
-    SCORE_MIN = 0.35
-    if not scores or scores[0][1] < SCORE_MIN:
+    if not melhores or melhores[0][2] < SEARCH_MIN_COVERAGE:
         return (False, "🤖 Não encontrei nada parecido com sua busca. Tente outras palavras ou digite 'ajuda'.")
-    i, _ = scores[0]
-    row = DF.iloc[i]
+    i, _, _ = melhores[0]
+    row = df.iloc[i]
     p01 = row.get("_pct01")
     dur = row.get("_dur")
     resposta = (f"🤖 Instruções da tarefa\n"
@@ -1636,21 +2270,10 @@ def reply_search(query: str):
     return (True, resposta)
 
 def reply_status_project() -> str:
-    if DF is None: return "Base de dados não disponível."
-    g = DF.groupby("Projeto", dropna=False)
-    total_qtde = g.size()
-    tempo_total = g["_dur"].sum(min_count=1)
-    media_and = g["_pct01"].mean() * 100.0
-    concl = g["_pct01"].apply(lambda s: (s.fillna(0) >= 1.0).sum())
-    em_and = g["_pct01"].apply(lambda s: ((s.fillna(0) > 0) & (s.fillna(0) < 1.0)).sum())
-    nao_ini = g["_pct01"].apply(lambda s: (s.fillna(0) == 0).sum())
-    media_nao = (1 - (concl / total_qtde.replace(0, pd.NA))) * 100.0
-    res = pd.DataFrame({
-        "Tarefas": total_qtde, "Tempo total": tempo_total, "Andamento médio (%)": media_and,
-        "Não finalizado médio (%)": media_nao, "Finalizadas": concl, "Em andamento": em_and, "Não iniciadas": nao_ini
-    }).sort_values("Não finalizado médio (%)", ascending=False)
+    df, resumo, _, _ = _base_chat()
+    if df is None: return "Base de dados não disponível."
     lines = ["📊 Andamento por projeto"]
-    for n, (proj, row) in enumerate(res.iterrows(), start=1):
+    for n, (proj, row) in enumerate(resumo.iterrows(), start=1):
         ttot = "-" if pd.isna(row["Tempo total"]) else f"{row['Tempo total']:.2f}"
         am   = "-" if pd.isna(row["Andamento médio (%)"]) else f"{row['Andamento médio (%)']:.1f}%"
         nf   = "-" if pd.isna(row["Não finalizado médio (%)"]) else f"{row['Não finalizado médio (%)']:.1f}%"
@@ -1661,24 +2284,10 @@ def reply_status_project() -> str:
     return "\n".join(lines)
 
 def reply_status_stage() -> str:
-    if DF is None: return "Base de dados não disponível."
-    g = DF.groupby("Fase", dropna=False)
-    total = g.size()
-    concl = g["_pct01"].apply(lambda s: (s.fillna(0) >= 1.0).sum())
-    em_and = g["_pct01"].apply(lambda s: ((s.fillna(0) > 0) & (s.fillna(0) < 1.0)).sum())
-    nao_ini = g["_pct01"].apply(lambda s: (s.fillna(0) == 0).sum())
-    media_pct = g["_pct100"].mean()
-    media_nao = (1 - (concl / total.replace(0, pd.NA))) * 100.0
-    tempo_total = g["_dur"].sum(min_count=1)
-    tempo_conc = (DF["_dur"].fillna(0) * DF["_pct01"].fillna(0)).groupby(DF["Fase"]).sum(min_count=1)
-    tempo_pend = (DF["_dur"].fillna(0) * (1 - DF["_pct01"].fillna(0))).groupby(DF["Fase"]).sum(min_count=1)
-    res = pd.DataFrame({
-        "Tarefas": total, "Finalizadas": concl, "Em andamento": em_and, "Não iniciadas": nao_ini,
-        "Andamento médio (%)": media_pct, "Não finalizado médio (%)": media_nao,
-        "Tempo total": tempo_total, "Tempo concluído": tempo_conc, "Tempo a concluir": tempo_pend
-    }).sort_values(["Em andamento","Não iniciadas"], ascending=False)
+    df, _, resumo, _ = _base_chat()
+    if df is None: return "Base de dados não disponível."
     lines = ["📉 Andamento por etapa"]
-    for n, (fase, row) in enumerate(res.iterrows(), start=1):
+    for n, (fase, row) in enumerate(resumo.iterrows(), start=1):
         at = "-" if pd.isna(row["Andamento médio (%)"]) else f"{row['Andamento médio (%)']:.1f}%"
         nf = "-" if pd.isna(row["Não finalizado médio (%)"]) else f"{row['Não finalizado médio (%)']:.1f}%"
         tt = "-" if pd.isna(row["Tempo total"]) else f"{row['Tempo total']:.2f}"
@@ -1691,29 +2300,28 @@ def reply_status_stage() -> str:
     return "\n".join(lines)
 
 def reply_pending(limit=5):
-    if DF is None: return "Base de dados não disponível."
-    dfp = DF.copy()
-    dfp["_faltante"] = dfp["_dur"].fillna(0) * (1 - dfp["_pct01"].fillna(0))
-    dfp = dfp[dfp["_faltante"] > 0]
+    df, _, _, dfp = _base_chat()
+    if df is None: return "Base de dados não disponível."
     if dfp.empty: return "✅ Não há tarefas em aberto."
-    dfp = dfp.sort_values("_faltante", ascending=False)
     if limit and limit > 0:
         top = dfp.head(limit); data = top; title = f"📝 Tarefas pendentes (Top {len(top)}) — ordenadas por tempo que ainda falta"
     else:
         data = dfp; title = "📝 Tarefas pendentes — TODAS (ordenadas por tempo que ainda falta)"
     lines = [title]
-    for _, r in data.iterrows():
-        andamento = "-" if pd.isna(r["_pct100"]) else f"{r['_pct100']:.1f}%"
-        tempo = "-" if pd.isna(r["_dur"]) else f"{r['_dur']:.2f}"
-        falta = f"{r['_faltante']:.2f}"
-        lines.append(f"• {r['Nome']} — Projeto: {r['Projeto']} | Etapa: {r['Fase']} | "
+    for nome, proj, fase, pct100, dur, faltante in zip(data["Nome"], data["Projeto"], data["Fase"],
+                                                      data["_pct100"], data["_dur"], data["_faltante"]):
+        andamento = "-" if pd.isna(pct100) else f"{pct100:.1f}%"
+        tempo = "-" if pd.isna(dur) else f"{dur:.2f}"
+        falta = f"{faltante:.2f}"
+        lines.append(f"• {nome} — Projeto: {proj} | Etapa: {fase} | "
                      f"Andamento: {andamento} | Duração: {tempo} | Falta: {falta}")
     return "\n".join(lines)
 
 def reply_filter_by_condition(condition: str) -> str:
-    if DF is None: return "Base de dados não disponível."
-    if 'Condicao' not in DF.columns: return "ERRO: A coluna 'Condicao' não foi encontrada no CSV."
-    filtered_df = DF[DF['Condicao'].str.lower() == condition.lower()]
+    df = DF
+    if df is None: return "Base de dados não disponível."
+    if 'Condicao' not in df.columns: return "ERRO: A coluna 'Condicao' não foi encontrada no CSV."
+    filtered_df = df[df['_cond_lower'] == condition.lower()]
     if filtered_df.empty: return f"😕 Nenhuma tarefa encontrada com a condição '{condition}'."
     lines = [f"🔎 Tarefas com a condição '{condition.title()}' ({len(filtered_df)} encontradas):"]
     for _, row in filtered_df.iterrows():
@@ -1721,19 +2329,21 @@ def reply_filter_by_condition(condition: str) -> str:
     return "\n".join(lines)
 
 def reply_task_summary_by_conditions() -> dict:
-    if DF is None: return {"error": "Base de dados não disponível."}
-    if 'Condicao' not in DF.columns or 'Nome' not in DF.columns:
+    df = DF
+    if df is None: return {"error": "Base de dados não disponível."}
+    if 'Condicao' not in df.columns or 'Nome' not in df.columns:
         return {"error": "ERRO: Colunas 'Condicao' ou 'Nome' ausentes no CSV."}
     conditions = ['Sempre','A','B','C']
     summary = {}
     for c in conditions:
-        summary[c] = DF[DF['Condicao'].str.lower() == c.lower()]['Nome'].tolist()
+        summary[c] = df.loc[df['_cond_lower'] == c.lower(), 'Nome'].tolist()
     return summary
 
 def reply_all_tasks() -> str:
-    if DF is None or DF.empty: return "A base de dados está vazia ou não foi carregada."
-    lines = [f"📋 Lista de Todas as Tarefas ({len(DF)} no total):"]
-    for projeto, grupo in DF.groupby('Projeto'):
+    df = DF
+    if df is None or df.empty: return "A base de dados está vazia ou não foi carregada."
+    lines = [f"📋 Lista de Todas as Tarefas ({len(df)} no total):"]
+    for projeto, grupo in df.groupby('Projeto'):
         lines.append(f"\n--- Projeto: {projeto} ---")
         for _, t in grupo.iterrows():
             lines.append(f"• {t.get('Nome','(sem nome)')} (Etapa: {t.get('Fase','-')})")
@@ -1745,6 +2355,32 @@ def extract_condition_from_query(query: str):
     match = pattern.search(query or "")
     return match.group(1) if match else None
 
+def _intencao(q: str):
+    """(intenção, parâmetros) das mensagens cuja resposta só depende do DF, ou None (busca livre)."""
+    if "todas" in q and "tarefas" in q:
+        return ("todas", ())
+    if q == "filtrar tarefas":
+        return ("resumo_condicoes", ())
+    if "status" in q and ("projeto" in q or "projetos" in q):
+        return ("status_projeto", ())
+    if "status" in q and ("etapa" in q or "fase" in q):
+        return ("status_etapa", ())
+    if ("tarefas" in q and ("aberto" in q or "pendente" in q or "pendentes" in q)):
+        return ("pendentes", (0,) if "todas" in q else (5,))
+    cond = extract_condition_from_query(q)
+    if cond:
+        return ("condicao", (cond.lower(),))
+    return None
+
+_RESPOSTAS_INTENCAO = {
+    "todas": reply_all_tasks,
+    "resumo_condicoes": reply_task_summary_by_conditions,
+    "status_projeto": reply_status_project,
+    "status_etapa": reply_status_stage,
+    "pendentes": lambda limit: reply_pending(limit=limit),
+    "condicao": reply_filter_by_condition,
+}
+
 def bot_reply(message: str):
     q = (message or "").strip().lower()
     if not q:
@@ -1758,19 +2394,10 @@ def bot_reply(message: str):
                 "- **Status por Etapa**: digite `status por etapa`\n"
                 "- **Tarefas Pendentes (Top 5)**: digite `tarefas pendentes`\n"
                 "- **Buscar Instruções**: digite o nome da tarefa")
-    if "todas" in q and "tarefas" in q:
-        return reply_all_tasks()
-    if q == "filtrar tarefas":
-        return reply_task_summary_by_conditions()
-    if "status" in q and ("projeto" in q or "projetos" in q):
-        return reply_status_project()
-    if "status" in q and ("etapa" in q or "fase" in q):
-        return reply_status_stage()
-    if ("tarefas" in q and ("aberto" in q or "pendente" in q or "pendentes" in q)):
-        return reply_pending(limit=0) if "todas" in q else reply_pending(limit=5)
-    cond = extract_condition_from_query(q)
-    if cond:
-        return reply_filter_by_condition(cond)
+    intencao = _intencao(q)
+    if intencao is not None:
+        nome, params = intencao
+        return RESPOSTAS_CHAT.get(nome, params, DF_GERACAO, lambda: _RESPOSTAS_INTENCAO[nome](*params))
     ok, resp = reply_search(message)
     return resp
 
@@ -1796,10 +2423,17 @@ def api_chat():
 def reload_base():
     try:
         load_dataset()
-        return jsonify({"ok": True, "msg": "Base recarregada com sucesso."})
+        return jsonify({"ok": True, "msg": "Base recarregada com sucesso.", "indice": INDICE_BUSCA.stats()})
     except Exception as e:
         return jsonify({"ok": False, "error": str(e)}), 500
 
+@app.get("/admin/cache-respostas")
+def cache_respostas():
+    """Contadores do cache de respostas do chatbot (acertos, taxa de acerto, descartes)."""
+    resp = jsonify({"ok": True, "geracao": DF_GERACAO, "cache": RESPOSTAS_CHAT.stats()})
+    resp.headers["Cache-Control"] = "no-store"
+    return resp
+
 # -----------------------------------------------------------------------------
 # MAIN
 # -----------------------------------------------------------------------------
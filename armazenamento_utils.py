@@ -0,0 +1,372 @@
+"""
+Módulo de armazenamento das tarefas em SQLite para o Challenge2025 (backend opcional).
+
+Funções principais:
+- SqliteTaskStore: projetos, abas e tarefas num banco SQLite em modo WAL
+  - importar: grava o DataFrame normalizado de um projeto (substitui o anterior)
+  - carregar: DataFrame do projeto na ordem das abas/linhas, como a leitura do .xlsx
+  - apply_ops: aplica patches/appends no mesmo formato de escrita_utils.apply_task_ops;
+    cada patch é um único UPDATE da linha localizada por task_uuid (ou aba + número)
+  - signature: (geração, id, 0) do projeto — muda a cada escrita e serve de
+    validade para o ProjectCache no lugar da assinatura do arquivo
+  - projetos / abas / remover / stats
+
+Esquema:
+  projects(id, nome, project_uuid, geracao, colunas, importado_em)
+  sheets(id, project_id, nome, posicao)
+  tasks(id, project_id, sheet_id, linha, numero, task_uuid, em_curso, condicao, dados)
+
+`dados` guarda a linha inteira em JSON (as abas podem ter colunas próprias);
+numero/task_uuid/em_curso/condicao são repetidos em colunas indexadas para
+localizar a tarefa e filtrar sem decodificar o JSON.
+
+Uso no app_final.py (STORAGE_BACKEND=sqlite):
+
+    from armazenamento_utils import SqliteTaskStore
+
+    ARMAZENAMENTO = SqliteTaskStore(os.path.join(DATA_DIR, 'tarefas.db'))
+    ARMAZENAMENTO.importar('Projeto X', df_normalizado, abas=['Backlog'])
+    ARMAZENAMENTO.apply_ops('Projeto X', [{'op': 'patch', 'sheet': 'Backlog',
+                                           'task_uuid': u, 'changes': {'concluida': 1}}])
+
+O .xlsx deixa de ser lido nas requisições; /exportar-projeto gera a planilha
+a partir do banco quando alguém precisa dela.
+"""
+from __future__ import annotations
+
+import os
+import json
+import sqlite3
+import logging
+import threading
+import datetime as dt
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from escrita_utils import PatchError
+from resposta_utils import limpar
+from seguranca_utils import numero_key
+
+logger = logging.getLogger(__name__)
+
+# ------------------------ Config ------------------------
+STORAGE_BUSY_TIMEOUT_S = float(os.environ.get("STORAGE_BUSY_TIMEOUT_S", "30"))
+
+_ESQUEMA = """
+CREATE TABLE IF NOT EXISTS projects (
+    id           INTEGER PRIMARY KEY,
+    nome         TEXT NOT NULL UNIQUE,
+    project_uuid TEXT,
+    geracao      INTEGER NOT NULL DEFAULT 0,
+    colunas      TEXT NOT NULL DEFAULT '[]',
+    importado_em TEXT
+);
+CREATE TABLE IF NOT EXISTS sheets (
+    id         INTEGER PRIMARY KEY,
+    project_id INTEGER NOT NULL REFERENCES projects(id) ON DELETE CASCADE,
+    nome       TEXT NOT NULL,
+    posicao    INTEGER NOT NULL,
+    UNIQUE (project_id, nome)
+);
+CREATE TABLE IF NOT EXISTS tasks (
+    id         INTEGER PRIMARY KEY,
+    project_id INTEGER NOT NULL REFERENCES projects(id) ON DELETE CASCADE,
+    sheet_id   INTEGER NOT NULL REFERENCES sheets(id) ON DELETE CASCADE,
+    linha      INTEGER NOT NULL,
+    numero     TEXT NOT NULL DEFAULT '',
+    task_uuid  TEXT,
+    em_curso   INTEGER NOT NULL DEFAULT 0,
+    condicao   TEXT,
+    dados      TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_tasks_projeto_aba_numero ON tasks(project_id, sheet_id, numero);
+CREATE INDEX IF NOT EXISTS ix_tasks_uuid ON tasks(task_uuid);
+CREATE INDEX IF NOT EXISTS ix_tasks_em_curso ON tasks(em_curso);
+CREATE INDEX IF NOT EXISTS ix_tasks_condicao ON tasks(condicao);
+CREATE INDEX IF NOT EXISTS ix_tasks_ordem ON tasks(sheet_id, linha);
+"""
+
+# ------------------------ Valores ------------------------
+
+def _para_json(value: Any) -> Any:
+    """Valor de célula → JSON; datas viram {"$dt": iso} para voltarem como datetime."""
+    if value is pd.NaT:
+        return None
+    if isinstance(value, (dt.datetime, dt.date)):
+        return {"$dt": value.isoformat()}
+    return limpar(value)
+
+
+def _de_json(obj: Dict[str, Any]) -> Any:
+    if len(obj) == 1 and "$dt" in obj:
+        return dt.datetime.fromisoformat(obj["$dt"])
+    return obj
+
+
+def _codificar(linha: Dict[str, Any]) -> str:
+    return json.dumps({k: _para_json(v) for k, v in linha.items()},
+                      ensure_ascii=False, separators=(",", ":"))
+
+
+def _indexadas(linha: Dict[str, Any]) -> Dict[str, Any]:
+    """Valores das colunas indexadas presentes em `linha`, já normalizados."""
+    out: Dict[str, Any] = {}
+    if "numero" in linha:
+        out["numero"] = numero_key(linha["numero"])
+    if "task_uuid" in linha:
+        v = linha["task_uuid"]
+        out["task_uuid"] = str(v) if v is not None and not (isinstance(v, float) and v != v) else None
+    if "em_curso" in linha:
+        try:
+            out["em_curso"] = int(float(linha["em_curso"] or 0))
+        except (TypeError, ValueError):
+            out["em_curso"] = 0
+    if "condicao" in linha:
+        v = limpar(linha["condicao"])
+        out["condicao"] = None if v is None else str(v)
+    return out
+
+# ------------------------ Store ------------------------
+
+class SqliteTaskStore:
+    """
+    Tarefas de todos os projetos num único banco SQLite (WAL: leitores não
+    bloqueiam o escritor). Uma conexão por thread; escritas em transação
+    BEGIN IMMEDIATE, serializadas pelo próprio SQLite entre threads e processos.
+    """
+
+    def __init__(self, path: str, busy_timeout: float = STORAGE_BUSY_TIMEOUT_S):
+        self.path = path
+        self.busy_timeout = busy_timeout
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._stats = {"imports": 0, "loads": 0, "updates": 0, "inserts": 0, "not_found": 0}
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        con = self._con()
+        con.executescript(_ESQUEMA)
+
+    def _con(self) -> sqlite3.Connection:
+        con = getattr(self._local, "con", None)
+        if con is None:
+            con = sqlite3.connect(self.path, timeout=self.busy_timeout, isolation_level=None,
+                                  check_same_thread=False)
+            con.execute("PRAGMA journal_mode=WAL")
+            con.execute("PRAGMA synchronous=NORMAL")
+            con.execute("PRAGMA foreign_keys=ON")
+            self._local.con = con
+        return con
+
+    @contextmanager
+    def _transacao(self) -> Iterator[sqlite3.Connection]:
+        con = self._con()
+        con.execute("BEGIN IMMEDIATE")
+        try:
+            yield con
+        except BaseException:
+            con.execute("ROLLBACK")
+            raise
+        con.execute("COMMIT")
+
+    def _contar(self, chave: str, n: int = 1) -> None:
+        with self._lock:
+            self._stats[chave] += n
+
+    @staticmethod
+    def _projeto(con: sqlite3.Connection, nome: str) -> Optional[Tuple[int, int, str]]:
+        return con.execute("SELECT id, geracao, colunas FROM projects WHERE nome = ?", (nome,)).fetchone()
+
+    # ---------- consulta ----------
+
+    def projetos(self) -> List[str]:
+        return [r[0] for r in self._con().execute("SELECT nome FROM projects ORDER BY nome")]
+
+    def signature(self, nome: str) -> Optional[Tuple[int, int, int]]:
+        """(geração, id, 0) do projeto ou None se não existir no banco."""
+        row = self._projeto(self._con(), nome)
+        return (row[1], row[0], 0) if row else None
+
+    def abas(self, nome: str) -> List[str]:
+        return [r[0] for r in self._con().execute(
+            "SELECT s.nome FROM sheets s JOIN projects p ON p.id = s.project_id "
+            "WHERE p.nome = ? ORDER BY s.posicao", (nome,))]
+
+    def carregar(self, nome: str) -> Optional[pd.DataFrame]:
+        """DataFrame do projeto (coluna 'Sheet' incluída) ou None se não houver tarefas."""
+        con = self._con()
+        con.execute("BEGIN")  # geração e linhas do mesmo instante
+        try:
+            proj = self._projeto(con, nome)
+            if proj is None:
+                return None
+            rows = con.execute(
+                "SELECT s.nome, t.dados FROM tasks t JOIN sheets s ON s.id = t.sheet_id "
+                "WHERE t.project_id = ? ORDER BY s.posicao, t.linha", (proj[0],)).fetchall()
+        finally:
+            con.execute("COMMIT")
+        self._contar("loads")
+        if not rows:
+            return None
+
+        colunas = json.loads(proj[2])
+        ordem = [c for c, _ in colunas]
+        if "Sheet" not in ordem:
+            ordem.append("Sheet")
+        conhecidas = set(ordem)
+        registros = []
+        for aba, dados in rows:
+            r = json.loads(dados, object_hook=_de_json)
+            for c in r:
+                if c not in conhecidas:  # coluna criada depois da importação
+                    conhecidas.add(c)
+                    ordem.append(c)
+            r["Sheet"] = aba
+            registros.append(r)
+        df = pd.DataFrame.from_records(registros, columns=ordem)
+
+        for col, dtype in colunas:
+            s = df[col]
+            if str(s.dtype) == dtype:
+                continue
+            try:
+                df[col] = s.astype(dtype)
+            except (TypeError, ValueError):
+                pass
+        for col in df.columns:
+            if df[col].dtype == object:
+                valores = df[col].to_numpy()
+                nulos = valores == None  # noqa: E711 (comparação elemento a elemento)
+                if nulos.any():
+                    valores = valores.copy()
+                    valores[nulos] = np.nan
+                    df[col] = valores
+        return df
+
+    # ---------- escrita ----------
+
+    def importar(self, nome: str, df: Optional[pd.DataFrame], abas: Optional[Sequence[str]] = None,
+                 project_uuid: Optional[str] = None, derivadas: Sequence[str] = ()) -> int:
+        """
+        Substitui o conteúdo do projeto pelo `df` (normalizado, com coluna 'Sheet').
+        `abas`: ordem das abas, incluindo as vazias; as do DF que faltarem vão ao fim.
+        `derivadas`: colunas que o chamador recalcula na leitura — só a posição é
+        guardada (voltam vazias de `carregar`).
+        Retorna o número de tarefas gravadas.
+        """
+        df = df if df is not None else pd.DataFrame(columns=["Sheet"])
+        ordem_abas = list(dict.fromkeys([*(abas or []), *df["Sheet"].astype(str).tolist()]))
+        colunas = [[c, str(df[c].dtype)] for c in df.columns]
+        cols = [c for c in df.columns if c != "Sheet" and c not in derivadas]
+        agora = dt.datetime.now().isoformat(timespec="seconds")
+
+        with self._transacao() as con:
+            proj = self._projeto(con, nome)
+            if proj is None:
+                pid = con.execute("INSERT INTO projects (nome, project_uuid, colunas, importado_em) "
+                                  "VALUES (?, ?, ?, ?)",
+                                  (nome, project_uuid, json.dumps(colunas), agora)).lastrowid
+            else:
+                pid = proj[0]
+                con.execute("DELETE FROM tasks WHERE project_id = ?", (pid,))
+                con.execute("DELETE FROM sheets WHERE project_id = ?", (pid,))
+                con.execute("UPDATE projects SET geracao = geracao + 1, colunas = ?, importado_em = ?, "
+                            "project_uuid = COALESCE(?, project_uuid) WHERE id = ?",
+                            (json.dumps(colunas), agora, project_uuid, pid))
+            sheet_ids = {}
+            for pos, aba in enumerate(ordem_abas):
+                sheet_ids[aba] = con.execute("INSERT INTO sheets (project_id, nome, posicao) VALUES (?, ?, ?)",
+                                             (pid, aba, pos)).lastrowid
+            linhas = []
+            for linha, (aba, r) in enumerate(zip(df["Sheet"].astype(str), df[cols].to_dict("records"))):
+                idx = _indexadas(r)
+                linhas.append((pid, sheet_ids[aba], linha, idx.get("numero", ""), idx.get("task_uuid"),
+                               idx.get("em_curso", 0), idx.get("condicao"), _codificar(r)))
+            con.executemany("INSERT INTO tasks (project_id, sheet_id, linha, numero, task_uuid, em_curso, "
+                            "condicao, dados) VALUES (?, ?, ?, ?, ?, ?, ?, ?)", linhas)
+        self._contar("imports")
+        logger.info("SQLite: projeto '%s' importado (%d tarefa(s), %d aba(s))", nome, len(linhas), len(ordem_abas))
+        return len(linhas)
+
+    def remover(self, nome: str) -> None:
+        with self._transacao() as con:
+            con.execute("DELETE FROM projects WHERE nome = ?", (nome,))
+
+    def apply_ops(self, nome: str, ops: List[Dict[str, Any]], strict: bool = True) -> int:
+        """
+        Aplica ops {'op': 'patch'|'append', 'sheet', ...} numa transação e avança a
+        geração do projeto. strict=True → PatchError na primeira op inválida (nada é
+        gravado); strict=False → ops inválidas são ignoradas e registradas em log.
+        """
+        aplicadas = 0
+        with self._transacao() as con:
+            proj = self._projeto(con, nome)
+            if proj is None:
+                raise PatchError("project_not_found", f"Projeto '{nome}' não encontrado")
+            pid = proj[0]
+            for op in ops:
+                try:
+                    if op.get("op") == "append":
+                        self._append(con, pid, str(op.get("sheet")), op.get("values") or {})
+                    else:
+                        self._patch(con, pid, op)
+                    aplicadas += 1
+                except PatchError:
+                    self._contar("not_found")
+                    if strict:
+                        raise
+                    logger.warning("Operação ignorada em '%s': %s", nome, op, exc_info=True)
+            if aplicadas:
+                con.execute("UPDATE projects SET geracao = geracao + 1 WHERE id = ?", (pid,))
+        return aplicadas
+
+    def _patch(self, con: sqlite3.Connection, pid: int, op: Dict[str, Any]) -> None:
+        changes = op.get("changes") or {}
+        idx = _indexadas(changes)
+        sets = ["dados = json_patch(dados, ?)"] + [f"{c} = ?" for c in idx]
+        params = [_codificar(changes), *idx.values()]
+        sheet = str(op.get("sheet"))
+        alvo = ("SELECT t.id FROM tasks t JOIN sheets s ON s.id = t.sheet_id "
+                "WHERE t.project_id = ? AND s.nome = ? AND t.{} = ? ORDER BY t.linha LIMIT 1")
+
+        tentativas = []
+        if op.get("task_uuid"):
+            tentativas.append(("task_uuid", str(op["task_uuid"])))
+        if numero_key(op.get("numero")):
+            tentativas.append(("numero", numero_key(op.get("numero"))))
+        for coluna, valor in tentativas:
+            cur = con.execute(f"UPDATE tasks SET {', '.join(sets)} WHERE id = ({alvo.format(coluna)})",
+                              (*params, pid, sheet, valor))
+            if cur.rowcount:
+                self._contar("updates")
+                return
+        raise PatchError("task_not_found", f"Tarefa {op.get('numero')} não encontrada em '{sheet}'")
+
+    def _append(self, con: sqlite3.Connection, pid: int, sheet: str, values: Dict[str, Any]) -> None:
+        row = con.execute("SELECT id FROM sheets WHERE project_id = ? AND nome = ?", (pid, sheet)).fetchone()
+        if row is None:
+            pos = con.execute("SELECT COALESCE(MAX(posicao), -1) + 1 FROM sheets WHERE project_id = ?",
+                              (pid,)).fetchone()[0]
+            sid = con.execute("INSERT INTO sheets (project_id, nome, posicao) VALUES (?, ?, ?)",
+                              (pid, sheet, pos)).lastrowid
+        else:
+            sid = row[0]
+        linha = con.execute("SELECT COALESCE(MAX(linha), -1) + 1 FROM tasks WHERE sheet_id = ?",
+                            (sid,)).fetchone()[0]
+        idx = _indexadas(values)
+        con.execute("INSERT INTO tasks (project_id, sheet_id, linha, numero, task_uuid, em_curso, condicao, dados) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (pid, sid, linha, idx.get("numero", ""), idx.get("task_uuid"), idx.get("em_curso", 0),
+                     idx.get("condicao"), _codificar(values)))
+        self._contar("inserts")
+
+    def stats(self) -> Dict[str, Any]:
+        con = self._con()
+        with self._lock:
+            s = dict(self._stats)
+        s.update(backend="sqlite", path=self.path,
+                 projects=con.execute("SELECT COUNT(*) FROM projects").fetchone()[0],
+                 tasks=con.execute("SELECT COUNT(*) FROM tasks").fetchone()[0],
+                 journal_mode=con.execute("PRAGMA journal_mode").fetchone()[0])
+        return s
@@ -0,0 +1,66 @@
+"""
+Microbenchmark da serialização das tarefas (resposta_utils × caminho antigo).
+
+Compara, sobre as planilhas em data/:
+- antigo: DataFrame.to_json → json.loads → jsonify
+- novo:   resposta_utils.records_json (orjson se disponível, senão json)
+
+Uso:
+    python bench_serializacao.py [repeticoes]
+"""
+import os
+import sys
+import glob
+import json
+import time
+
+import pandas as pd
+from flask import Flask, jsonify
+
+import resposta_utils
+from dados_utils import ler_workbook
+from resposta_utils import records_json
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def _carregar():
+    frames = []
+    for path in sorted(glob.glob(os.path.join(BASE_DIR, "data", "*.xlsx"))):
+        for aba in ler_workbook(path):
+            if not aba.df.empty:
+                frames.append(aba.df.assign(Sheet=aba.nome, Projeto=os.path.basename(path)))
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+
+def _medir(fn, n):
+    fn()  # aquecimento
+    t0 = time.perf_counter()
+    for _ in range(n):
+        fn()
+    return (time.perf_counter() - t0) / n * 1000
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    df = _carregar()
+    app = Flask(__name__)
+
+    def antigo():
+        return jsonify(json.loads(df.to_json(orient="records", force_ascii=False))).get_data()
+
+    def novo():
+        return records_json(df)
+
+    with app.app_context():
+        t_antigo = _medir(antigo, n)
+        t_novo = _medir(novo, n)
+        tam_antigo, tam_novo = len(antigo()), len(novo())
+
+    print(f"linhas={len(df)} colunas={len(df.columns)} backend={resposta_utils.backend()} repeticoes={n}")
+    print(f"antigo: {t_antigo:8.2f} ms  {tam_antigo} bytes")
+    print(f"novo:   {t_novo:8.2f} ms  {tam_novo} bytes  ({t_antigo / t_novo:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
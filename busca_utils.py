@@ -0,0 +1,206 @@
+"""
+Módulo de busca textual do Chatbot para o Challenge2025.
+
+Funções principais:
+- BM25Index: índice invertido sobre campos de texto de um DataFrame, com
+  pontuação BM25F (pesos por campo), bônus de frase e top-k
+  - build: (re)constrói o índice; linhas cujo texto não mudou reaproveitam a
+    tokenização da construção anterior (recarga incremental)
+  - preparar / publicar: o mesmo em duas etapas, para trocar o índice junto
+    com o DataFrame que ele descreve
+  - search: [(posição da linha, score, cobertura)] das k melhores linhas
+
+Os textos são tokenizados uma única vez na construção (a função de tokenização
+é a do chamador, com a mesma normalização usada nas perguntas); a consulta só
+percorre as listas invertidas dos termos da pergunta.
+
+Uso no app_final.py:
+
+    from busca_utils import BM25Index
+
+    INDICE_BUSCA = BM25Index({'Nome': 3.0, 'ComoFazer': 1.0}, tokenizar=tokenize_list,
+                             normalizar=lambda s: deaccent(s).lower())
+    INDICE_BUSCA.build(DF)
+    for pos, score, cobertura in INDICE_BUSCA.search("rotulagem frascos", k=5):
+        row = DF.iloc[pos]
+"""
+from __future__ import annotations
+
+import os
+import re
+import math
+import threading
+from collections import Counter
+from typing import Any, Callable, Dict, List, Tuple
+
+import numpy as np
+
+# ------------------------ Config ------------------------
+BUSCA_K1 = float(os.environ.get("BUSCA_K1", "1.2"))
+BUSCA_B = float(os.environ.get("BUSCA_B", "0.75"))
+BUSCA_BOOST_FRASE = float(os.environ.get("BUSCA_BOOST_FRASE", "0.5"))
+
+_PALAVRAS = re.compile(r"[a-z0-9]+")
+
+
+class _Documento:
+    """Análise de uma linha: termos (tf por campo) e texto normalizado de cada campo."""
+    __slots__ = ("termos", "textos")
+
+    def __init__(self, termos: List[Counter], textos: List[str]):
+        self.termos = termos
+        self.textos = textos
+
+
+class _Construcao:
+    """Índice montado por `preparar`, ainda não visível nas buscas."""
+    __slots__ = ("analises", "docs", "postings", "idf", "reusados")
+
+    def __init__(self, analises, docs, postings, idf, reusados):
+        self.analises, self.docs, self.postings, self.idf, self.reusados = analises, docs, postings, idf, reusados
+
+
+class BM25Index:
+    """
+    Índice invertido BM25F.
+
+    - `campos`: {coluna: peso}; o tf de cada campo é saturado separadamente e
+      somado com o peso do campo.
+    - `tokenizar(texto) -> list[str]`: termos indexados (já sem acentos/stop words).
+    - `normalizar(texto) -> str`: forma usada no bônus de frase (minúsculas, sem acento).
+    - Bônus de frase: a pergunta inteira (palavras completas, em sequência) aparecendo num campo soma
+      `boost_frase × peso do campo × Σ idf` ao score das melhores candidatas.
+    """
+
+    def __init__(self, campos: Dict[str, float], tokenizar: Callable[[Any], List[str]],
+                 normalizar: Callable[[Any], str], k1: float = BUSCA_K1, b: float = BUSCA_B,
+                 boost_frase: float = BUSCA_BOOST_FRASE):
+        self.campos = list(campos)
+        self.pesos = np.array([float(campos[c]) for c in self.campos])
+        self.tokenizar = tokenizar
+        self.normalizar = normalizar
+        self.k1, self.b, self.boost_frase = k1, b, boost_frase
+        self._lock = threading.Lock()
+        self._analises: Dict[Tuple[str, ...], _Documento] = {}
+        self._docs: List[_Documento] = []
+        self._postings: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+        self._idf: Dict[str, float] = {}
+        self._stats = {"builds": 0, "tokenized": 0, "reused": 0, "searches": 0}
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+    def _analisar(self, valores: Tuple[str, ...]) -> _Documento:
+        termos = [Counter(self.tokenizar(v)) for v in valores]
+        textos = [" ".join(_PALAVRAS.findall(self.normalizar(v))) for v in valores]
+        return _Documento(termos, textos)
+
+    def build(self, df) -> Dict[str, int]:
+        """
+        (Re)constrói o índice a partir das colunas `campos` de `df` (posições = df.iloc).
+        Só as linhas com texto novo são tokenizadas; as demais vêm da construção anterior.
+        """
+        return self.publicar(self.preparar(df))
+
+    def preparar(self, df) -> _Construcao:
+        """Monta o índice de `df` sem publicá-lo; as buscas seguem no índice atual até `publicar`."""
+        with self._lock:
+            anteriores = self._analises
+        analises: Dict[Tuple[str, ...], _Documento] = {}
+        docs: List[_Documento] = []
+        reusados = 0
+        colunas = [df[c].tolist() if c in df.columns else [""] * len(df) for c in self.campos]
+        for valores in zip(*colunas):
+            chave = tuple("" if v is None else str(v) for v in valores)
+            doc = analises.get(chave) or anteriores.get(chave)
+            if doc is None:
+                doc = self._analisar(chave)
+            else:
+                reusados += 1
+            analises[chave] = doc
+            docs.append(doc)
+
+        n, nc = len(docs), len(self.campos)
+        comprimentos = np.zeros((n, nc))
+        for i, doc in enumerate(docs):
+            for j, termos in enumerate(doc.termos):
+                comprimentos[i, j] = sum(termos.values())
+        medias = comprimentos.mean(axis=0) if n else np.ones(nc)
+        medias[medias == 0] = 1.0
+
+        listas: Dict[str, Tuple[List[int], List[float]]] = {}
+        for i, doc in enumerate(docs):
+            parcial: Dict[str, float] = {}
+            for j, termos in enumerate(doc.termos):
+                norma = self.k1 * (1 - self.b + self.b * comprimentos[i, j] / medias[j])
+                for termo, tf in termos.items():
+                    parcial[termo] = parcial.get(termo, 0.0) + self.pesos[j] * tf * (self.k1 + 1) / (tf + norma)
+            for termo, peso in parcial.items():
+                ids, pesos = listas.setdefault(termo, ([], []))
+                ids.append(i)
+                pesos.append(peso)
+
+        postings = {t: (np.array(ids, dtype=np.int64), np.array(pesos)) for t, (ids, pesos) in listas.items()}
+        idf = {t: math.log(1 + (n - len(ids) + 0.5) / (len(ids) + 0.5)) for t, (ids, _) in postings.items()}
+        return _Construcao(analises, docs, postings, idf, reusados)
+
+    def publicar(self, construcao: _Construcao) -> Dict[str, int]:
+        """Troca o índice pesquisado pelo montado em `preparar`."""
+        c = construcao
+        n = len(c.docs)
+        with self._lock:
+            self._analises, self._docs, self._postings, self._idf = c.analises, c.docs, c.postings, c.idf
+            self._stats["builds"] += 1
+            self._stats["tokenized"] += n - c.reusados
+            self._stats["reused"] += c.reusados
+        return {"docs": n, "tokenized": n - c.reusados, "reused": c.reusados, "terms": len(c.postings)}
+
+    def search(self, query: Any, k: int = 5) -> List[Tuple[int, float, float]]:
+        """
+        As `k` melhores linhas para `query`: [(posição, score, cobertura)], em ordem
+        decrescente de score (empate → ordem da base). `cobertura` é a fração dos
+        termos da pergunta presentes na linha.
+        """
+        with self._lock:
+            docs, postings, idf = self._docs, self._postings, self._idf
+            self._stats["searches"] += 1
+        termos = list(dict.fromkeys(self.tokenizar(query)))
+        if not termos or not docs:
+            return []
+
+        scores = np.zeros(len(docs))
+        acertos = np.zeros(len(docs))
+        soma_idf = 0.0
+        for termo in termos:
+            lista = postings.get(termo)
+            if lista is None:
+                continue
+            ids, pesos = lista
+            scores[ids] += idf[termo] * pesos  # cada id aparece uma vez por termo
+            acertos[ids] += 1
+            soma_idf += idf[termo]
+        candidatos = np.flatnonzero(acertos)
+        if not len(candidatos):
+            return []
+
+        frase = " ".join(_PALAVRAS.findall(self.normalizar(query)))
+        if self.boost_frase and frase and len(termos) > 1:
+            # só as melhores candidatas pagam a verificação; textos e frase são
+            # palavras separadas por um espaço, então as bordas casam palavras
+            # inteiras ("rota frasco" não casa em "rotativa frascos")
+            frase = f" {frase} "
+            limite = max(k * 4, 20)
+            melhores = candidatos[np.argsort(-scores[candidatos], kind="stable")[:limite]]
+            for i in melhores:
+                for j, texto in enumerate(docs[i].textos):
+                    if frase in f" {texto} ":
+                        scores[i] += self.boost_frase * self.pesos[j] * soma_idf
+
+        ordem = candidatos[np.lexsort((candidatos, -scores[candidatos]))][:k]
+        return [(int(i), float(scores[i]), float(acertos[i] / len(termos))) for i in ordem]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            s = dict(self._stats)
+            s.update(docs=len(self._docs), terms=len(self._postings), fields=dict(zip(self.campos, self.pesos.tolist())))
+        return s
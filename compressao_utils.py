@@ -0,0 +1,219 @@
+"""
+Módulo de compressão de respostas HTTP (gzip / brotli) para o Challenge2025.
+
+Funções principais:
+- negociar: escolhe a codificação (br > gzip) a partir do Accept-Encoding do cliente
+- ResponseCompressor: comprime respostas Flask já prontas (after_request), com
+  limite mínimo de tamanho, compressão em streaming para corpos grandes ou
+  gerados aos poucos (NDJSON, send_file) e configuração por rota (endpoint)
+
+Uso no app_final.py:
+
+    from compressao_utils import ResponseCompressor
+
+    COMPRESSAO = ResponseCompressor(rotas={'exportar_projeto': {'level': 9}, 'static': False})
+
+    @app.after_request
+    def _comprimir(resp):
+        return COMPRESSAO.process(resp, request.accept_encodings, request.endpoint)
+
+brotli é opcional: sem o pacote instalado só gzip é oferecido. Tipos já
+comprimidos (xlsx/zip, imagens) nunca são recomprimidos.
+"""
+from __future__ import annotations
+
+import os
+import zlib
+import threading
+from typing import Any, Dict, Iterable, Iterator, Optional
+
+try:  # opcional
+    import brotli
+except ImportError:  # pragma: no cover - depende do ambiente
+    brotli = None
+
+# ------------------------ Config ------------------------
+COMPRESSION_ENABLED = os.environ.get("COMPRESSION_ENABLED", "true").lower() == "true"
+COMPRESSION_MIN_BYTES = int(os.environ.get("COMPRESSION_MIN_BYTES", "1024"))
+COMPRESSION_STREAM_BYTES = int(os.environ.get("COMPRESSION_STREAM_BYTES", str(256 * 1024)))
+COMPRESSION_LEVEL = int(os.environ.get("COMPRESSION_LEVEL", "6"))         # gzip 1..9
+COMPRESSION_BR_QUALITY = int(os.environ.get("COMPRESSION_BR_QUALITY", "5"))  # brotli 0..11
+
+# tipos que valem a pena comprimir (xlsx/zip/imagens já são comprimidos)
+TIPOS_COMPRIMIVEIS = {
+    "application/json", "application/x-ndjson", "application/javascript",
+    "application/pdf", "application/xml", "image/svg+xml",
+}
+
+_BLOCO = 64 * 1024
+
+
+def _comprimivel(mimetype: Optional[str]) -> bool:
+    return bool(mimetype) and (mimetype in TIPOS_COMPRIMIVEIS or mimetype.startswith("text/"))
+
+# ------------------------ Negociação ------------------------
+
+def codificacoes_disponiveis() -> list:
+    return ["br", "gzip"] if brotli is not None else ["gzip"]
+
+
+def negociar(accept_encodings, permitidas: Optional[Iterable[str]] = None) -> Optional[str]:
+    """
+    Melhor codificação aceita pelo cliente (respeitando q=0), preferindo brotli.
+    `accept_encodings` é o `request.accept_encodings` do werkzeug.
+    """
+    if not accept_encodings:
+        return None
+    for enc in (permitidas or codificacoes_disponiveis()):
+        if enc in codificacoes_disponiveis() and accept_encodings[enc] > 0:
+            return enc
+    return None
+
+# ------------------------ Codificadores ------------------------
+
+class _Codificador:
+    """Interface mínima comum a gzip e brotli: comprimir blocos e finalizar."""
+
+    def __init__(self, enc: str, level: int, br_quality: int):
+        self.enc = enc
+        if enc == "br":
+            self._c = brotli.Compressor(quality=br_quality)
+        else:
+            # wbits=31 → cabeçalho/rodapé gzip
+            self._c = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def comprimir(self, dados: bytes, flush: bool = False) -> bytes:
+        if self.enc == "br":
+            out = self._c.process(dados)
+            return out + self._c.flush() if flush else out
+        out = self._c.compress(dados)
+        return out + self._c.flush(zlib.Z_SYNC_FLUSH) if flush else out
+
+    def finalizar(self) -> bytes:
+        return self._c.finish() if self.enc == "br" else self._c.flush(zlib.Z_FINISH)
+
+# ------------------------ Compressor de respostas ------------------------
+
+class ResponseCompressor:
+    """
+    Comprime respostas Flask conforme o Accept-Encoding.
+
+    - `rotas`: {endpoint: False | {opção: valor}} — False desliga a rota; o dict
+      sobrescreve `min_bytes`, `stream_bytes`, `level`, `br_quality` ou `encodings`.
+    - Corpos abaixo de `min_bytes` saem como estão.
+    - Corpos acima de `stream_bytes` e respostas em streaming (geradores,
+      send_file) são comprimidos em blocos, sem Content-Length; respostas
+      geradas aos poucos (NDJSON) recebem flush por bloco para não atrasar o cliente.
+    """
+
+    def __init__(self, rotas: Optional[Dict[str, Any]] = None, enabled: bool = COMPRESSION_ENABLED,
+                 min_bytes: int = COMPRESSION_MIN_BYTES, stream_bytes: int = COMPRESSION_STREAM_BYTES,
+                 level: int = COMPRESSION_LEVEL, br_quality: int = COMPRESSION_BR_QUALITY):
+        self.enabled = enabled
+        self.rotas = dict(rotas or {})
+        self.padrao = {"min_bytes": min_bytes, "stream_bytes": stream_bytes, "level": level,
+                       "br_quality": br_quality, "encodings": None}
+        self._lock = threading.Lock()
+        self._stats = {"compressed": 0, "streamed": 0, "skipped_small": 0,
+                       "bytes_in": 0, "bytes_out": 0, "by_encoding": {}}
+
+    def _opcoes(self, endpoint: Optional[str]) -> Optional[Dict[str, Any]]:
+        rota = self.rotas.get(endpoint or "", {})
+        if rota is False:
+            return None
+        return {**self.padrao, **(rota or {})}
+
+    def _contar(self, enc: str, entrada: int, saida: int, streamed: bool = False) -> None:
+        with self._lock:
+            s = self._stats
+            s["streamed" if streamed else "compressed"] += 1
+            s["bytes_in"] += entrada
+            s["bytes_out"] += saida
+            s["by_encoding"][enc] = s["by_encoding"].get(enc, 0) + 1
+
+    def process(self, resp, accept_encodings, endpoint: Optional[str] = None):
+        """Comprime `resp` no lugar (se cabível) e a devolve."""
+        if not self.enabled:
+            return resp
+        opcoes = self._opcoes(endpoint)
+        if opcoes is None or not _comprimivel(resp.mimetype):
+            return resp
+        if resp.status_code < 200 or resp.status_code in (204, 206, 304) \
+                or "Content-Encoding" in resp.headers:
+            return resp
+
+        # o conteúdo varia com o Accept-Encoding mesmo quando não comprimimos
+        resp.vary.add("Accept-Encoding")
+        enc = negociar(accept_encodings, opcoes["encodings"])
+        if enc is None:
+            return resp
+
+        if resp.is_streamed or resp.direct_passthrough:
+            tamanho = resp.content_length
+            if tamanho is not None and tamanho < opcoes["min_bytes"]:
+                with self._lock:
+                    self._stats["skipped_small"] += 1
+                return resp
+            self._em_streaming(resp, enc, opcoes, flush=resp.mimetype == "application/x-ndjson")
+        else:
+            corpo = resp.get_data()
+            if len(corpo) < opcoes["min_bytes"]:
+                with self._lock:
+                    self._stats["skipped_small"] += 1
+                return resp
+            if len(corpo) >= opcoes["stream_bytes"]:
+                self._em_streaming(resp, enc, opcoes, corpo=corpo)
+            else:
+                cod = _Codificador(enc, opcoes["level"], opcoes["br_quality"])
+                saida = cod.comprimir(corpo) + cod.finalizar()
+                resp.set_data(saida)
+                self._contar(enc, len(corpo), len(saida))
+
+        resp.headers["Content-Encoding"] = enc
+        resp.headers.pop("Accept-Ranges", None)  # faixas de bytes não valem para o corpo comprimido
+        etag, fraca = resp.get_etag()
+        if etag and not fraca:
+            resp.set_etag(f"{etag}-{enc}")
+        return resp
+
+    def _em_streaming(self, resp, enc: str, opcoes: Dict[str, Any],
+                      corpo: Optional[bytes] = None, flush: bool = False) -> None:
+        if corpo is not None:
+            mv = memoryview(corpo)
+            origem: Iterable[bytes] = (mv[i:i + _BLOCO] for i in range(0, len(mv), _BLOCO))
+        else:
+            origem = resp.response
+        fechar = getattr(origem, "close", None)
+
+        def _gerar() -> Iterator[bytes]:
+            cod = _Codificador(enc, opcoes["level"], opcoes["br_quality"])
+            entrada = saida = 0
+            try:
+                for bloco in origem:
+                    if isinstance(bloco, str):
+                        bloco = bloco.encode("utf-8")
+                    entrada += len(bloco)
+                    out = cod.comprimir(bloco, flush=flush)
+                    if out:
+                        saida += len(out)
+                        yield out
+                fim = cod.finalizar()
+                saida += len(fim)
+                yield fim
+            finally:
+                if fechar is not None:
+                    fechar()
+                self._contar(enc, entrada, saida, streamed=True)
+
+        resp.response = _gerar()
+        resp.direct_passthrough = False
+        resp.headers.pop("Content-Length", None)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            s = dict(self._stats, by_encoding=dict(self._stats["by_encoding"]))
+        s.update(enabled=self.enabled, encodings=codificacoes_disponiveis(),
+                 min_bytes=self.padrao["min_bytes"], stream_bytes=self.padrao["stream_bytes"])
+        ratio = s["bytes_out"] / s["bytes_in"] if s["bytes_in"] else 0.0
+        s["ratio"] = round(ratio, 4)
+        return s
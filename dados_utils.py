@@ -0,0 +1,854 @@
+"""
+Módulo de dados (leitura e cache) para o Challenge2025.
+
+Funções principais:
+- file_signature: assinatura (mtime/size/inode) de um arquivo em disco
+- ProjectCache: cache LRU em memória dos DataFrames normalizados por projeto,
+  invalidado quando a assinatura do arquivo muda e limitado por orçamento de memória;
+  `derived()` guarda estruturas calculadas a partir da entrada (ex.: TaskIndex)
+- ResponseMemo: memoização LRU (limitada em entradas) de respostas que só
+  dependem dos dados carregados, com a geração dos dados na chave
+- DataGenerations: geração monotônica por projeto (ETag / Last-Modified)
+- DataRepository: fachada única de leitura compartilhada entre os apps WSGI
+  (app principal e Chatbot), com visões que adaptam as colunas de cada consumidor
+- DataWatcher: observa os .xlsx de uma pasta (watchdog/inotify ou polling) e
+  avisa os assinantes de criação/alteração/remoção, fora do caminho das requisições
+- SnapshotStore: espelho colunar (Feather/Parquet via pyarrow; pickle sem ele)
+  do DataFrame normalizado de cada projeto, válido enquanto o .xlsx não mudar
+- ler_workbook: leitura única de um .xlsx → valores (DataFrame por aba) + hyperlinks
+- ler_workbooks / abas_workbooks: vários .xlsx lidos em paralelo num
+  ProcessPoolExecutor (PARALLEL_LOAD_ENABLED), com tempo por arquivo no log
+
+Uso no app_final.py:
+
+    from dados_utils import ProjectCache
+
+    CACHE_PROJETOS = ProjectCache()
+
+    def carregar_base_dados(projeto=None):
+        ...
+        df = CACHE_PROJETOS.get(nome_proj, path, _carregar_projeto)
+
+Observação: o cache devolve o DataFrame armazenado; quem for alterar o
+resultado deve trabalhar sobre uma cópia.
+"""
+from __future__ import annotations
+
+import os
+import re
+import glob
+import json
+import pickle
+import hashlib
+import fnmatch
+import time
+import uuid
+import atexit
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Set, Tuple
+
+try:  # opcional: eventos do SO (inotify/FSEvents/ReadDirectoryChanges)
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+except ImportError:  # pragma: no cover - depende do ambiente
+    FileSystemEventHandler = object
+    Observer = None
+
+try:  # opcional: snapshots colunares com leitura por memory map
+    import pyarrow as pa
+    import pyarrow.feather as pa_feather
+    import pyarrow.parquet as pa_parquet
+except ImportError:  # pragma: no cover - depende do ambiente
+    pa = None
+
+logger = logging.getLogger(__name__)
+
+# ------------------------ Config ------------------------
+CACHE_ENABLED = os.environ.get("PROJECT_CACHE_ENABLED", "true").lower() == "true"
+CACHE_MAX_MB = float(os.environ.get("PROJECT_CACHE_MAX_MB", "256"))
+WATCHER_ENABLED = os.environ.get("DATA_WATCHER_ENABLED", "true").lower() == "true"
+WATCHER_POLL_S = float(os.environ.get("DATA_WATCHER_POLL_S", "2"))
+WATCHER_DEBOUNCE_S = float(os.environ.get("DATA_WATCHER_DEBOUNCE_S", "0.5"))
+SNAPSHOT_ENABLED = os.environ.get("SNAPSHOT_ENABLED", "true").lower() == "true"
+SNAPSHOT_FORMAT = os.environ.get("SNAPSHOT_FORMAT", "feather" if pa is not None else "pickle").lower()
+RESPONSE_MEMO_ENABLED = os.environ.get("RESPONSE_MEMO_ENABLED", "true").lower() == "true"
+RESPONSE_MEMO_MAX_ENTRIES = int(os.environ.get("RESPONSE_MEMO_MAX_ENTRIES", "128"))
+PARALLEL_LOAD_ENABLED = os.environ.get("PARALLEL_LOAD_ENABLED", "false").lower() == "true"
+PARALLEL_LOAD_WORKERS = int(os.environ.get("PARALLEL_LOAD_WORKERS", "0"))  # 0 = nº de CPUs (máx. 8)
+# fork (POSIX) evita reimportar o módulo principal (app + Chatbot) em cada worker; os
+# workers só executam ler_workbook. Em Windows/macOS o padrão é spawn (exige o guard __main__).
+PARALLEL_LOAD_START = os.environ.get(
+    "PARALLEL_LOAD_START", "fork" if "fork" in multiprocessing.get_all_start_methods() else "spawn")
+
+# ------------------------ Assinatura de arquivo ------------------------
+
+Signature = Tuple[int, int, int]
+
+
+def file_signature(path: str) -> Optional[Signature]:
+    """Retorna (mtime_ns, size, inode) do arquivo ou None se não existir."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+
+def _frame_nbytes(df) -> int:
+    """Estimativa do tamanho em memória de um DataFrame (inclui objetos)."""
+    try:
+        return int(df.memory_usage(index=True, deep=True).sum())
+    except Exception:
+        return 0
+
+# ------------------------ Cache de projetos ------------------------
+
+class _Entry(NamedTuple):
+    signature: Signature
+    value: Any
+    nbytes: int
+    derived: Dict[str, Any]
+
+
+class ProjectCache:
+    """
+    Cache LRU por projeto.
+
+    - A chave é o nome do projeto; a validade é a assinatura do arquivo
+      (ou a que `signature(path)` devolver, ex.: geração do projeto no SQLite).
+    - O valor é o que o `loader(path)` devolver (em geral o DataFrame normalizado).
+    - Entradas menos usadas são descartadas quando a soma ultrapassa `max_bytes`
+      (a entrada mais recente é sempre mantida, mesmo que sozinha exceda o limite).
+    """
+
+    def __init__(self, max_bytes: Optional[int] = None, enabled: bool = CACHE_ENABLED,
+                 signature: Callable[[str], Optional[Signature]] = file_signature):
+        self.signature = signature
+        self.max_bytes = int(CACHE_MAX_MB * 1024 * 1024) if max_bytes is None else int(max_bytes)
+        self.enabled = enabled
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._lock = threading.RLock()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: str, path: str, loader: Callable[[str], Any]) -> Any:
+        """Devolve o valor em cache ou carrega via `loader(path)` se ausente/obsoleto."""
+        sig = self.signature(path)
+        if sig is None:
+            self.invalidate(key)
+            return loader(path)
+        if not self.enabled:
+            return loader(path)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.signature == sig:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry.value
+            self.misses += 1
+
+        value = loader(path)
+        # o arquivo pode ter mudado durante a leitura; nesse caso não guardamos
+        if self.signature(path) != sig:
+            return value
+        self._store(key, _Entry(sig, value, _frame_nbytes(value), {}))
+        return value
+
+    def is_fresh(self, key: str, path: str) -> bool:
+        """True se a entrada existe e corresponde ao arquivo atual (sem contar hit/miss)."""
+        sig = self.signature(path)
+        with self._lock:
+            entry = self._entries.get(key)
+            return self.enabled and sig is not None and entry is not None and entry.signature == sig
+
+    def derived(self, key: str, name: str, value: Any, builder: Callable[[Any], Any]) -> Any:
+        """
+        Estrutura derivada do valor em cache (ex.: índice de tarefas), construída
+        uma vez por carga e descartada junto com a entrada.
+        Se `value` não for o objeto atualmente em cache, apenas constrói e devolve.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.value is not value:
+                entry = None
+            elif name in entry.derived:
+                return entry.derived[name]
+        built = builder(value)
+        if entry is not None:
+            with self._lock:
+                entry.derived.setdefault(name, built)
+        return built
+
+    def _store(self, key: str, entry: _Entry) -> None:
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old.nbytes
+            self._entries[key] = entry
+            self._bytes += entry.nbytes
+            while self._bytes > self.max_bytes and len(self._entries) > 1:
+                _, ev = self._entries.popitem(last=False)
+                self._bytes -= ev.nbytes
+                self.evictions += 1
+
+    def invalidate(self, key: Optional[str] = None) -> None:
+        """Remove uma entrada (ou todas, se key=None)."""
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+                self._bytes = 0
+                return
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old.nbytes
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+                "keys": list(self._entries.keys()),
+            }
+
+# ------------------------ Snapshots colunares ------------------------
+
+_EXT_SNAPSHOT = {"feather": "feather", "parquet": "parquet", "pickle": "pkl"}
+
+
+def _colunas_mistas(df) -> List[str]:
+    """Colunas object com mais de um tipo não nulo (ex.: duração 30 / 'Concluído'): o Arrow não as aceita."""
+    mistas = []
+    for c in df.columns:
+        if df[c].dtype != object:
+            continue
+        tipos = {type(v) for v in df[c].tolist() if not (v is None or (isinstance(v, float) and v != v))}
+        if len(tipos) > 1:
+            mistas.append(c)
+    return mistas
+
+
+class SnapshotStore:
+    """
+    Espelho em disco do DataFrame normalizado de cada projeto.
+
+    - O nome do arquivo leva o hash da assinatura do .xlsx e de `versao`
+      (`<projeto>.<hash>.<ext>`): o snapshot só é usado enquanto o .xlsx for o
+      mesmo e a normalização não mudar — o .xlsx continua sendo a fonte de verdade.
+    - Formato: Feather (lido por memory map) ou Parquet com pyarrow; sem ele, pickle.
+      Colunas com tipos misturados vão serializadas por valor (lista na metadata).
+    - Gravação atômica (temporário + os.replace); versões antigas são apagadas.
+    """
+
+    def __init__(self, pasta: str, versao: int = 1, enabled: bool = SNAPSHOT_ENABLED,
+                 formato: str = SNAPSHOT_FORMAT):
+        if formato in ("feather", "parquet") and pa is None:
+            formato = "pickle"
+        self.pasta = pasta
+        self.versao = versao
+        self.enabled = enabled
+        self.formato = formato if formato in _EXT_SNAPSHOT else "pickle"
+        self.ext = _EXT_SNAPSHOT[self.formato]
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.errors = 0
+        if self.enabled:
+            os.makedirs(pasta, exist_ok=True)
+
+    def _chave(self, sig: Signature) -> str:
+        bruto = json.dumps([list(sig), self.versao, self.formato])
+        return hashlib.sha1(bruto.encode("utf-8")).hexdigest()[:16]
+
+    def _arquivo(self, nome: str, sig: Signature) -> str:
+        return os.path.join(self.pasta, f"{nome}.{self._chave(sig)}.{self.ext}")
+
+    def _versoes(self, nome: str) -> List[str]:
+        padrao = re.compile(re.escape(nome) + r"\.[0-9a-f]{16}\." + re.escape(self.ext) + "$")
+        try:
+            return [os.path.join(self.pasta, f) for f in os.listdir(self.pasta) if padrao.match(f)]
+        except OSError:
+            return []
+
+    def has(self, nome: str, path: str) -> bool:
+        """Existe snapshot válido para o .xlsx atual?"""
+        sig = file_signature(path)
+        return self.enabled and sig is not None and os.path.exists(self._arquivo(nome, sig))
+
+    def load(self, nome: str, path: str) -> Any:
+        """DataFrame do snapshot válido para o .xlsx atual, ou None."""
+        sig = file_signature(path)
+        if not self.enabled or sig is None:
+            return None
+        alvo = self._arquivo(nome, sig)
+        if not os.path.exists(alvo):
+            self.misses += 1
+            return None
+        try:
+            df = self._ler(alvo)
+        except Exception:
+            self.errors += 1
+            logger.exception("Snapshot ilegível %s; relendo o .xlsx", alvo)
+            return None
+        self.hits += 1
+        return df
+
+    def save(self, nome: str, sig: Optional[Signature], df) -> None:
+        """Grava o snapshot de `df` para a assinatura `sig` (a do .xlsx quando foi lido)."""
+        if not self.enabled or sig is None or df is None:
+            return
+        alvo = self._arquivo(nome, sig)
+        tmp = os.path.join(self.pasta, f".{os.path.basename(alvo)}.{os.getpid()}.{threading.get_ident()}.tmp")
+        try:
+            self._gravar(df, tmp)
+            os.replace(tmp, alvo)
+            self.writes += 1
+        except Exception:
+            self.errors += 1
+            logger.exception("Falha ao gravar snapshot de %s", nome)
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            return
+        for antigo in self._versoes(nome):
+            if antigo != alvo:
+                self._apagar(antigo)
+
+    def remove(self, nome: str) -> None:
+        for antigo in self._versoes(nome):
+            self._apagar(antigo)
+
+    @staticmethod
+    def _apagar(arquivo: str) -> None:
+        try:
+            os.remove(arquivo)
+        except OSError:
+            pass
+
+    def _gravar(self, df, destino: str) -> None:
+        if self.formato == "pickle":
+            with open(destino, "wb") as f:
+                pickle.dump(df, f, protocol=pickle.HIGHEST_PROTOCOL)
+            return
+        mistas = _colunas_mistas(df)
+        if mistas:
+            df = df.copy()
+            for c in mistas:
+                df[c] = [pickle.dumps(v, protocol=pickle.HIGHEST_PROTOCOL) for v in df[c].tolist()]
+        tabela = pa.Table.from_pandas(df, preserve_index=False)
+        meta = dict(tabela.schema.metadata or {})
+        meta[b"colunas_mistas"] = json.dumps(mistas).encode("utf-8")
+        tabela = tabela.replace_schema_metadata(meta)
+        if self.formato == "parquet":
+            pa_parquet.write_table(tabela, destino)
+        else:
+            pa_feather.write_feather(tabela, destino, compression="uncompressed")
+
+    def _ler(self, origem: str):
+        if self.formato == "pickle":
+            with open(origem, "rb") as f:
+                return pickle.load(f)
+        if self.formato == "parquet":
+            tabela = pa_parquet.read_table(origem, memory_map=True)
+        else:
+            tabela = pa_feather.read_table(origem, memory_map=True)
+        mistas = json.loads((tabela.schema.metadata or {}).get(b"colunas_mistas", b"[]"))
+        df = tabela.to_pandas()
+        for c in mistas:
+            df[c] = [pickle.loads(v) for v in df[c].tolist()]
+        # o Arrow devolve nulos de colunas texto como None; o pandas/TextParser usa NaN
+        for c in df.columns[df.dtypes == object]:
+            if c in mistas:
+                continue
+            valores = df[c].to_numpy()
+            nulos = valores == None  # noqa: E711 (comparação elemento a elemento)
+            if nulos.any():
+                valores = valores.copy()
+                valores[nulos] = float("nan")
+                df[c] = valores
+        return df
+
+    def stats(self) -> Dict[str, Any]:
+        return {"enabled": self.enabled, "format": self.formato, "version": self.versao,
+                "hits": self.hits, "misses": self.misses, "writes": self.writes, "errors": self.errors}
+
+# ------------------------ Memoização de respostas ------------------------
+
+class ResponseMemo:
+    """
+    Cache LRU de respostas determinísticas: chave = (intenção, parâmetros, geração).
+    Uma geração nova nunca encontra entradas antigas; `clear()` as descarta de vez.
+    O valor devolvido é compartilhado entre chamadas (não alterar).
+    """
+
+    def __init__(self, max_entries: int = RESPONSE_MEMO_MAX_ENTRIES, enabled: bool = RESPONSE_MEMO_ENABLED):
+        self.max_entries = max(1, int(max_entries))
+        self.enabled = enabled
+        self._entries: "OrderedDict[Tuple[Any, ...], Any]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.clears = 0
+
+    def get(self, intencao: str, params: Tuple[Any, ...], geracao: Any, compute: Callable[[], Any]) -> Any:
+        """Resposta memorizada ou `compute()` (fora do lock) guardada sob a chave."""
+        if not self.enabled:
+            return compute()
+        chave = (intencao, params, geracao)
+        with self._lock:
+            if chave in self._entries:
+                self._entries.move_to_end(chave)
+                self.hits += 1
+                return self._entries[chave]
+            self.misses += 1
+        valor = compute()
+        with self._lock:
+            self._entries[chave] = valor
+            self._entries.move_to_end(chave)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return valor
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.clears += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {"enabled": self.enabled, "entries": len(self._entries), "max_entries": self.max_entries,
+                    "hits": self.hits, "misses": self.misses, "evictions": self.evictions, "clears": self.clears,
+                    "hit_rate": round(self.hits / total, 4) if total else 0.0}
+
+# ------------------------ Gerações de dados ------------------------
+
+class DataGenerations:
+    """
+    Geração (contador monotônico) de cada projeto, para validação condicional HTTP.
+
+    `observe(projeto, token, mtime)` compara o token atual do projeto (ex.:
+    assinatura do arquivo + estado do journal) com o último visto; se mudou, o
+    projeto recebe uma nova geração e o instante da mudança vira o Last-Modified.
+    `boot` distingue execuções do processo (as gerações recomeçam a cada início).
+    """
+
+    def __init__(self):
+        self.boot = uuid.uuid4().hex[:8]
+        self._lock = threading.Lock()
+        self._contador = 0
+        self._estado: Dict[str, Tuple[Any, int, float]] = {}
+
+    def observe(self, projeto: str, token: Any, mtime: Optional[float] = None) -> Tuple[int, float]:
+        """(geração, last_modified epoch) do projeto para o token informado."""
+        with self._lock:
+            atual = self._estado.get(projeto)
+            if atual is not None and atual[0] == token:
+                return atual[1], atual[2]
+            self._contador += 1
+            # 1ª observação: a idade do arquivo; depois, o instante em que a mudança foi vista
+            quando = mtime if (atual is None and mtime) else time.time()
+            self._estado[projeto] = (token, self._contador, quando)
+            return self._contador, quando
+
+    def forget_missing(self, projetos) -> None:
+        manter = set(projetos)
+        with self._lock:
+            for p in [p for p in self._estado if p not in manter]:
+                del self._estado[p]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"boot": self.boot, "generation": self._contador,
+                    "projects": {p: g for p, (_, g, _) in self._estado.items()}}
+
+# ------------------------ Repositório compartilhado ------------------------
+
+class DataRepository:
+    """
+    Ponto único de acesso aos dados dos projetos para todos os apps montados no
+    mesmo processo: cada workbook é lido e guardado uma vez (pelo `carregar` do
+    app principal, com seu cache e journal) e cada consumidor recebe uma visão.
+
+    - `carregar(projeto)` → DataFrame canônico (cópia que o chamador pode alterar)
+    - `geracao(projeto)` → identificador da versão dos dados no escopo
+    - `register_view(nome, fn)`: `fn(df)` adapta colunas/convenções de um consumidor
+    """
+
+    def __init__(self, listar: Callable[[], Dict[str, str]], carregar: Callable[[Optional[str]], Any],
+                 geracao: Callable[[Optional[str]], Any]):
+        self._listar = listar
+        self._carregar = carregar
+        self._geracao = geracao
+        self._views: Dict[str, Callable[[Any], Any]] = {}
+        self._lock = threading.Lock()
+        self._consultas: Dict[str, int] = {}
+
+    def register_view(self, nome: str, fn: Callable[[Any], Any]) -> None:
+        self._views[nome] = fn
+
+    def projetos(self) -> Dict[str, str]:
+        """{nome_projeto: caminho do .xlsx}."""
+        return self._listar()
+
+    def frame(self, projeto: Optional[str] = None, view: Optional[str] = None) -> Any:
+        """DataFrame do projeto (ou de todos, se projeto=None), opcionalmente pela visão `view`."""
+        with self._lock:
+            chave = view or "canonica"
+            self._consultas[chave] = self._consultas.get(chave, 0) + 1
+        df = self._carregar(projeto)
+        return self._views[view](df) if view else df
+
+    def generation(self, projeto: Optional[str] = None) -> Any:
+        return self._geracao(projeto)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"views": sorted(self._views), "queries": dict(self._consultas)}
+
+# ------------------------ Observador da pasta de dados ------------------------
+
+def arquivo_ignorado(path: str) -> bool:
+    """Temporários de upload/gravação e locks do Excel (~$x.xlsx) não são projetos."""
+    nome = os.path.basename(path)
+    return nome.startswith((".", "~$", "__upload_"))
+
+
+class _EventosWatchdog(FileSystemEventHandler):
+    def __init__(self, watcher: "DataWatcher"):
+        self.watcher = watcher
+
+    def on_any_event(self, event) -> None:
+        if getattr(event, "is_directory", False):
+            return
+        for path in (getattr(event, "src_path", None), getattr(event, "dest_path", None)):
+            if path:
+                self.watcher.notify(os.fsdecode(path))
+
+
+class DataWatcher:
+    """
+    Observa `pasta/*.xlsx` e chama `fn(evento, path)` para cada assinante, com
+    evento em 'created' | 'modified' | 'deleted'.
+
+    - Com watchdog instalado os eventos do SO apenas marcam o arquivo como sujo;
+      sem ele a pasta é varrida a cada `poll_s` segundos (assinaturas de arquivo).
+    - Em ambos os casos a confirmação é pela assinatura (mtime/size/inode), após
+      `debounce_s` sem novos eventos, numa thread própria: gravações do próprio
+      app (que já aquecem o cache) não geram trabalho extra nos assinantes.
+    - O estado inicial é registrado sem eventos; quem precisar carrega sob demanda.
+    """
+
+    def __init__(self, pasta: str, pattern: str = "*.xlsx", enabled: bool = WATCHER_ENABLED,
+                 poll_s: float = WATCHER_POLL_S, debounce_s: float = WATCHER_DEBOUNCE_S):
+        self.pasta = pasta
+        self.pattern = pattern
+        self.enabled = enabled
+        self.poll_s = poll_s
+        self.debounce_s = debounce_s
+        self._assinantes: List[Callable[[str, str], None]] = []
+        self._snapshot: Dict[str, Signature] = {}
+        self._sujos: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._observer = None
+        self.mode = "off"
+        self.events = {"created": 0, "modified": 0, "deleted": 0}
+        self.errors = 0
+        self.last_error: Optional[str] = None
+
+    def subscribe(self, fn: Callable[[str, str], None]) -> None:
+        self._assinantes.append(fn)
+
+    def _arquivos(self) -> Set[str]:
+        return {os.path.abspath(p) for p in glob.glob(os.path.join(self.pasta, self.pattern))
+                if not arquivo_ignorado(p)}
+
+    def start(self) -> None:
+        """Registra o estado atual e liga a thread de observação (idempotente)."""
+        if not self.enabled or self._thread is not None:
+            return
+        with self._lock:
+            self._snapshot = {p: sig for p in self._arquivos()
+                              if (sig := file_signature(p)) is not None}
+        if Observer is not None:
+            try:
+                self._observer = Observer()
+                self._observer.schedule(_EventosWatchdog(self), self.pasta, recursive=False)
+                self._observer.daemon = True
+                self._observer.start()
+                self.mode = "watchdog"
+            except Exception:
+                logger.exception("DataWatcher: watchdog indisponível; usando polling")
+                self._observer = None
+        if self._observer is None:
+            self.mode = "polling"
+        self._thread = threading.Thread(target=self._run, name="data-watcher", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._wake.set()
+        if self._observer is not None:
+            try:
+                self._observer.stop()
+            except Exception:
+                pass
+
+    def notify(self, path: str) -> None:
+        """Marca `path` como possivelmente alterado (eventos do SO ou do próprio app)."""
+        path = os.path.abspath(path)
+        if not fnmatch.fnmatch(os.path.basename(path), self.pattern) or arquivo_ignorado(path):
+            return
+        with self._lock:
+            self._sujos[path] = time.monotonic()
+        self._wake.set()
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self._wake.wait(timeout=self.debounce_s if self._sujos else self.poll_s)
+            self._wake.clear()
+            if self._stop.is_set():
+                return
+            if self.mode == "polling":
+                with self._lock:
+                    candidatos = self._arquivos() | set(self._snapshot)
+                    self._sujos.clear()
+            else:
+                limite = time.monotonic() - self.debounce_s
+                with self._lock:
+                    candidatos = {p for p, t in self._sujos.items() if t <= limite}
+                    for p in candidatos:
+                        del self._sujos[p]
+            for path in sorted(candidatos):
+                self._verificar(path)
+
+    def scan(self) -> int:
+        """Confere agora todos os arquivos (útil em testes/diagnóstico). Retorna nº de eventos."""
+        with self._lock:
+            candidatos = self._arquivos() | set(self._snapshot)
+        return sum(self._verificar(p) for p in sorted(candidatos))
+
+    def _verificar(self, path: str) -> bool:
+        sig = file_signature(path)
+        with self._lock:
+            antiga = self._snapshot.get(path)
+            if sig == antiga:
+                return False
+            if sig is None:
+                self._snapshot.pop(path, None)
+                evento = "deleted"
+            else:
+                self._snapshot[path] = sig
+                evento = "created" if antiga is None else "modified"
+            self.events[evento] += 1
+        for fn in list(self._assinantes):
+            try:
+                fn(evento, path)
+            except Exception as e:
+                self.errors += 1
+                self.last_error = f"{os.path.basename(path)}: {e}"
+                logger.exception("DataWatcher: assinante falhou para %s (%s)", path, evento)
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"enabled": self.enabled, "mode": self.mode, "files": len(self._snapshot),
+                    "dirty": len(self._sujos), "events": dict(self.events),
+                    "errors": self.errors, "last_error": self.last_error}
+
+# ------------------------ Leitura de workbook (passada única) ------------------------
+
+class AbaLida(NamedTuple):
+    nome: str
+    df: Any                         # DataFrame com os valores (cabeçalho = 1ª linha)
+    links: Dict[int, Dict[int, str]]  # {posição da coluna: {linha de dados (0-based): URL}}
+
+
+def _convert_cell(cell) -> Any:
+    """Mesma conversão de célula usada pelo pandas.read_excel (engine openpyxl)."""
+    value = cell.value
+    if value is None:
+        return ""
+    if cell.data_type == "e":
+        return float("nan")
+    if cell.data_type == "n":
+        as_int = int(value)
+        return as_int if as_int == value else float(value)
+    return value
+
+
+def _ler_aba(ws):
+    """Percorre a aba uma única vez devolvendo (linhas convertidas, hyperlinks)."""
+    data: List[list] = []
+    links: Dict[int, Dict[int, str]] = {}
+    last_row_with_data = -1
+    for row_number, row in enumerate(ws.iter_rows(min_row=1, min_col=1)):
+        converted = []
+        for col, cell in enumerate(row):
+            converted.append(_convert_cell(cell))
+            link = getattr(cell, "hyperlink", None)
+            if row_number > 0 and link is not None and getattr(link, "target", None):
+                links.setdefault(col, {})[row_number - 1] = link.target
+        while converted and converted[-1] == "":
+            converted.pop()
+        if converted:
+            last_row_with_data = row_number
+        data.append(converted)
+
+    data = data[: last_row_with_data + 1]
+    if data:
+        width = max(len(r) for r in data)
+        data = [r + [""] * (width - len(r)) for r in data]
+    return data, links
+
+
+def ler_workbook(path: str) -> List[AbaLida]:
+    """
+    Abre o .xlsx UMA vez e devolve, por aba, os valores e os hyperlinks.
+
+    Os valores passam pelo mesmo TextParser usado por `pd.read_excel`, então o
+    DataFrame resultante é equivalente a `pd.read_excel(path, sheet_name=None)`.
+    O modo read_only do openpyxl descarta hyperlinks, por isso a leitura usa o
+    modo normal — ainda assim é uma única carga no lugar das duas anteriores.
+    """
+    import pandas as pd
+    from openpyxl import load_workbook
+    from pandas.errors import EmptyDataError
+    from pandas.io.parsers import TextParser
+
+    wb = load_workbook(path, data_only=True)
+    try:
+        abas: List[AbaLida] = []
+        for ws in wb.worksheets:
+            data, links = _ler_aba(ws)
+            if not data:
+                abas.append(AbaLida(ws.title, pd.DataFrame(), {}))
+                continue
+            try:
+                df = TextParser(data, header=0, skip_blank_lines=False).read()
+            except EmptyDataError:
+                df = pd.DataFrame()
+            n = len(df)
+            links = {c: {r: u for r, u in m.items() if r < n} for c, m in links.items()}
+            abas.append(AbaLida(ws.title, df, {c: m for c, m in links.items() if m}))
+        return abas
+    finally:
+        wb.close()
+
+
+def abas_workbook(path: str) -> List[str]:
+    """Nomes das abas (mesmas chaves de `pd.read_excel(sheet_name=None)`) sem ler as células."""
+    from openpyxl import load_workbook
+
+    wb = load_workbook(path, read_only=True)
+    try:
+        return [ws.title for ws in wb.worksheets]
+    finally:
+        wb.close()
+
+# ------------------------ Leitura em paralelo (processos) ------------------------
+
+_POOL: Optional[ProcessPoolExecutor] = None
+_POOL_LOCK = threading.Lock()
+
+
+def _workers() -> int:
+    return PARALLEL_LOAD_WORKERS if PARALLEL_LOAD_WORKERS > 0 else min(os.cpu_count() or 1, 8)
+
+
+def _pool() -> ProcessPoolExecutor:
+    global _POOL
+    with _POOL_LOCK:
+        if _POOL is None:
+            _POOL = ProcessPoolExecutor(max_workers=_workers(),
+                                        mp_context=multiprocessing.get_context(PARALLEL_LOAD_START))
+            atexit.register(encerrar_pool)
+        return _POOL
+
+
+def encerrar_pool() -> None:
+    """Desliga os processos de leitura (recriados sob demanda)."""
+    global _POOL
+    with _POOL_LOCK:
+        pool, _POOL = _POOL, None
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _cronometrar(fn: Callable[[str], Any], path: str) -> Tuple[Any, float, int]:
+    """Executado no worker: (resultado, segundos, pid). Precisa ser de módulo (pickle)."""
+    t0 = time.perf_counter()
+    return fn(path), time.perf_counter() - t0, os.getpid()
+
+
+def _ler_com_assinatura(path: str) -> Tuple[Optional[Signature], List[AbaLida]]:
+    """Assinatura ANTES da leitura: quem recebe confere se o arquivo não mudou depois."""
+    return file_signature(path), ler_workbook(path)
+
+
+def map_arquivos(fn: Callable[[str], Any], paths: List[str], paralelo: Optional[bool] = None) -> Dict[str, Any]:
+    """
+    {path: fn(path)} para vários arquivos. Com PARALLEL_LOAD_ENABLED (ou paralelo=True)
+    e mais de um arquivo, distribui entre processos; `fn` e o resultado precisam
+    ser serializáveis por pickle (DataFrames, NamedTuples e dicts são).
+    Arquivos que falham ficam de fora do resultado (o erro vai para o log).
+    """
+    paralelo = PARALLEL_LOAD_ENABLED if paralelo is None else paralelo
+    resultados: Dict[str, Any] = {}
+    t0 = time.perf_counter()
+    if paralelo and len(paths) > 1:
+        try:
+            pool = _pool()
+            futuros = {pool.submit(_cronometrar, fn, p): p for p in paths}
+            for fut in as_completed(futuros):
+                path = futuros[fut]
+                try:
+                    resultados[path], seg, pid = fut.result()
+                    logger.info("Leitura %s: %.0f ms (pid %d)", os.path.basename(path), seg * 1000, pid)
+                except BrokenProcessPool:
+                    raise
+                except Exception:
+                    logger.exception("Falha lendo %s", path)
+        except BrokenProcessPool:
+            logger.exception("Pool de leitura quebrado; lendo em série")
+            encerrar_pool()
+            paths = [p for p in paths if p not in resultados]
+            paralelo = False
+    if not paralelo or len(paths) <= 1:
+        for path in paths:
+            try:
+                resultados[path], seg, pid = _cronometrar(fn, path)
+                logger.info("Leitura %s: %.0f ms (pid %d)", os.path.basename(path), seg * 1000, pid)
+            except Exception:
+                logger.exception("Falha lendo %s", path)
+    if len(paths) > 1:
+        logger.info("Leitura de %d arquivo(s) em %.0f ms", len(resultados), (time.perf_counter() - t0) * 1000)
+    return resultados
+
+
+def ler_workbooks(paths: List[str], paralelo: Optional[bool] = None) -> Dict[str, Tuple[Optional[Signature], List[AbaLida]]]:
+    """{path: (assinatura antes da leitura, ler_workbook(path))}, em paralelo se configurado."""
+    return map_arquivos(_ler_com_assinatura, paths, paralelo)
+
+
+def abas_workbooks(paths: List[str], paralelo: Optional[bool] = None) -> Dict[str, List[str]]:
+    """{path: nomes das abas}, em paralelo se configurado."""
+    return map_arquivos(abas_workbook, paths, paralelo)
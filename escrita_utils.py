@@ -0,0 +1,574 @@
+"""
+Módulo de escrita pontual em planilhas para o Challenge2025.
+
+Funções principais:
+- patch_task_cells: altera apenas as células de UMA tarefa no .xlsx
+- append_task_row: acrescenta uma tarefa após a última linha preenchida da aba
+- apply_task_ops: aplica um lote de patches/appends com uma única abertura do arquivo
+- MutationJournal: journal write-behind (append + fsync) com compactação periódica
+- ProjectLocks: locks por projeto (threads + lock de arquivo opcional entre processos)
+- save_workbook_atomic: grava em arquivo temporário, fsync e os.replace
+
+patch_task_cells, append_task_row e apply_task_ops abrem o workbook uma única
+vez com openpyxl (sem `data_only`), então fórmulas, formatação e hyperlinks
+das demais células são preservados — ao contrário da regravação completa via pandas.
+
+Uso no app_final.py:
+
+    from escrita_utils import patch_task_cells, append_task_row
+
+    patch_task_cells(path, sheet, {'concluida': 1, 'porcentagem': 100},
+                     numero=12, task_uuid=uuid_da_tarefa, aliases=_COLMAP)
+
+`aliases` mapeia cabeçalhos do Excel para os nomes canônicos usados no
+DataFrame (ex.: 'Número' → 'numero'); colunas ausentes são criadas no fim
+do cabeçalho com o nome canônico.
+"""
+from __future__ import annotations
+
+import os
+import re
+import json
+import time
+import logging
+import threading
+import datetime as dt
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from seguranca_utils import numero_key
+
+logger = logging.getLogger(__name__)
+
+# ------------------------ Config ------------------------
+WRITE_BEHIND_ENABLED = os.environ.get("WRITE_BEHIND_ENABLED", "true").lower() == "true"
+JOURNAL_INTERVAL_S = float(os.environ.get("JOURNAL_INTERVAL_S", "2"))
+JOURNAL_MAX_PENDING = int(os.environ.get("JOURNAL_MAX_PENDING", "50"))
+JOURNAL_FSYNC = os.environ.get("JOURNAL_FSYNC", "true").lower() == "true"
+JOURNAL_MAX_RETRIES = int(os.environ.get("JOURNAL_MAX_RETRIES", "5"))
+FILE_LOCKS_ENABLED = os.environ.get("FILE_LOCKS_ENABLED", "false").lower() == "true"
+
+
+class PatchError(Exception):
+    def __init__(self, error: str, msg: str = ""):
+        super().__init__(msg or error)
+        self.error = error
+
+# ------------------------ Helpers ------------------------
+
+def _cell_value(v: Any) -> Any:
+    """Converte valores pandas/numpy em tipos aceitos pelo openpyxl (NaN → vazio)."""
+    if v is None:
+        return None
+    if hasattr(v, "item") and not isinstance(v, (str, bytes)):
+        try:
+            v = v.item()
+        except Exception:
+            pass
+    if isinstance(v, float) and v != v:
+        return None
+    if hasattr(v, "to_pydatetime"):
+        try:
+            return v.to_pydatetime()
+        except Exception:
+            return None
+    if isinstance(v, (str, int, float, bool, dt.datetime, dt.date)):
+        return v
+    return str(v)
+
+
+def _header_map(ws, aliases: Optional[Dict[str, str]]) -> Dict[str, int]:
+    """{nome canônico: coluna (1-based)} a partir da 1ª linha; 1ª ocorrência vence."""
+    aliases = aliases or {}
+    out: Dict[str, int] = {}
+    for cell in ws[1]:
+        if cell.value is None or str(cell.value).strip() == "":
+            continue
+        raw = str(cell.value).strip()
+        out.setdefault(aliases.get(raw, raw), cell.column)
+    return out
+
+
+def _ensure_column(ws, hmap: Dict[str, int], name: str) -> int:
+    col = hmap.get(name)
+    if col is None:
+        col = max(hmap.values(), default=0) + 1
+        while ws.cell(row=1, column=col).value not in (None, ""):
+            col += 1
+        ws.cell(row=1, column=col).value = name
+        hmap[name] = col
+    return col
+
+
+def _last_data_row(ws) -> int:
+    """Última linha com algum valor (ignora linhas vazias só com formatação)."""
+    for r in range(ws.max_row, 0, -1):
+        if any(c.value not in (None, "") for c in ws[r]):
+            return r
+    return 0
+
+
+def _find_row(ws, hmap: Dict[str, int], numero: Any = None, task_uuid: Optional[str] = None,
+              row_hint: Optional[int] = None) -> Optional[int]:
+    """
+    Localiza a linha da tarefa: 1) task_uuid; 2) `row_hint` (posição conhecida na
+    carga), se o número nela conferir; 3) primeira linha com o mesmo número.
+    """
+    if task_uuid and "task_uuid" in hmap:
+        col = hmap["task_uuid"]
+        for r, (val,) in enumerate(ws.iter_rows(min_row=2, min_col=col, max_col=col, values_only=True), start=2):
+            if val is not None and str(val) == str(task_uuid):
+                return r
+    alvo = numero_key(numero) if numero is not None else None
+    if row_hint and 2 <= row_hint <= ws.max_row:
+        if "numero" not in hmap:
+            return row_hint
+        val = ws.cell(row=row_hint, column=hmap["numero"]).value
+        # célula vazia = linha anterior à criação da coluna (carga assume número 0)
+        if alvo is None or numero_key(val) == alvo or (val in (None, "") and alvo in ("", "0")):
+            return row_hint
+    if alvo is not None and "numero" in hmap:
+        col = hmap["numero"]
+        for r, (val,) in enumerate(ws.iter_rows(min_row=2, min_col=col, max_col=col, values_only=True), start=2):
+            if val is not None and numero_key(val) == alvo:
+                return r
+    return None
+
+def _patch_ws(ws, hmap: Dict[str, int], changes: Dict[str, Any], numero: Any = None,
+              task_uuid: Optional[str] = None, row_hint: Optional[int] = None) -> int:
+    row = _find_row(ws, hmap, numero=numero, task_uuid=task_uuid, row_hint=row_hint)
+    if row is None:
+        raise PatchError("task_not_found", f"Tarefa {numero} não encontrada em '{ws.title}'")
+    for name, value in changes.items():
+        col = _ensure_column(ws, hmap, name)
+        ws.cell(row=row, column=col).value = _cell_value(value)
+    return row
+
+
+def _append_ws(ws, hmap: Dict[str, int], values: Dict[str, Any]) -> int:
+    # idempotente: se a tarefa (task_uuid) já está na aba, não duplica
+    task_uuid = values.get("task_uuid")
+    if task_uuid and "task_uuid" in hmap:
+        existente = _find_row(ws, hmap, task_uuid=task_uuid)
+        if existente is not None:
+            return existente
+    row = max(_last_data_row(ws), 1) + 1
+    for name, value in values.items():
+        col = _ensure_column(ws, hmap, name)
+        ws.cell(row=row, column=col).value = _cell_value(value)
+    return row
+
+def save_workbook_atomic(wb, path: str) -> None:
+    """
+    Salva o workbook sem expor arquivo pela metade: grava num temporário no
+    mesmo diretório, faz fsync e troca com os.replace (atômico no mesmo volume).
+    """
+    pasta, nome = os.path.split(os.path.abspath(path))
+    tmp = os.path.join(pasta, f".{nome}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        with open(tmp, "wb") as f:
+            wb.save(f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+# ------------------------ API ------------------------
+
+def apply_task_ops(path: str, ops: List[Dict[str, Any]], aliases: Optional[Dict[str, str]] = None,
+                   strict: bool = True) -> int:
+    """
+    Aplica várias operações abrindo e salvando o workbook uma única vez.
+
+    Cada op é um dict:
+      - {'op': 'patch', 'sheet', 'changes', 'numero'?, 'task_uuid'?, 'row_hint'?}
+      - {'op': 'append', 'sheet', 'values'}
+
+    strict=True  → levanta PatchError na primeira op inválida (nada é salvo).
+    strict=False → ignora (e registra em log) ops inválidas e salva as demais.
+    Retorna a quantidade de ops aplicadas.
+    """
+    from openpyxl import load_workbook
+
+    wb = load_workbook(path)
+    try:
+        hmaps: Dict[str, Dict[str, int]] = {}
+        aplicadas = 0
+        for op in ops:
+            sheet = str(op.get("sheet"))
+            try:
+                if op.get("op") == "append":
+                    if sheet not in wb.sheetnames:
+                        wb.create_sheet(title=sheet)
+                    ws = wb[sheet]
+                    hmap = hmaps.setdefault(sheet, _header_map(ws, aliases))
+                    _append_ws(ws, hmap, op.get("values") or {})
+                else:
+                    if sheet not in wb.sheetnames:
+                        raise PatchError("sheet_not_found", f"Aba '{sheet}' não encontrada")
+                    ws = wb[sheet]
+                    hmap = hmaps.setdefault(sheet, _header_map(ws, aliases))
+                    _patch_ws(ws, hmap, op.get("changes") or {}, numero=op.get("numero"),
+                              task_uuid=op.get("task_uuid"), row_hint=op.get("row_hint"))
+                aplicadas += 1
+            except PatchError:
+                if strict:
+                    raise
+                logger.warning("Operação ignorada em %s: %s", path, op, exc_info=True)
+        if aplicadas:
+            save_workbook_atomic(wb, path)
+        return aplicadas
+    finally:
+        wb.close()
+
+
+def patch_task_cells(path: str, sheet: str, changes: Dict[str, Any], numero: Any = None,
+                     task_uuid: Optional[str] = None, row_hint: Optional[int] = None,
+                     aliases: Optional[Dict[str, str]] = None) -> None:
+    """
+    Atualiza somente as células em `changes` da linha (sheet, task_uuid/numero).
+    `row_hint` é a linha esperada no Excel (usada quando não há task_uuid gravado).
+    Levanta PatchError se aba/tarefa não existir.
+    """
+    apply_task_ops(path, [{"op": "patch", "sheet": sheet, "changes": changes, "numero": numero,
+                           "task_uuid": task_uuid, "row_hint": row_hint}], aliases=aliases)
+
+
+def append_task_row(path: str, sheet: str, values: Dict[str, Any],
+                    aliases: Optional[Dict[str, str]] = None) -> None:
+    """
+    Acrescenta uma linha com `values` após a última linha preenchida da aba
+    (criando a aba, com cabeçalho, se ainda não existir).
+    """
+    apply_task_ops(path, [{"op": "append", "sheet": sheet, "values": values}], aliases=aliases)
+
+# ------------------------ Journal (write-behind) ------------------------
+
+class MutationJournal:
+    """
+    Journal append-only das mutações pendentes, compactado em segundo plano.
+
+    - `append(projeto, op)` grava a op (JSON por linha, com fsync) e retorna na hora.
+    - Um compactador (thread) aplica as ops pendentes de cada projeto em lote via
+      `apply_fn(projeto, ops)` a cada `interval` segundos, ou antes se houver
+      `max_pending` ops acumuladas; ops aplicadas saem do arquivo.
+    - Na criação o arquivo é relido (replay), então ops de uma execução
+      interrompida são aplicadas na próxima compactação.
+    - `pending(projeto)` devolve as ops ainda não gravadas no .xlsx, para que as
+      leituras possam sobrepô-las ao conteúdo do arquivo.
+    - Um lote que falha `max_retries` vezes seguidas sai da fila e vai para o
+      arquivo de descarte (`<journal>.dead.jsonl`, com o erro), para não ser
+      retentado para sempre nem travar as ops seguintes do projeto.
+    """
+
+    def __init__(self, path: str, enabled: bool = WRITE_BEHIND_ENABLED,
+                 interval: float = JOURNAL_INTERVAL_S, max_pending: int = JOURNAL_MAX_PENDING,
+                 fsync: bool = JOURNAL_FSYNC, max_retries: int = JOURNAL_MAX_RETRIES):
+        self.path = path
+        base, ext = os.path.splitext(path)
+        self.dead_path = f"{base}.dead{ext or '.jsonl'}"
+        self.max_retries = max(1, int(max_retries))
+        self._falhas: Dict[str, int] = {}
+        self.enabled = enabled
+        self.interval = interval
+        self.max_pending = max_pending
+        self.fsync = fsync
+        self._pending: Dict[str, List[Dict[str, Any]]] = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Condition(self._lock)
+        self._flush_lock = threading.Lock()
+        self._apply_fn: Optional[Callable[[str, List[Dict[str, Any]]], None]] = None
+        self._thread: Optional[threading.Thread] = None
+        self._seq = 0
+        self.appended = 0
+        self.batches = 0
+        self.applied = 0
+        self.errors = 0
+        self.dead_lettered = 0
+        self.last_error: Optional[str] = None
+        if self.enabled:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            self._replay()
+
+    def _replay(self) -> None:
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except Exception:
+                    continue
+                projeto = entry.get("projeto")
+                if not projeto:
+                    continue
+                self._pending.setdefault(projeto, []).append(entry)
+                self._seq = max(self._seq, int(entry.get("seq") or 0))
+        n = sum(len(v) for v in self._pending.values())
+        if n:
+            logger.info("Journal: %d mutação(ões) pendente(s) recuperada(s) de %s", n, self.path)
+
+    def append(self, projeto: str, op: Dict[str, Any]) -> Dict[str, Any]:
+        with self._lock:
+            self._seq += 1
+            entry = json.loads(json.dumps({**op, "projeto": projeto, "seq": self._seq,
+                                           "ts": dt.datetime.now().isoformat(timespec="seconds")},
+                                          ensure_ascii=False, default=_json_default))
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+                f.flush()
+                if self.fsync:
+                    os.fsync(f.fileno())
+            self._pending.setdefault(projeto, []).append(entry)
+            self.appended += 1
+            if sum(len(v) for v in self._pending.values()) >= self.max_pending:
+                self._wake.notify()
+        return entry
+
+    def pending(self, projeto: Optional[str] = None) -> List[Dict[str, Any]]:
+        with self._lock:
+            if projeto is None:
+                return [e for es in self._pending.values() for e in es]
+            return list(self._pending.get(projeto, ()))
+
+    def start(self, apply_fn: Callable[[str, List[Dict[str, Any]]], None]) -> None:
+        """Liga o compactador em segundo plano (idempotente)."""
+        self._apply_fn = apply_fn
+        if not self.enabled or self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="journal-compactor", daemon=True)
+        self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            with self._lock:
+                self._wake.wait(timeout=self.interval)
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Journal: falha na compactação")
+
+    def flush(self) -> int:
+        """Aplica agora todas as ops pendentes. Retorna quantas foram aplicadas."""
+        if not self.enabled or self._apply_fn is None:
+            return 0
+        total = 0
+        with self._flush_lock:
+            with self._lock:
+                lote = {p: list(es) for p, es in self._pending.items() if es}
+            for projeto, ops in lote.items():
+                try:
+                    self._apply_fn(projeto, ops)
+                except Exception as e:
+                    self.errors += 1
+                    self.last_error = f"{projeto}: {e}"
+                    falhas = self._falhas[projeto] = self._falhas.get(projeto, 0) + 1
+                    logger.exception("Journal: falha ao aplicar lote de %s (tentativa %d/%d)",
+                                     projeto, falhas, self.max_retries)
+                    if falhas >= self.max_retries:
+                        self._descartar(projeto, ops, e)
+                    continue
+                self._falhas.pop(projeto, None)
+                self.ack(projeto, ops[-1]["seq"])
+                self.batches += 1
+                self.applied += len(ops)
+                total += len(ops)
+        return total
+
+    def _descartar(self, projeto: str, ops: List[Dict[str, Any]], erro: Exception) -> None:
+        """Move o lote que não para de falhar para o arquivo de descarte e o tira da fila."""
+        with open(self.dead_path, "a", encoding="utf-8") as f:
+            for e in ops:
+                f.write(json.dumps({**e, "erro": str(erro)}, ensure_ascii=False, default=_json_default) + "\n")
+            f.flush()
+            if self.fsync:
+                os.fsync(f.fileno())
+        self.ack(projeto, ops[-1]["seq"])
+        self._falhas.pop(projeto, None)
+        self.dead_lettered += len(ops)
+        logger.error("Journal: %d op(s) de %s movida(s) para %s após %d falha(s): %s",
+                     len(ops), projeto, self.dead_path, self.max_retries, erro)
+
+    def ack(self, projeto: str, ate_seq: int) -> None:
+        """
+        Marca como gravadas no .xlsx as ops de `projeto` com seq ≤ ate_seq.
+        O `apply_fn` pode chamar antes de liberar o lock do projeto, para que
+        leitores nunca vejam o arquivo novo junto com as ops ainda pendentes.
+        """
+        with self._lock:
+            atuais = self._pending.get(projeto, [])
+            restantes = [e for e in atuais if e["seq"] > ate_seq]
+            if len(restantes) == len(atuais):
+                return
+            if restantes:
+                self._pending[projeto] = restantes
+            else:
+                self._pending.pop(projeto, None)
+            self._rewrite_locked()
+
+    def _rewrite_locked(self) -> None:
+        """Regrava o arquivo só com as ops pendentes (temp + os.replace)."""
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            for e in sorted((e for es in self._pending.values() for e in es), key=lambda e: e["seq"]):
+                f.write(json.dumps(e, ensure_ascii=False) + "\n")
+            f.flush()
+            if self.fsync:
+                os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            pendentes = {p: len(es) for p, es in self._pending.items() if es}
+        return {
+            "enabled": self.enabled,
+            "pending": sum(pendentes.values()),
+            "pending_by_project": pendentes,
+            "appended": self.appended,
+            "batches": self.batches,
+            "applied": self.applied,
+            "errors": self.errors,
+            "failing": dict(self._falhas),
+            "dead_lettered": self.dead_lettered,
+            "last_error": self.last_error,
+        }
+
+
+# ------------------------ Locks por projeto ------------------------
+
+def _lock_file(f) -> None:
+    if os.name == "nt":
+        import msvcrt
+        f.seek(0)
+        while True:
+            try:
+                msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                return
+            except OSError:
+                # LK_LOCK desiste após ~10s; continua tentando
+                continue
+    import fcntl
+    fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+
+
+def _unlock_file(f) -> None:
+    if os.name == "nt":
+        import msvcrt
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+        return
+    import fcntl
+    fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+class _ProjectLock:
+    __slots__ = ("rlock", "depth", "fh", "acquisitions", "contended", "wait_total", "wait_max")
+
+    def __init__(self):
+        self.rlock = threading.RLock()
+        self.depth = 0
+        self.fh = None
+        self.acquisitions = 0
+        self.contended = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+
+class ProjectLocks:
+    """
+    Exclusão mútua por projeto para o ciclo ler → alterar → gravar.
+
+    - Um RLock por projeto: projetos diferentes continuam gravando em paralelo,
+      e a mesma thread pode reentrar (ex.: handler que dispara uma compactação).
+    - Com `cross_process=True` a aquisição mais externa também trava
+      `<lock_dir>/<projeto>.lock` (fcntl no Linux/macOS, msvcrt no Windows),
+      para vários processos servindo a mesma pasta de dados.
+    - `stats()` expõe aquisições, esperas com disputa e tempo de espera.
+    """
+
+    def __init__(self, lock_dir: Optional[str] = None, cross_process: bool = FILE_LOCKS_ENABLED):
+        self.lock_dir = lock_dir
+        self.cross_process = bool(cross_process and lock_dir)
+        self._locks: Dict[str, _ProjectLock] = {}
+        self._guard = threading.Lock()
+        if self.cross_process:
+            os.makedirs(lock_dir, exist_ok=True)
+
+    def _get(self, projeto: str) -> _ProjectLock:
+        with self._guard:
+            pl = self._locks.get(projeto)
+            if pl is None:
+                pl = self._locks[projeto] = _ProjectLock()
+            return pl
+
+    def _lock_path(self, projeto: str) -> str:
+        return os.path.join(self.lock_dir, re.sub(r"[^\w.-]+", "_", projeto) + ".lock")
+
+    @contextmanager
+    def lock(self, projeto: str) -> Iterator[None]:
+        pl = self._get(str(projeto))
+        t0 = time.perf_counter()
+        contended = not pl.rlock.acquire(blocking=False)
+        if contended:
+            pl.rlock.acquire()
+        try:
+            if pl.depth == 0 and self.cross_process:
+                fh = open(self._lock_path(str(projeto)), "a+b")
+                try:
+                    _lock_file(fh)
+                except Exception:
+                    fh.close()
+                    raise
+                pl.fh = fh
+            espera = time.perf_counter() - t0
+            pl.depth += 1
+            pl.acquisitions += 1
+            pl.contended += int(contended or espera > 0.001)
+            pl.wait_total += espera
+            pl.wait_max = max(pl.wait_max, espera)
+            try:
+                yield
+            finally:
+                pl.depth -= 1
+                if pl.depth == 0 and pl.fh is not None:
+                    fh, pl.fh = pl.fh, None
+                    try:
+                        _unlock_file(fh)
+                    finally:
+                        fh.close()
+        finally:
+            pl.rlock.release()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._guard:
+            itens = list(self._locks.items())
+        por_projeto = {
+            p: {
+                "acquisitions": pl.acquisitions,
+                "contended": pl.contended,
+                "wait_total_ms": round(pl.wait_total * 1000, 3),
+                "wait_max_ms": round(pl.wait_max * 1000, 3),
+                "held": pl.depth > 0,
+            }
+            for p, pl in itens
+        }
+        total = sum(v["acquisitions"] for v in por_projeto.values())
+        espera = sum(pl.wait_total for _, pl in itens)
+        return {
+            "cross_process": self.cross_process,
+            "acquisitions": total,
+            "contended": sum(v["contended"] for v in por_projeto.values()),
+            "wait_total_ms": round(espera * 1000, 3),
+            "wait_avg_ms": round(espera * 1000 / total, 3) if total else 0.0,
+            "wait_max_ms": max((v["wait_max_ms"] for v in por_projeto.values()), default=0.0),
+            "by_project": por_projeto,
+        }
+
+
+def _json_default(v: Any) -> Any:
+    v = _cell_value(v)
+    if isinstance(v, (dt.datetime, dt.date)):
+        return v.isoformat()
+    return v
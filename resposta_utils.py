@@ -0,0 +1,154 @@
+"""
+Módulo de serialização de respostas JSON para o Challenge2025.
+
+Funções principais:
+- dumps: objeto Python (dict/list com escalares numpy/pandas, NaN/NaT) → bytes JSON
+- records_json: fatia de DataFrame → bytes JSON (lista de registros) numa passada
+- ndjson_blocos: fatia de DataFrame → blocos NDJSON (bytes), uma tarefa por linha
+- json_response: Response Flask a partir de um objeto, serializado com `dumps`
+- limpar: NaN/NaT/NA → None e escalares numpy → tipos nativos (recursivo)
+
+Usa orjson quando instalado (e ORJSON_ENABLED=true); caso contrário cai no
+`json` da biblioteca padrão com a mesma saída semântica.
+
+Uso no app_final.py:
+
+    from resposta_utils import records_json, json_response
+
+    corpo = b'{"cronograma":' + records_json(df) + b'}'
+    return app.response_class(corpo, mimetype='application/json')
+
+    return json_response({'success': True, 'task': df.loc[i].to_dict()})
+
+Diferenças em relação a `DataFrame.to_json`: floats saem com precisão
+completa (to_json corta em 10 dígitos) e datas saem em ISO 8601 (to_json
+usa epoch em ms).
+"""
+from __future__ import annotations
+
+import os
+import json
+import math
+import datetime as dt
+from decimal import Decimal
+from typing import Any, Iterable, Iterator, List, Optional
+
+import numpy as np
+import pandas as pd
+
+try:  # opcional
+    import orjson
+except ImportError:  # pragma: no cover - depende do ambiente
+    orjson = None
+
+# ------------------------ Config ------------------------
+ORJSON_ENABLED = os.environ.get("ORJSON_ENABLED", "true").lower() == "true"
+
+_ORJSON_OPTS = 0
+if orjson is not None:
+    _ORJSON_OPTS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+
+def backend() -> str:
+    """Nome do serializador em uso ('orjson' ou 'json')."""
+    return "orjson" if (ORJSON_ENABLED and orjson is not None) else "json"
+
+# ------------------------ Escalares ------------------------
+
+def _default(value: Any) -> Any:
+    """Conversão de tipos que nenhum dos serializadores conhece."""
+    if value is pd.NaT or value is pd.NA:
+        return None
+    if isinstance(value, np.generic):
+        value = value.item()
+        if isinstance(value, float) and not math.isfinite(value):
+            return None
+        if isinstance(value, (dt.datetime, dt.date)):
+            return value.isoformat()
+        return value
+    if isinstance(value, (dt.datetime, dt.date, dt.time)):
+        return value.isoformat()
+    if isinstance(value, pd.Timedelta):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value) if value.is_finite() else None
+    if isinstance(value, np.ndarray):
+        return limpar(value.tolist())
+    if isinstance(value, (set, frozenset, tuple)):
+        return limpar(list(value))
+    return str(value)
+
+
+def limpar(value: Any) -> Any:
+    """Converte NaN/NaT/NA em None e escalares numpy em nativos, recursivamente."""
+    if value is None or isinstance(value, (str, bool, int)):
+        return value
+    if isinstance(value, float):
+        return value if math.isfinite(value) else None
+    if isinstance(value, dict):
+        return {k: limpar(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [limpar(v) for v in value]
+    return _default(value)
+
+# ------------------------ Objetos ------------------------
+
+def dumps(obj: Any, _limpo: bool = False) -> bytes:
+    """Serializa `obj` em bytes JSON UTF-8 (NaN/NaT → null)."""
+    if ORJSON_ENABLED and orjson is not None:
+        # orjson já escreve NaN/Infinity como null e trata escalares numpy
+        return orjson.dumps(obj, default=_default, option=_ORJSON_OPTS)
+    # registros vindos de _registros já têm os nulos resolvidos por coluna
+    return json.dumps(obj if _limpo else limpar(obj), ensure_ascii=False,
+                      separators=(",", ":"), default=_default).encode("utf-8")
+
+
+def json_response(obj: Any, status: int = 200):
+    """Response Flask com o corpo serializado por `dumps`."""
+    from flask import current_app
+    return current_app.response_class(dumps(obj), status=status, mimetype="application/json")
+
+# ------------------------ DataFrames ------------------------
+
+def _coluna(s: pd.Series) -> list:
+    """Valores da coluna como lista Python com nulos já convertidos em None."""
+    kind = s.dtype.kind if isinstance(s.dtype, np.dtype) else "O"
+    if kind in "iub":
+        return s.tolist()
+    if kind == "f":
+        arr = s.to_numpy(dtype=object)
+        arr[~np.isfinite(s.to_numpy())] = None
+        return arr.tolist()
+    if kind == "M":
+        arr = s.dt.strftime("%Y-%m-%dT%H:%M:%S").to_numpy(dtype=object)
+    else:
+        arr = s.to_numpy(dtype=object)
+    arr[pd.isna(arr)] = None
+    return arr.tolist()
+
+
+def _registros(df: pd.DataFrame, columns: Optional[Iterable[str]] = None) -> List[dict]:
+    if columns is None:
+        cols = list(df.columns)
+        valores = [_coluna(df.iloc[:, j]) for j in range(len(cols))]
+    else:
+        cols = list(columns)
+        valores = [_coluna(df[c]) for c in cols]
+    return [dict(zip(cols, linha)) for linha in zip(*valores)] if cols else [{}] * len(df)
+
+
+def records_json(df: pd.DataFrame, columns: Optional[Iterable[str]] = None) -> bytes:
+    """
+    Fatia do DataFrame → bytes de uma lista JSON de registros (orient='records'),
+    na ordem das colunas. Os nulos são resolvidos por coluna, sem passar por
+    texto intermediário.
+    """
+    return dumps(_registros(df, columns), _limpo=True)
+
+
+def ndjson_blocos(df: pd.DataFrame, tamanho: int = 500,
+                  columns: Optional[Iterable[str]] = None) -> Iterator[bytes]:
+    """Gera blocos NDJSON (cada um com até `tamanho` linhas, terminado em '\\n')."""
+    for ini in range(0, len(df), tamanho):
+        linhas = [dumps(r, _limpo=True) for r in _registros(df.iloc[ini:ini + tamanho], columns)]
+        yield b"\n".join(linhas) + b"\n"
@@ -4,9 +4,13 @@ Módulo de segurança e confiabilidade para o Challenge2025.
 Funções principais:
 - audit_log: grava eventos de auditoria (antes→depois)
 - rotate_backups: cria backups rotativos do Excel
-- ensure_columns / assign_uuids: garante colunas extras e IDs
+- ensure_columns / assign_uuids: garante colunas extras e IDs (estáveis: stable_task_uuid)
+- numero_key: normaliza o número da tarefa para comparação (5, 5.0, "5" → "5")
 - validate_row: valida domínio e tipos por linha
-- find_row: localiza índice por UUID ou Número
+- TaskIndex: índice (Projeto, Sheet, número) / task_uuid → posição da linha
+  (e posição → linha dentro da aba, para o row_hint das gravações)
+- ProjectLocator: (Sheet, número) → projetos onde a tarefa existe
+- find_row: localiza índice por UUID ou Número (O(1) se receber um TaskIndex)
 - set_runtime_refs: injeta referências a SHEETS, XLSX_PATH e save_all_sheets
 - mutating: decorador para endpoints mutadores com lock otimista + auditoria
 - restore_task_from_audit: restaura uma linha a partir do audit.jsonl
@@ -37,9 +41,11 @@ import os
 import json
 import uuid
 import shutil
+import threading
 import datetime as dt
+from collections import ChainMap
 from functools import wraps
-from typing import Any, Callable, Dict, Optional
+from typing import Any, Callable, Dict, Iterable, List, MutableMapping, Optional, Set, Tuple
 
 # ------------------------ Config e diretórios ------------------------
 DATA_DIR = os.environ.get("DATA_DIR", "data")
@@ -111,13 +117,76 @@ def ensure_columns(df, project_uuid: Optional[str] = None):
     return df
 
 
-def assign_uuids(df):
-    """Atribui UUIDs e inicializa versão quando ausentes."""
+# Namespace usado quando a linha não tem project_uuid
+TASK_UUID_NAMESPACE = uuid.uuid5(uuid.NAMESPACE_DNS, "challenge2025::task")
+
+
+def numero_key(numero: Any) -> str:
+    """Normaliza o número da tarefa (5, 5.0, "5" → "5"); vazio/NaN → ""."""
+    if numero is None:
+        return ""
+    try:
+        f = float(str(numero).strip().replace(",", "."))
+    except Exception:
+        return str(numero).strip()
+    if f != f:  # NaN
+        return ""
+    return str(int(f)) if f.is_integer() else repr(f)
+
+
+def stable_task_uuid(project_uuid: Optional[str], sheet: Any, numero: Any, ordinal: int = 0) -> str:
+    """UUID determinístico (uuid5) da tarefa a partir de projeto + aba + número.
+
+    `ordinal` diferencia linhas repetidas com o mesmo (aba, número).
+    """
+    try:
+        ns = uuid.UUID(str(project_uuid)) if project_uuid else TASK_UUID_NAMESPACE
+    except ValueError:
+        ns = uuid.uuid5(TASK_UUID_NAMESPACE, str(project_uuid))
+    key = f"{'' if sheet is None else str(sheet)}::{numero_key(numero)}"
+    if ordinal:
+        key += f"#{ordinal}"
+    return str(uuid.uuid5(ns, key))
+
+
+def assign_uuids(df, project_uuid: Optional[str] = None, sheet: Optional[str] = None):
+    """Atribui UUIDs estáveis e inicializa versão quando ausentes.
+
+    O UUID é derivado de (project_uuid, aba, número): a mesma tarefa recebe
+    o mesmo ID em toda carga, mesmo antes de a planilha ser regravada.
+    Sem número, usa a posição da linha na aba.
+    """
     if "task_uuid" not in df.columns:
         df["task_uuid"] = None
-    mask = df["task_uuid"].isna() | (df["task_uuid"].astype(str).str.len() == 0)
-    if getattr(mask, "sum", None):
-        df.loc[mask, "task_uuid"] = [str(uuid.uuid4()) for _ in range(int(mask.sum()))]
+    mask = df["task_uuid"].isna() | (df["task_uuid"].astype(str).str.strip().str.len() == 0)
+    if mask.any():
+        n = len(df)
+        col_num = "numero" if "numero" in df.columns else ("Número" if "Número" in df.columns else None)
+        numeros = df[col_num].tolist() if col_num else [None] * n
+        if sheet is not None:
+            abas = [sheet] * n
+        elif "Sheet" in df.columns:
+            abas = df["Sheet"].tolist()
+        else:
+            abas = [""] * n
+        if project_uuid:
+            projs = [project_uuid] * n
+        elif "project_uuid" in df.columns:
+            projs = [p if isinstance(p, str) and p.strip() else None for p in df["project_uuid"].tolist()]
+        else:
+            projs = [None] * n
+
+        vistos: Dict[tuple, int] = {}
+        novos = []
+        for pos, (proj, aba, num, falta) in enumerate(zip(projs, abas, numeros, mask.tolist())):
+            num_key = numero_key(num) or f"@{pos}"
+            k = (proj, str(aba), num_key)
+            ordinal = vistos.get(k, 0)
+            vistos[k] = ordinal + 1
+            if falta:
+                novos.append(stable_task_uuid(proj, aba, num_key, ordinal))
+        df["task_uuid"] = df["task_uuid"].astype(object)
+        df.loc[mask, "task_uuid"] = novos
     if "version" not in df.columns:
         df["version"] = 1
     df["version"] = df["version"].fillna(1).astype(int)
@@ -176,7 +245,177 @@ def validate_row(row: Dict[str, Any]) -> None:
 
 # ------------------------ Localização de linhas ------------------------
 
-def find_row(df, task_uuid: Optional[str] = None, numero: Optional[Any] = None):
+TaskKey = Tuple[str, str, str]
+
+
+class TaskIndex:
+    """
+    Índice das tarefas de um DataFrame → posição da linha (0-based).
+
+    - by_key:    (Projeto, Sheet, numero_key) → posição
+    - by_uuid:   task_uuid → posição
+    - by_numero: numero_key → posição (para DFs de uma aba só, sem Sheet/Projeto)
+    - by_pos:    posição → ordem da linha dentro da sua aba (1 = primeira tarefa)
+
+    Em chaves repetidas vale a primeira linha, como nas buscas por máscara.
+    `overlay()` devolve uma camada (ChainMap) sobre este índice: o que for
+    acrescentado nela não altera o índice base, que pode ficar em cache.
+    """
+
+    __slots__ = ("by_key", "by_uuid", "by_numero", "by_pos", "por_aba")
+
+    def __init__(self, by_key: Optional[MutableMapping[TaskKey, int]] = None,
+                 by_uuid: Optional[MutableMapping[str, int]] = None,
+                 by_numero: Optional[MutableMapping[str, int]] = None,
+                 by_pos: Optional[MutableMapping[int, int]] = None,
+                 por_aba: Optional[MutableMapping[Tuple[str, str], int]] = None):
+        self.by_key = {} if by_key is None else by_key
+        self.by_uuid = {} if by_uuid is None else by_uuid
+        self.by_numero = {} if by_numero is None else by_numero
+        self.by_pos = {} if by_pos is None else by_pos
+        self.por_aba = {} if por_aba is None else por_aba  # (Projeto, Sheet) → nº de linhas
+
+    @classmethod
+    def from_frame(cls, df) -> "TaskIndex":
+        idx = cls()
+        n = len(df)
+        if not n:
+            return idx
+        col_num = "numero" if "numero" in df.columns else ("Número" if "Número" in df.columns else None)
+        projs = df["Projeto"].tolist() if "Projeto" in df.columns else [""] * n
+        abas = df["Sheet"].tolist() if "Sheet" in df.columns else [""] * n
+        numeros = df[col_num].tolist() if col_num else [None] * n
+        uuids = df["task_uuid"].tolist() if "task_uuid" in df.columns else [None] * n
+        for pos, (proj, aba, num, tid) in enumerate(zip(projs, abas, numeros, uuids)):
+            idx.add(pos, proj, aba, num, tid)
+        return idx
+
+    def overlay(self) -> "TaskIndex":
+        return TaskIndex(ChainMap({}, self.by_key), ChainMap({}, self.by_uuid),
+                         ChainMap({}, self.by_numero), ChainMap({}, self.by_pos),
+                         ChainMap({}, self.por_aba))
+
+    def add(self, pos: int, projeto: Any, sheet: Any, numero: Any, task_uuid: Any = None) -> None:
+        """Registra a linha `pos` (sem sobrescrever chaves já indexadas); linhas em ordem de posição."""
+        num = numero_key(numero)
+        aba = (_str_key(projeto), _str_key(sheet))
+        self.por_aba[aba] = self.by_pos[pos] = self.por_aba.get(aba, 0) + 1
+        key = aba + (num,)
+        if key not in self.by_key:
+            self.by_key[key] = pos
+        if num not in self.by_numero:
+            self.by_numero[num] = pos
+        tid = _str_key(task_uuid)
+        if tid and tid not in self.by_uuid:
+            self.by_uuid[tid] = pos
+
+    def locate(self, sheet: Any, numero: Any, projeto: Any = "") -> Optional[int]:
+        return self.by_key.get((_str_key(projeto), _str_key(sheet), numero_key(numero)))
+
+    def locate_uuid(self, task_uuid: Any) -> Optional[int]:
+        return self.by_uuid.get(_str_key(task_uuid))
+
+    def locate_numero(self, numero: Any) -> Optional[int]:
+        return self.by_numero.get(numero_key(numero))
+
+    def row_in_sheet(self, pos: int) -> Optional[int]:
+        """Ordem (1-based) da linha `pos` dentro da sua aba; no Excel, linha = ordem + 1."""
+        return self.by_pos.get(pos)
+
+    def __len__(self) -> int:
+        return len(self.by_uuid)
+
+
+class ProjectLocator:
+    """
+    Índice global (Sheet, número) → {projetos}, alimentado pelos TaskIndex de cada projeto.
+
+    Cada projeto é registrado com um `token` (ex.: assinatura do arquivo + estado do
+    journal); `is_current` diz se o registro ainda vale, e `update` troca as chaves
+    do projeto quando o token muda. Assim só o projeto alterado é reindexado.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tokens: Dict[str, Any] = {}
+        self._chaves: Dict[str, Set[Tuple[str, str]]] = {}
+        self._por_chave: Dict[Tuple[str, str], Set[str]] = {}
+        self._por_numero: Dict[str, Set[str]] = {}
+        self.updates = 0
+
+    def is_current(self, projeto: str, token: Any) -> bool:
+        with self._lock:
+            return projeto in self._tokens and self._tokens[projeto] == token
+
+    def update(self, projeto: str, token: Any, indice: Optional[TaskIndex]) -> None:
+        chaves = {(aba, num) for (_, aba, num) in indice.by_key} if indice is not None else set()
+        with self._lock:
+            self._remove_locked(projeto)
+            for k in chaves:
+                self._por_chave.setdefault(k, set()).add(projeto)
+                self._por_numero.setdefault(k[1], set()).add(projeto)
+            self._chaves[projeto] = chaves
+            self._tokens[projeto] = token
+            self.updates += 1
+
+    def retain(self, projetos: Iterable[str]) -> None:
+        """Esquece projetos que não existem mais."""
+        manter = set(projetos)
+        with self._lock:
+            for p in [p for p in self._tokens if p not in manter]:
+                self._remove_locked(p)
+
+    def _remove_locked(self, projeto: str) -> None:
+        for k in self._chaves.pop(projeto, ()):
+            for mapa, chave in ((self._por_chave, k), (self._por_numero, k[1])):
+                donos = mapa.get(chave)
+                if donos is not None:
+                    donos.discard(projeto)
+                    if not donos:
+                        del mapa[chave]
+        self._tokens.pop(projeto, None)
+
+    def locate(self, numero: Any, sheet: Any = None) -> List[str]:
+        """Projetos com a tarefa `numero` na aba `sheet` (qualquer aba se sheet=None)."""
+        num = numero_key(numero)
+        with self._lock:
+            if sheet:
+                return sorted(self._por_chave.get((_str_key(sheet), num), ()))
+            return sorted(self._por_numero.get(num, ()))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"projects": len(self._tokens), "keys": len(self._por_chave), "updates": self.updates}
+
+
+def _str_key(v: Any) -> str:
+    if v is None or (isinstance(v, float) and v != v):
+        return ""
+    return str(v)
+
+
+def _confere(df, pos: int, task_uuid: Optional[str], numero: Optional[Any]) -> bool:
+    """A linha `pos` ainda é a tarefa procurada (o índice pode estar defasado)?"""
+    if not 0 <= pos < len(df):
+        return False
+    if task_uuid and "task_uuid" in df.columns and str(df["task_uuid"].iat[pos]) == str(task_uuid):
+        return True
+    col = "numero" if "numero" in df.columns else ("Número" if "Número" in df.columns else None)
+    return numero is not None and col is not None and numero_key(df[col].iat[pos]) == numero_key(numero)
+
+
+def find_row(df, task_uuid: Optional[str] = None, numero: Optional[Any] = None,
+             index: Optional[TaskIndex] = None):
+    """
+    Rótulo da linha por task_uuid (prioridade) ou número. Com `index`, a posição
+    vem do índice e só é conferida na própria linha; a varredura fica para
+    quando o índice não acha a tarefa (ou aponta para outra linha).
+    """
+    if index is not None:
+        for pos in (index.locate_uuid(task_uuid) if task_uuid else None,
+                    index.locate_numero(numero) if numero is not None else None):
+            if pos is not None and _confere(df, pos, task_uuid, numero):
+                return df.index[pos]
     if task_uuid:
         m = df["task_uuid"].astype(str) == str(task_uuid)
         if m.any():
@@ -198,6 +437,20 @@ def set_runtime_refs(sheets: Dict[str, Any], xlsx_path: str, save_all_sheets_cb:
     _SHEETS = sheets
     _XLSX_PATH = xlsx_path
     _save_all_sheets = save_all_sheets_cb
+    _INDICES_ABAS.clear()
+
+
+# TaskIndex de cada aba de _SHEETS: (id do DF, nº de linhas, índice); refeito
+# quando a aba é trocada por outro DataFrame ou ganha/perde linhas
+_INDICES_ABAS: Dict[str, Tuple[int, int, TaskIndex]] = {}
+
+
+def _indice_aba(sheet: str, df) -> TaskIndex:
+    atual = _INDICES_ABAS.get(sheet)
+    if atual is None or atual[0] != id(df) or atual[1] != len(df):
+        atual = (id(df), len(df), TaskIndex.from_frame(df))
+        _INDICES_ABAS[sheet] = atual
+    return atual[2]
 
 # ------------------------ Decorador de mutação ------------------------
 
@@ -236,9 +489,9 @@ def mutating(action_name: str) -> Callable:
 
             df = _SHEETS[sheet]
             ensure_columns(df)
-            assign_uuids(df)
+            assign_uuids(df, sheet=sheet)
 
-            idx = find_row(df, task_uuid=task_uuid, numero=numero)
+            idx = find_row(df, task_uuid=task_uuid, numero=numero, index=_indice_aba(sheet, df))
             if idx is None:
                 return {"ok": False, "error": "task_not_found"}, 404
 
@@ -319,8 +572,8 @@ def restore_task_from_audit(task_uuid: str, sheet: str, operator: str = "system"
 
     df = _SHEETS[sheet]
     ensure_columns(df)
-    assign_uuids(df)
-    idx = find_row(df, task_uuid=task_uuid, numero=last_before.get("Número"))
+    assign_uuids(df, sheet=sheet)
+    idx = find_row(df, task_uuid=task_uuid, numero=last_before.get("Número"), index=_indice_aba(sheet, df))
     if idx is None:
         return {"ok": False, "error": "task_not_found"}, 404
 